@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import queue
+import random
+import logging
+import logging.handlers
+from metrics import route_of
+
+# --- Access log terstruktur ---
+# Satu record JSON per request (client, method, path, status, bytes, ms).
+# Thread request hanya menaruh record mentah (dict) di antrean; format JSON
+# dan tulis ke stream dikerjakan thread QueueListener, jadi thread request
+# tidak pernah menunggu lock handler atau I/O. Record juga disaring dulu
+# (level, sampling, batas per endpoint) sebelum dict-nya dibuat.
+ACCESS_LOG_LEVEL = os.environ.get('ACCESS_LOG_LEVEL', 'INFO').upper() # WARNING = access log mati
+ACCESS_LOG_FILE = os.environ.get('ACCESS_LOG_FILE', '')               # '' = stderr
+ACCESS_LOG_SAMPLE = float(os.environ.get('ACCESS_LOG_SAMPLE', 1.0))   # fraksi request yang dicatat
+ACCESS_LOG_RATE = int(os.environ.get('ACCESS_LOG_RATE', 50))          # record maksimum per endpoint per detik, 0 = tanpa batas
+ACCESS_LOG_BODIES = os.environ.get('ACCESS_LOG_BODIES', '') == '1'    # ikut catat body request (opt-in)
+MAX_LOGGED_BODY = 512
+
+logger = logging.getLogger('access')
+logger.propagate = False
+logger.setLevel(ACCESS_LOG_LEVEL)
+
+_listener = None
+_listener_pid = None
+_windows = {} # {endpoint: [detik, jumlah record, jumlah yang dibuang]}
+
+
+# Tanpa format di thread pemanggil: record (msg berupa dict) diteruskan apa adanya
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = record.msg if isinstance(record.msg, dict) else {'message': record.getMessage()}
+        return json.dumps(data, ensure_ascii=False)
+
+
+# Pasang antrean + thread penulis. Dipanggil sekali per proses (worker hasil
+# fork memanggilnya lagi karena thread listener tidak ikut ter-fork).
+def setup():
+    global _listener, _listener_pid
+    if _listener_pid == os.getpid() or not logger.isEnabledFor(logging.INFO):
+        return
+    if ACCESS_LOG_FILE:
+        target = logging.FileHandler(ACCESS_LOG_FILE)
+    else:
+        target = logging.StreamHandler()
+    target.setFormatter(JsonFormatter())
+    records = queue.SimpleQueue()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(_QueueHandler(records))
+    _listener = logging.handlers.QueueListener(records, target)
+    _listener.start()
+    _listener_pid = os.getpid()
+
+
+# Batas per endpoint (metrics.route_of) per detik. Counter diubah tanpa lock: balapan antar
+# thread paling-paling meloloskan satu-dua record lebih, tidak merusak apa pun.
+def _admit(endpoint):
+    if ACCESS_LOG_SAMPLE < 1.0 and random.random() >= ACCESS_LOG_SAMPLE:
+        return None
+    if not ACCESS_LOG_RATE:
+        return 0
+    now = int(time.monotonic())
+    window = _windows.get(endpoint)
+    if window is None or window[0] != now:
+        dropped = window[2] if window else 0
+        _windows[endpoint] = [now, 1, 0]
+        return dropped
+    if window[1] >= ACCESS_LOG_RATE:
+        window[2] += 1
+        return None
+    window[1] += 1
+    return 0
+
+
+# Catat satu request yang sudah dibalas. `started` dari time.perf_counter()
+# saat request mulai diproses.
+def log_request(address, request, response, started):
+    if _listener is None or not logger.isEnabledFor(logging.INFO):
+        return
+    endpoint = route_of(request.target)
+    dropped = _admit(endpoint)
+    if dropped is None:
+        return
+    record = {
+        'ts': round(time.time(), 3),
+        'client': address[0] if isinstance(address, tuple) else address,
+        'method': request.method,
+        'path': request.target,
+        'status': int(response[9:12]) if response[9:12].isdigit() else 0,
+        'bytes': len(response),
+        'ms': round((time.perf_counter() - started) * 1000, 2),
+    }
+    if dropped:
+        record['suppressed'] = dropped # record endpoint ini yang dibuang pada detik sebelumnya
+    if ACCESS_LOG_BODIES and request.body:
+        record['body'] = request.body[:MAX_LOGGED_BODY].decode('utf-8', 'replace')
+    logger.info(record)
@@ -0,0 +1,94 @@
+import os
+import json
+import logging
+import pygame
+
+# --- Asset manager klien ---
+# Setiap gambar dimuat sekali, di-scale ke ukuran akhirnya dan di-convert ke
+# format pixel display (convert / convert_alpha) sehingga blit per frame tidak
+# perlu konversi lagi. Hasil decode + scale bisa disimpan di ASSET_CACHE_DIR
+# sebagai pixel mentah: start berikutnya cukup membaca file tanpa decode
+# PNG/JPG dan tanpa scaling. Cache otomatis dibuat ulang jika file sumber berubah.
+ASSET_DIR = "asset"
+ASSET_CACHE_DIR = os.environ.get('ASSET_CACHE_DIR', '.asset_cache') # '' = cache disk dimatikan
+
+# pygame >= 2.1.3 memakai tobytes/frombytes, versi lama tostring/fromstring
+_to_bytes = getattr(pygame.image, 'tobytes', None) or pygame.image.tostring
+_from_bytes = getattr(pygame.image, 'frombytes', None) or pygame.image.fromstring
+
+
+class AssetManager:
+    def __init__(self, asset_dir=ASSET_DIR, cache_dir=ASSET_CACHE_DIR):
+        self.asset_dir = asset_dir
+        self.cache_dir = cache_dir
+        self.images = {} # {(nama, ukuran, alpha): Surface atau None}
+        self.fonts = {}  # {(nama, ukuran, bold): Font}
+
+    # Surface siap blit, atau None jika file tidak ada/rusak (pemanggil pakai fallback).
+    # Harus dipanggil setelah pygame.display.set_mode.
+    def image(self, name, size=None, alpha=False):
+        key = (name, size, alpha)
+        if key not in self.images:
+            self.images[key] = self._load_image(name, size, alpha)
+        return self.images[key]
+
+    # Font dari file asset, fallback ke font sistem
+    def font(self, name, size, bold=False):
+        key = (name, size, bold)
+        if key not in self.fonts:
+            try:
+                self.fonts[key] = pygame.font.Font(os.path.join(self.asset_dir, name), size)
+            except (OSError, pygame.error):
+                self.fonts[key] = pygame.font.SysFont(None, size, bold=bold)
+        return self.fonts[key]
+
+    def _load_image(self, name, size, alpha):
+        path = os.path.join(self.asset_dir, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        fmt = 'RGBA' if alpha else 'RGB'
+        source = [stat.st_mtime_ns, stat.st_size]
+        cache_path = self._cache_path(name, size, fmt)
+
+        surf = self._read_cache(cache_path, source, fmt) if cache_path else None
+        if surf is None:
+            try:
+                surf = pygame.image.load(path)
+            except pygame.error as e:
+                logging.warning(f"Gagal memuat asset {name}: {e}")
+                return None
+            if size and surf.get_size() != size:
+                surf = pygame.transform.scale(surf, size)
+            if cache_path:
+                self._write_cache(cache_path, source, fmt, surf)
+        return surf.convert_alpha() if alpha else surf.convert()
+
+    def _cache_path(self, name, size, fmt):
+        if not self.cache_dir:
+            return None
+        w, h = size or (0, 0)
+        return os.path.join(self.cache_dir, f"{name}.{w}x{h}.{fmt}.raw")
+
+    # Format file cache: satu baris header JSON lalu pixel mentah
+    def _read_cache(self, cache_path, source, fmt):
+        try:
+            with open(cache_path, 'rb') as f:
+                header = json.loads(f.readline())
+                if header['source'] != source:
+                    return None
+                return _from_bytes(f.read(), tuple(header['size']), fmt)
+        except (OSError, ValueError, KeyError, pygame.error):
+            return None
+
+    def _write_cache(self, cache_path, source, fmt, surf):
+        header = json.dumps({'source': source, 'size': surf.get_size()}).encode('utf-8')
+        tmp = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp, 'wb') as f:
+                f.write(header + b'\n' + _to_bytes(surf, fmt))
+            os.replace(tmp, cache_path)
+        except OSError as e:
+            logging.warning(f"Cache asset tidak bisa ditulis ({cache_path}): {e}")
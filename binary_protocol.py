@@ -0,0 +1,189 @@
+import os
+import socket
+import struct
+from board import marks_from_cells, DENSE_MARKS_MAX_GRID
+from game_config import GameConfig, DEFAULT_CONFIG, PLAYER_IDS as PLAYERS, PHASES
+
+# Protokol biner ringkas di atas satu koneksi TCP persisten, alternatif
+# untuk JSON over HTTP. Setiap frame: tipe (uint8) + panjang payload
+# (uint32) + payload. Aksi dikirim sebagai struct ukuran tetap dan state
+# dikirim sebagai snapshot papan yang di-pack (tanpa JSON dan header HTTP).
+BINARY_PORT = int(os.environ.get('BINARY_PORT', 8890)) # 0 = protokol biner dimatikan
+MAX_FRAME_SIZE = 1024 * 1024
+NO_VERSION = 0xFFFFFFFF # MSG_STATE tanpa `since`: selalu kirim snapshot
+
+FRAME_HEADER = struct.Struct('<BI')
+
+# Klien -> server
+MSG_JOIN = 1      # payload kosong (konfigurasi default) atau CONFIG
+MSG_PLACE = 2     # PLACE
+MSG_ACTION = 3    # ACTION
+MSG_STATE = 4     # STATE_REQUEST
+# Server -> klien
+MSG_JOINED = 129       # JOINED + CONFIG
+MSG_RESULT = 130       # uint8 sukses + pesan utf-8
+MSG_SNAPSHOT = 131     # SNAPSHOT_HEADER + treasure + sel + pesan utf-8
+MSG_NOT_MODIFIED = 132 # uint32 version
+MSG_ERROR = 133        # uint16 kode + pesan utf-8
+
+CONFIG = struct.Struct('<HBBH')           # grid_size, treasure_size, treasure_count, starting_hp
+JOINED = struct.Struct('<IB')             # match_no, pemain
+PLACE = struct.Struct('<IBHH')            # match_no, pemain, y, x
+ACTION = struct.Struct('<IBBHHB')         # match_no, pemain, aksi, y, x, nomor treasure
+STATE_REQUEST = struct.Struct('<IBII')    # match_no, pemain, since, timeout (ms)
+RESULT = struct.Struct('<B')
+NOT_MODIFIED = struct.Struct('<I')
+ERROR = struct.Struct('<H')
+# match_no, version, pemain, fase, hp saya, hp lawan, giliran, pemenang,
+# konfigurasi (CONFIG), jumlah treasure, jumlah sel galian
+SNAPSHOT_HEADER = struct.Struct('<IIBBHHBBHBBHHI')
+
+ACTIONS = ('dig', 'move')
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encode_frame(msg_type, payload=b''):
+    return FRAME_HEADER.pack(msg_type, len(payload)) + payload
+
+
+# Parser frame inkremental, pola yang sama dengan http_parser.RequestParser
+class FrameParser:
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+
+    # Mengembalikan (tipe, payload) berikutnya yang sudah lengkap, atau None
+    def next_frame(self):
+        if len(self.buffer) < FRAME_HEADER.size:
+            return None
+        msg_type, length = FRAME_HEADER.unpack_from(self.buffer)
+        if length > MAX_FRAME_SIZE:
+            raise ProtocolError('Frame terlalu besar')
+        end = FRAME_HEADER.size + length
+        if len(self.buffer) < end:
+            return None
+        payload = bytes(self.buffer[FRAME_HEADER.size:end])
+        del self.buffer[:end]
+        return msg_type, payload
+
+
+def encode_config(config):
+    return CONFIG.pack(*config)
+
+def decode_config(payload):
+    if not payload:
+        return DEFAULT_CONFIG
+    return GameConfig(*CONFIG.unpack_from(payload))
+
+
+# Sel galian di-pack sebagai uint32 (indeks sel << 1 | hit)
+def pack_state(state):
+    grid = state['grid_size']
+    treasures = state['my_treasures']
+    cells = [(y * grid + x) << 1 | (mark == 'hit') for y, x, mark in state['my_dig_cells']]
+    message = state['action_message'].encode('utf-8')
+    winner = state['winner']
+    header = SNAPSHOT_HEADER.pack(
+        int(state['match_id']), state['version'], PLAYERS.index(state['player_id']),
+        PHASES.index(state['game_phase']), state['my_hp'], state['opponent_hp'],
+        PLAYERS.index(state['turn']), PLAYERS.index(winner) + 1 if winner else 0,
+        grid, state['treasure_size'], state['treasure_count'], state['starting_hp'],
+        len(treasures), len(cells))
+    flat = [v for pos in treasures for v in pos]
+    return b''.join((header, struct.pack(f'<{len(flat)}H', *flat), struct.pack(f'<{len(cells)}I', *cells), message))
+
+
+# Kebalikan pack_state: dict dengan field yang sama seperti response JSON /state
+def unpack_state(payload):
+    (match_no, version, player, phase, my_hp, opp_hp, turn, winner,
+     grid, size, count, starting_hp, n_treasures, n_cells) = SNAPSHOT_HEADER.unpack_from(payload)
+    offset = SNAPSHOT_HEADER.size
+    flat = struct.unpack_from(f'<{2 * n_treasures}H', payload, offset)
+    offset += 4 * n_treasures
+    packed = struct.unpack_from(f'<{n_cells}I', payload, offset)
+    offset += 4 * n_cells
+    treasures = [(flat[i], flat[i + 1]) for i in range(0, len(flat), 2)]
+    cells = [[(c >> 1) // grid, (c >> 1) % grid, 'hit' if c & 1 else 'miss'] for c in packed]
+    state = {
+        "player_id": PLAYERS[player],
+        "match_id": str(match_no),
+        "version": version,
+        "game_phase": PHASES[phase],
+        "my_hp": my_hp,
+        "opponent_hp": opp_hp,
+        "my_treasure_pos": treasures[0] if treasures else None,
+        "my_treasures": treasures,
+        "my_dig_cells": cells,
+        "turn": PLAYERS[turn],
+        "winner": PLAYERS[winner - 1] if winner else None,
+        "action_message": payload[offset:].decode('utf-8'),
+        "grid_size": grid,
+        "treasure_size": size,
+        "treasure_count": count,
+        "starting_hp": starting_hp
+    }
+    if grid <= DENSE_MARKS_MAX_GRID:
+        state["my_dig_marks"] = marks_from_cells(cells, grid)
+    return state
+
+
+# Klien sinkron untuk satu koneksi biner. Satu request, satu response, jadi
+# thread yang berbeda (mis. long-poll dan aksi) sebaiknya memakai koneksi sendiri.
+class BinaryClient:
+    def __init__(self, host, port=BINARY_PORT, timeout=None):
+        self.host = host
+        self.port = port
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.parser = FrameParser()
+
+    def request(self, msg_type, payload=b''):
+        self.sock.sendall(encode_frame(msg_type, payload))
+        while True:
+            frame = self.parser.next_frame()
+            if frame is not None:
+                return frame
+            data = self.sock.recv(65536)
+            if not data:
+                raise ConnectionError('Koneksi biner ditutup server')
+            self.parser.feed(data)
+
+    # Mengembalikan (player_id, match_id, GameConfig) atau (None, None, None)
+    def join(self, config=None):
+        msg_type, payload = self.request(MSG_JOIN, encode_config(config) if config else b'')
+        if msg_type != MSG_JOINED:
+            return None, None, None
+        match_no, player = JOINED.unpack_from(payload)
+        return PLAYERS[player], str(match_no), decode_config(payload[JOINED.size:])
+
+    def place(self, match_id, player_id, y, x):
+        return self._result(self.request(MSG_PLACE, PLACE.pack(int(match_id), PLAYERS.index(player_id), y, x)))
+
+    def action(self, match_id, player_id, action_type, y, x, treasure=0):
+        payload = ACTION.pack(int(match_id), PLAYERS.index(player_id), ACTIONS.index(action_type), y, x, treasure)
+        return self._result(self.request(MSG_ACTION, payload))
+
+    # State penuh, atau None jika version masih sama dengan `since` sampai timeout
+    def state(self, match_id, player_id, since=None, timeout=0):
+        payload = STATE_REQUEST.pack(int(match_id), PLAYERS.index(player_id),
+                                     NO_VERSION if since is None else since, int(timeout * 1000))
+        msg_type, payload = self.request(MSG_STATE, payload)
+        if msg_type == MSG_SNAPSHOT:
+            return unpack_state(payload)
+        if msg_type == MSG_NOT_MODIFIED:
+            return None
+        raise ProtocolError(payload[ERROR.size:].decode('utf-8', 'replace'))
+
+    def _result(self, frame):
+        msg_type, payload = frame
+        if msg_type == MSG_RESULT:
+            return {"success": bool(payload[0]), "message": payload[RESULT.size:].decode('utf-8')}
+        return {"success": False, "message": payload[ERROR.size:].decode('utf-8', 'replace')}
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,136 @@
+from game_config import GRID_SIZE, TREASURE_SIZE
+
+# --- Engine papan ---
+# Sel (y, x) diberi indeks y * grid + x. Papan kecil menyimpan dig mark sebagai
+# bitmask integer; di atas BITBOARD_MAX_CELLS operasi integer ikut membesar
+# sesuai ukuran papan, jadi mark disimpan sparse (dict indeks -> mark) dan
+# biaya per aksi hanya bergantung pada jumlah mark, bukan luas papan.
+BITBOARD_MAX_CELLS = 1024  # sampai 32x32
+DENSE_MARKS_MAX_GRID = 16  # matriks my_dig_marks hanya dikirim untuk grid sekecil ini
+
+
+def cell_bit(y, x, grid=GRID_SIZE):
+    return 1 << (y * grid + x)
+
+def treasure_mask(y, x, size=TREASURE_SIZE, grid=GRID_SIZE):
+    row = ((1 << size) - 1) << x
+    mask = 0
+    for dy in range(size):
+        mask |= row << ((y + dy) * grid)
+    return mask
+
+# Indeks bit yang menyala, dari yang terkecil
+def mask_cells(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+def cells_from_masks(hit, miss, grid=GRID_SIZE):
+    cells = [[idx // grid, idx % grid, 'hit'] for idx in mask_cells(hit)]
+    cells.extend([idx // grid, idx % grid, 'miss'] for idx in mask_cells(miss))
+    return cells
+
+# Matriks None/'hit'/'miss' untuk format response lama (my_dig_marks)
+def marks_from_cells(cells, grid):
+    marks = [[None] * grid for _ in range(grid)]
+    for y, x, mark in cells:
+        marks[y][x] = mark
+    return marks
+
+
+class BitMarks:
+    __slots__ = ('grid', 'hit_mask', 'miss_mask')
+
+    def __init__(self, grid):
+        self.grid = grid
+        self.hit_mask = 0
+        self.miss_mask = 0
+
+    def mark(self, y, x, hit):
+        bit = cell_bit(y, x, self.grid)
+        if hit:
+            self.hit_mask |= bit
+            self.miss_mask &= ~bit
+        else:
+            self.miss_mask |= bit
+            self.hit_mask &= ~bit
+
+    def clear(self):
+        self.hit_mask = self.miss_mask = 0
+
+    def cells(self):
+        return cells_from_masks(self.hit_mask, self.miss_mask, self.grid)
+
+    def masks(self):
+        return self.hit_mask, self.miss_mask
+
+
+class SparseMarks:
+    __slots__ = ('grid', 'marks')
+
+    def __init__(self, grid):
+        self.grid = grid
+        self.marks = {} # {indeks sel: 'hit' / 'miss'}
+
+    def mark(self, y, x, hit):
+        self.marks[y * self.grid + x] = 'hit' if hit else 'miss'
+
+    def clear(self):
+        self.marks = {}
+
+    def cells(self):
+        g = self.grid
+        return [[idx // g, idx % g, mark] for idx, mark in self.marks.items()]
+
+    def masks(self):
+        return None
+
+
+def new_marks(grid):
+    return BitMarks(grid) if grid * grid <= BITBOARD_MAX_CELLS else SparseMarks(grid)
+
+
+# Treasure milik satu pemain. `cells` memetakan indeks sel ke nomor treasure
+# sehingga cek galian O(1) berapa pun ukuran papan dan jumlah treasure.
+class Treasures:
+    __slots__ = ('grid', 'size', 'positions', 'cells')
+
+    def __init__(self, grid, size):
+        self.grid = grid
+        self.size = size
+        self.positions = []
+        self.cells = {}
+
+    def _footprint(self, y, x):
+        for dy in range(self.size):
+            row = (y + dy) * self.grid + x
+            for dx in range(self.size):
+                yield row + dx
+
+    def fits(self, y, x, ignore=None):
+        if not (0 <= y <= self.grid - self.size and 0 <= x <= self.grid - self.size):
+            return False
+        return all(self.cells.get(idx, ignore) == ignore for idx in self._footprint(y, x))
+
+    def place(self, y, x):
+        if not self.fits(y, x):
+            return False
+        number = len(self.positions)
+        self.positions.append((y, x))
+        for idx in self._footprint(y, x):
+            self.cells[idx] = number
+        return True
+
+    def move(self, number, y, x):
+        if not 0 <= number < len(self.positions) or not self.fits(y, x, ignore=number):
+            return False
+        for idx in self._footprint(*self.positions[number]):
+            del self.cells[idx]
+        self.positions[number] = (y, x)
+        for idx in self._footprint(y, x):
+            self.cells[idx] = number
+        return True
+
+    def owner(self, y, x):
+        return self.cells.get(y * self.grid + x)
@@ -5,9 +5,23 @@ import pygame
 import sys
 import requests
 import time
+import threading
+from urllib.parse import urlsplit
+from binary_protocol import BinaryClient, ProtocolError
+from websocket import WebSocketClient, WebSocketError
+from assets import AssetManager
 
 # --- Konfigurasi Klien ---
 SERVER_URL = ""
+LONG_POLL_TIMEOUT = 25 # detik server menahan /state?since=N sebelum membalas 304
+POLL_INTERVAL = 0.1    # jeda polling jika server tidak mendukung long-poll
+REQUEST_TIMEOUT = 5    # detik maksimum join/aksi HTTP
+JOIN_RETRY_DELAY = 5   # detik sebelum mencoba join lagi
+DISCONNECT_NOTICE = 2  # detik pesan "koneksi terputus" ditampilkan sebelum keluar
+FPS = 30
+# 'http' (JSON), 'binary' (framing biner di koneksi TCP persisten, lebih hemat latency/bandwidth)
+# atau 'websocket' (satu socket full-duplex, server mem-push perubahan state)
+CLIENT_PROTOCOL = os.environ.get('CLIENT_PROTOCOL', 'http').strip().lower()
 
 # --- Auto‐allocate session file A/B dengan lock sederhana ---
 def allocate_session_file():
@@ -46,9 +60,9 @@ def load_session():
         return data.get('player_id'), data.get('session_token')
     return None, None
 
-def save_session(pid, token):
+def save_session(pid, token, match_id=None):
     with open(SESSION_FILE, 'w') as f:
-        json.dump({'player_id': pid, 'session_token': token}, f)
+        json.dump({'player_id': pid, 'session_token': token, 'match_id': match_id}, f)
 
 # --- Pygame setup ---
 WINDOW_W, WINDOW_H = 1280, 800
@@ -86,22 +100,50 @@ font_lg = pygame.font.SysFont(None, 56)
 font_xl = pygame.font.SysFont(None, 72)
 clock   = pygame.time.Clock()
 
-# Load background dan treasure image
-try:
-    ARENA_BG = pygame.image.load("asset/arena_bg2.png")
-    ARENA_BG = pygame.transform.scale(ARENA_BG, (WINDOW_W, WINDOW_H))
-except:
-    ARENA_BG = None  # fallback: bg warna polos
-
-try:
-    TREASURE_IMG = pygame.image.load("asset/treasure.png")
-    TREASURE_IMG = pygame.transform.scale(TREASURE_IMG, (CELL_SIZE - 10, CELL_SIZE - 10))
-except:
-    TREASURE_IMG = None  # fallback: warna hijau
+# Semua asset dimuat sekali saat start: sudah di-convert ke format display
+# dan di-scale ke ukuran akhir (lihat assets.py). None = pakai fallback warna.
+ASSETS = AssetManager()
+ARENA_BG = ASSETS.image("arena_bg2.png", (WINDOW_W, WINDOW_H))
+TREASURE_IMG = ASSETS.image("treasure.png", (CELL_SIZE - 10, CELL_SIZE - 10), alpha=True)
+MENU_BG = ASSETS.image("Main_menu.jpg", (WINDOW_W, WINDOW_H))
+font_title = ASSETS.font("MightySouly-lxggD.ttf", 96, bold=True)
+font_button = ASSETS.font("rimouski sb.otf", 48)
 
 
 # --- Server communication ---
+MATCH_ID = None # room/match tempat pemain ini bergabung, diisi oleh join_game
+BINARY = None   # BinaryClient untuk join/aksi jika mode biner aktif
+# Session dengan pool koneksi keep-alive untuk join/aksi. Hanya dipakai dari
+# satu thread pada satu waktu (join di BackgroundCall, aksi di NetworkWorker);
+# long-poll punya Session sendiri di StatePoller.
+HTTP = requests.Session()
+WS = None       # WebSocketPoller aktif; aksi dikirim lewat socket yang sama
+
+# Tanyakan port protokol biner ke server lewat GET /protocol. Mengembalikan
+# None (tetap memakai HTTP) jika server tidak mendukung atau tidak bisa dihubungi.
+def connect_binary():
+    try:
+        res = HTTP.get(f"{SERVER_URL}/protocol", timeout=REQUEST_TIMEOUT)
+        port = res.json().get('binary_port') if res.status_code == 200 else None
+        if not port:
+            return None
+        return BinaryClient(urlsplit(SERVER_URL).hostname, port)
+    except (requests.exceptions.RequestException, ValueError, OSError):
+        return None
+
 def join_game():
+    global MATCH_ID, BINARY
+    if CLIENT_PROTOCOL == 'binary' and BINARY is None:
+        BINARY = connect_binary()
+        if BINARY is None:
+            print("Protokol biner tidak tersedia, memakai HTTP.")
+    if BINARY is not None:
+        try:
+            pid, MATCH_ID, _ = BINARY.join()
+        except (OSError, ProtocolError):
+            return None
+        return pid
+
     prev_id, prev_token = load_session()
     payload = {}
     if prev_id and prev_token:
@@ -109,38 +151,315 @@ def join_game():
 
     try:
         if payload:
-            res = requests.post(f"{SERVER_URL}/join", json=payload)
+            res = HTTP.post(f"{SERVER_URL}/join", json=payload, timeout=REQUEST_TIMEOUT)
         else:
-            res = requests.post(f"{SERVER_URL}/join")
-    except requests.exceptions.ConnectionError:
+            res = HTTP.post(f"{SERVER_URL}/join", timeout=REQUEST_TIMEOUT)
+    except requests.exceptions.RequestException:
         return None
 
     if res.status_code == 200:
         data = res.json()
         pid   = data.get('player_id')
         token = data.get('session_token')
-        save_session(pid, token)
+        MATCH_ID = data.get('match_id')
+        save_session(pid, token, MATCH_ID)
         return pid
     return None
 
-def get_game_state(pid):
-    try:
-        res = requests.get(f"{SERVER_URL}/state?player_id={pid}")
-        return res.json() if res.status_code == 200 else None
-    except requests.exceptions.ConnectionError:
-        return None
-
-def send_placement(pid, y, x):
+# Terapkan response delta (/state?since=N) ke state lengkap terakhir.
+# Mengembalikan state baru; state lama tidak diubah karena masih bisa dibaca render loop.
+def apply_state_delta(state, delta):
+    new_state = dict(state)
+    new_state.update(delta['changes'])
+    if delta['dig_cells']:
+        cells = {(y, x): mark for y, x, mark in state['my_dig_cells']}
+        for y, x, mark in delta['dig_cells']:
+            if mark is None:
+                cells.pop((y, x), None)
+            else:
+                cells[(y, x)] = mark
+        new_state['my_dig_cells'] = [[y, x, mark] for (y, x), mark in cells.items()]
+        # Matriks hanya dikirim server untuk papan kecil
+        if 'my_dig_marks' in state:
+            marks = [row[:] for row in state['my_dig_marks']]
+            for y, x, mark in delta['dig_cells']:
+                marks[y][x] = mark
+            new_state['my_dig_marks'] = marks
+    new_state['version'] = delta['version']
+    return new_state
+
+# --- Prediksi di klien ---
+PREDICTION_TIMEOUT = 5 # detik prediksi tanpa jawaban server dibatalkan
+
+# Terapkan aksi sendiri ke salinan state dengan aturan perform_action di
+# server. Hasil galian belum diketahui (posisi treasure lawan rahasia),
+# jadi selnya ditandai 'pending' sampai state dari server datang.
+def predict_state(state, kind, y, x):
+    new_state = dict(state)
+    pid = state['player_id']
+    opponent = 'B' if pid == 'A' else 'A'
+    if kind == 'place':
+        new_state['my_treasures'] = list(state['my_treasures']) + [(y, x)]
+        new_state['my_treasure_pos'] = new_state['my_treasures'][0]
+        new_state['action_message'] = "Menempatkan harta..."
+        return new_state
+
+    new_state['turn'] = opponent
+    if kind == 'move':
+        new_state['my_treasures'] = [(y, x)] + list(state['my_treasures'][1:])
+        new_state['my_treasure_pos'] = (y, x)
+        new_state['action_message'] = f"Pemain {pid} memindahkan hartanya. Giliran Pemain {opponent}."
+    elif kind == 'dig':
+        new_state['my_dig_cells'] = list(state['my_dig_cells']) + [[y, x, 'pending']]
+        if 'my_dig_marks' in state:
+            marks = [row[:] for row in state['my_dig_marks']]
+            marks[y][x] = marks[y][x] or 'pending'
+            new_state['my_dig_marks'] = marks
+        new_state['action_message'] = "Menggali..."
+    return new_state
+
+# Aksi yang sudah ditampilkan tetapi belum dikonfirmasi server, diberi nomor
+# urut (seq). Setiap frame prediksi yang tersisa diterapkan ulang di atas
+# state terbaru dari server; prediksi dibuang saat state server sudah
+# memuatnya (version >= version di jawaban aksi) atau di-rollback saat
+# aksi ditolak.
+class Predictor:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next_seq = 1
+        self.pending = {} # {seq: prediksi}, urut sesuai seq
+
+    def add(self, state, kind, y, x):
+        with self.lock:
+            seq = self.next_seq
+            self.next_seq += 1
+            self.pending[seq] = {'kind': kind, 'y': y, 'x': x, 'base': state['version'],
+                                 'ack': None, 'sent_at': time.monotonic()}
+            return seq
+
+    # Dipanggil dari thread jaringan dengan body hasil aksi (None jika gagal terkirim)
+    def acknowledge(self, seq, result):
+        with self.lock:
+            prediction = self.pending.get(seq)
+            if prediction is None:
+                return
+            if result and result.get('success'):
+                prediction['ack'] = result.get('version', prediction['base'] + 1)
+            else:
+                del self.pending[seq] # rollback: state server dipakai apa adanya
+
+    def view(self, state):
+        if not self.pending:
+            return state
+        now = time.monotonic()
+        with self.lock:
+            for seq, p in list(self.pending.items()):
+                confirmed = p['ack'] is not None and state['version'] >= p['ack']
+                if confirmed or state['version'] < p['base'] or now - p['sent_at'] > PREDICTION_TIMEOUT:
+                    del self.pending[seq]
+            predictions = list(self.pending.values())
+        for p in predictions:
+            state = predict_state(state, p['kind'], p['y'], p['x'])
+        return state
+
+PREDICTOR = Predictor()
+
+# Thread latar yang mengikuti state lewat long-poll /state?since=N sehingga
+# render loop tidak lagi mengirim GET di setiap frame. Render loop cukup
+# membaca `latest`: slot ini hanya diganti dengan satu assignment referensi
+# ke state baru (state lama tidak pernah diubah), jadi aman dibaca tanpa lock.
+# State awal juga diambil di thread ini, bukan di render loop.
+class StatePoller(threading.Thread):
+    def __init__(self, pid, initial_state=None):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.latest = initial_state
+        self.connected = True
+        self.running = True
+        self.session = requests.Session()
+
+    def run(self):
+        if BINARY is not None:
+            self.run_binary()
+            return
+        version = self.latest.get('version') if self.latest else None
+        while self.running:
+            params = {'player_id': self.pid, 'match_id': MATCH_ID}
+            if version is not None:
+                params['since'] = version
+                params['timeout'] = LONG_POLL_TIMEOUT
+            try:
+                res = self.session.get(f"{SERVER_URL}/state", params=params, timeout=LONG_POLL_TIMEOUT + 5)
+            except requests.exceptions.RequestException:
+                self.connected = False
+                return
+            if res.status_code == 304:
+                continue
+            if res.status_code != 200:
+                self.connected = False
+                return
+            data = res.json()
+            if data.get('delta') and self.latest and data.get('since') == version:
+                self.latest = apply_state_delta(self.latest, data)
+            else:
+                self.latest = data
+            version = self.latest.get('version')
+            if version is None:
+                time.sleep(POLL_INTERVAL) # server lama tanpa long-poll
+
+    # Long-poll lewat koneksi biner sendiri; setiap perubahan dikirim sebagai snapshot ter-pack
+    def run_binary(self):
+        version = self.latest.get('version') if self.latest else None
+        try:
+            client = BinaryClient(BINARY.host, BINARY.port)
+            while self.running:
+                state = client.state(MATCH_ID, self.pid, version, LONG_POLL_TIMEOUT)
+                if state is not None:
+                    self.latest = state
+                    version = state['version']
+        except (OSError, ProtocolError):
+            self.connected = False
+
+    def stop(self):
+        self.running = False
+
+# Satu koneksi WebSocket per pemain: server mem-push state/delta setelah
+# setiap perubahan, dan aksi dikirim lewat socket yang sama. Koneksi dibuka
+# di thread ini; sampai state awal datang `latest` masih None.
+class WebSocketPoller(threading.Thread):
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.latest = None
+        self.connected = True
+        self.running = True
+        self.client = None
+
+    def run(self):
+        url = urlsplit(SERVER_URL)
+        try:
+            self.client = WebSocketClient(url.hostname, url.port or 80, self.pid, MATCH_ID, timeout=REQUEST_TIMEOUT)
+            self.client.sock.settimeout(None)
+            while self.running:
+                data = self.client.recv_json()
+                if 'result' in data:
+                    result = data['result']
+                    PREDICTOR.acknowledge(result.get('seq'), result)
+                    if not result.get('success'):
+                        print(result.get('message') or result.get('error'))
+                elif data.get('delta') and self.latest and data.get('since') == self.latest.get('version'):
+                    self.latest = apply_state_delta(self.latest, data)
+                else:
+                    self.latest = data
+        except (OSError, WebSocketError, ValueError):
+            if self.running:
+                self.connected = False
+
+    def send(self, data):
+        if self.client is None:
+            return
+        try:
+            self.client.send_json(data)
+        except OSError:
+            self.connected = False
+
+    def stop(self):
+        self.running = False
+        if self.client:
+            self.client.close()
+
+# Hasil aksi diteruskan ke PREDICTOR dengan seq-nya. Di mode WebSocket
+# jawabannya datang belakangan lewat WebSocketPoller.
+def send_placement(pid, y, x, seq=None):
+    if WS is not None:
+        WS.send({'type': 'place', 'coords': [y, x], 'seq': seq})
+        return
+    result = None
+    if BINARY is not None:
+        try:
+            result = BINARY.place(MATCH_ID, pid, y, x)
+        except (OSError, ProtocolError):
+            print("Koneksi ke server terputus.")
+        PREDICTOR.acknowledge(seq, result)
+        return
     try:
-        requests.post(f"{SERVER_URL}/place", json={'player_id': pid, 'coords': [y, x]})
-    except requests.exceptions.ConnectionError:
+        res = HTTP.post(f"{SERVER_URL}/place", json={'player_id': pid, 'match_id': MATCH_ID, 'coords': [y, x], 'seq': seq},
+                        timeout=REQUEST_TIMEOUT)
+        result = res.json()
+    except (requests.exceptions.RequestException, ValueError):
         print("Koneksi ke server terputus.")
-
-def send_action(pid, tp, y, x):
+    PREDICTOR.acknowledge(seq, result)
+
+def send_action(pid, tp, y, x, seq=None):
+    if WS is not None:
+        WS.send({'type': 'action', 'action': tp, 'coords': [y, x], 'seq': seq})
+        return
+    result = None
+    if BINARY is not None:
+        try:
+            result = BINARY.action(MATCH_ID, pid, tp, y, x)
+        except (OSError, ProtocolError):
+            print("Koneksi ke server terputus.")
+        PREDICTOR.acknowledge(seq, result)
+        return
     try:
-        requests.post(f"{SERVER_URL}/action", json={'player_id': pid, 'type': tp, 'coords': [y, x]})
-    except requests.exceptions.ConnectionError:
+        res = HTTP.post(f"{SERVER_URL}/action", json={'player_id': pid, 'match_id': MATCH_ID, 'type': tp, 'coords': [y, x], 'seq': seq},
+                        timeout=REQUEST_TIMEOUT)
+        result = res.json()
+    except (requests.exceptions.RequestException, ValueError):
         print("Koneksi ke server terputus.")
+    PREDICTOR.acknowledge(seq, result)
+
+# Thread pengirim perintah (place/aksi) agar round trip tidak pernah
+# dijalankan di render loop. Perintah sejenis yang belum sempat terkirim
+# digabung: hanya yang terbaru yang dikirim (mis. klik ganda saat server lambat).
+class NetworkWorker(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.pending = {} # {jenis: (fungsi, args)}, urutan jenis tetap
+        self.cond = threading.Condition()
+        self.running = True
+
+    # Mengembalikan args perintah sejenis yang tergantikan (belum terkirim), atau None
+    def submit(self, kind, func, *args):
+        with self.cond:
+            replaced = self.pending.get(kind)
+            self.pending[kind] = (func, args)
+            self.cond.notify()
+        return replaced[1] if replaced else None
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.pending:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                kind = next(iter(self.pending))
+                func, args = self.pending.pop(kind)
+            func(*args)
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+# Menjalankan satu panggilan blocking (mis. join_game) di thread latar;
+# render loop mengecek `done` setiap frame
+class BackgroundCall(threading.Thread):
+    def __init__(self, func, *args):
+        super().__init__(daemon=True)
+        self.func = func
+        self.args = args
+        self.result = None
+        self.done = False
+        self.start()
+
+    def run(self):
+        try:
+            self.result = self.func(*self.args)
+        finally:
+            self.done = True
 
 # --- Drawing helpers ---
 def draw_text(text, font, color, surf, x, y, center=False):
@@ -153,28 +472,6 @@ def draw_text(text, font, color, surf, x, y, center=False):
     surf.blit(obj, rect)
     return rect
 
-def draw_button(rect, label, is_hovered=False, selected=False):
-    if selected:
-        color = COLOR_BTN_ACTIVE
-    elif is_hovered:
-        color = COLOR_BTN_HOVER
-    else:
-        color = COLOR_BTN
-    pygame.draw.rect(screen, color, rect, border_radius=8)
-    draw_text(label, font_md, COLOR_TEXT, screen, rect.centerx, rect.centery, center=True)
-
-def draw_hp(label, hp, max_hp, x, y):
-    tr = draw_text(f"{label}:", font_md, COLOR_TEXT, screen, x, y)
-    box, spacing = 30, 6
-    start_x = tr.right + 15
-    for i in range(max_hp):
-        r = pygame.Rect(start_x + i*(box+spacing), y+5, box, box)
-        if i < hp:
-            pygame.draw.rect(screen, COLOR_HP_FULL, r)
-        else:
-            pygame.draw.rect(screen, COLOR_HP_EMPTY, r)
-            pygame.draw.rect(screen, COLOR_HP_BORDER, r, 2)
-
 def pixel_to_grid(mx, my, off_x, off_y, gs):
     if mx < off_x or my < off_y:
         return None
@@ -184,73 +481,191 @@ def pixel_to_grid(mx, my, off_x, off_y, gs):
         return gy, gx
     return None
 
-def draw_digging_grid(off_x, off_y, gs, label, marks, hover_cell=None, hover_color=None):
-    draw_text(label, font_md, COLOR_TEXT, screen, off_x, off_y - 50)
-    for r in range(gs):
-        for c in range(gs):
-            rect = pygame.Rect(
-                off_x + c*(CELL_SIZE+MARGIN),
-                off_y + r*(CELL_SIZE+MARGIN),
-                CELL_SIZE, CELL_SIZE
-            )
-            base_color = hover_color if hover_cell == (r, c) else COLOR_GRID_BASE
-            pygame.draw.rect(screen, base_color, rect)
-            pygame.draw.rect(screen, COLOR_GRID_LINE, rect, 1)
-            m = marks[r][c]
-            if m == 'hit':
-                pygame.draw.rect(screen, COLOR_HIT, rect.inflate(-8,-8))
-            elif m == 'miss':
-                pygame.draw.rect(screen, COLOR_MISS, rect.inflate(-8,-8))
-
-
-def draw_my_treasure_grid(off_x, off_y, gs, ts, label, pos, hover_cell=None, hover_color=None):
-    draw_text(label, font_md, COLOR_TEXT, screen, off_x, off_y - 50)
-    for r in range(gs):
-        for c in range(gs):
-            rect = pygame.Rect(
-                off_x + c*(CELL_SIZE+MARGIN),
-                off_y + r*(CELL_SIZE+MARGIN),
-                CELL_SIZE, CELL_SIZE
-            )
-            base_color = hover_color if hover_cell == (r, c) else COLOR_GRID_BASE
-            pygame.draw.rect(screen, base_color, rect)
-            pygame.draw.rect(screen, COLOR_GRID_LINE, rect, 1)
-    if pos:
-        ty, tx = pos
-        for dy in range(ts):
-            for dx in range(ts):
-                if tx+dx < gs and ty+dy < gs:
-                    rect = pygame.Rect(
-                        off_x + (tx+dx)*(CELL_SIZE+MARGIN),
-                        off_y + (ty+dy)*(CELL_SIZE+MARGIN),
-                        CELL_SIZE, CELL_SIZE
-                    )
-                    if TREASURE_IMG:
-                        img = pygame.transform.scale(TREASURE_IMG, (CELL_SIZE - 10, CELL_SIZE - 10))
-                        screen.blit(img, rect.inflate(-8, -8).topleft)
-                    else:
-                        if TREASURE_IMG:
-                        img = pygame.transform.scale(TREASURE_IMG, (CELL_SIZE - 10, CELL_SIZE - 10))
-                        screen.blit(img, rect.inflate(-8, -8).topleft)
-                    else:
-                        pygame.draw.rect(screen, COLOR_TREASURE, rect.inflate(-8,  -8))
-
-
+# --- Retained render layer ---
+# Layar disusun dari background statis (di-cache per ukuran grid) ditambah
+# item: (key, signature, build, posisi, center). Surface setiap item di-cache
+# berdasarkan signature-nya, dan setiap frame hanya item yang signature atau
+# posisinya berubah yang digambar ulang, lalu dikirim dengan
+# pygame.display.update(rects). Frame tanpa perubahan tidak menggambar apa pun.
+MAX_CACHED_SURFACES = 512
+
+class RetainedRenderer:
+    def __init__(self, surface):
+        self.surface = surface
+        self.background = None
+        self.background_key = None
+        self.drawn = {}    # {key: (signature, rect)} yang sedang tampil di layar
+        self.sprites = {}  # {signature: Surface}
+
+    # Dipanggil setelah layar digambar di luar renderer (mis. layar loading)
+    def invalidate(self):
+        self.background_key = None
+
+    def sprite(self, signature, build):
+        surf = self.sprites.get(signature)
+        if surf is None:
+            if len(self.sprites) >= MAX_CACHED_SURFACES:
+                self.sprites.clear()
+            surf = self.sprites[signature] = build()
+        return surf
+
+    def render(self, background_key, build_background, items):
+        placed = []
+        for key, signature, build, pos, center in items:
+            surf = self.sprite(signature, build)
+            rect = surf.get_rect(center=pos) if center else surf.get_rect(topleft=pos)
+            placed.append((key, signature, surf, rect))
+
+        if background_key != self.background_key:
+            self.background = build_background()
+            self.background_key = background_key
+            self.surface.blit(self.background, (0, 0))
+            for _, _, surf, rect in placed:
+                self.surface.blit(surf, rect)
+            self.drawn = {key: (signature, rect) for key, signature, _, rect in placed}
+            pygame.display.flip()
+            return
+
+        current = {key: (signature, rect) for key, signature, _, rect in placed}
+        dirty = []
+        for key, (signature, rect) in current.items():
+            old = self.drawn.get(key)
+            if old != (signature, rect):
+                dirty.append(rect)
+                if old:
+                    dirty.append(old[1])
+        dirty.extend(rect for key, (_, rect) in self.drawn.items() if key not in current)
+        self.drawn = current
+        if not dirty:
+            return
+
+        # Setiap area kotor: pulihkan background, lalu gambar ulang semua item
+        # yang menyentuhnya (dipotong ke area itu) sesuai urutan gambar
+        for area in dirty:
+            self.surface.blit(self.background, area, area)
+            for _, _, surf, rect in placed:
+                clip = rect.clip(area)
+                if clip.width and clip.height:
+                    self.surface.blit(surf, clip, clip.move(-rect.x, -rect.y))
+        pygame.display.update(dirty)
+
+def text_item(key, text, font, color, pos, center=False):
+    return (key, ('text', text, font, color), lambda: font.render(text, True, color), pos, center)
+
+def build_hp(label, hp, max_hp):
+    text = font_md.render(f"{label}:", True, COLOR_TEXT)
+    box, spacing = 30, 6
+    start_x = text.get_width() + 15
+    surf = pygame.Surface((start_x + max_hp * (box + spacing), max(text.get_height(), box + 5)), pygame.SRCALPHA)
+    surf.blit(text, (0, 0))
+    for i in range(max_hp):
+        r = pygame.Rect(start_x + i*(box+spacing), 5, box, box)
+        if i < hp:
+            pygame.draw.rect(surf, COLOR_HP_FULL, r)
+        else:
+            pygame.draw.rect(surf, COLOR_HP_EMPTY, r)
+            pygame.draw.rect(surf, COLOR_HP_BORDER, r, 2)
+    return surf
+
+def hp_item(key, label, hp, max_hp, pos):
+    return (key, ('hp', label, hp, max_hp), lambda: build_hp(label, hp, max_hp), pos, False)
+
+def build_button(label, color):
+    surf = pygame.Surface((120, 50), pygame.SRCALPHA)
+    pygame.draw.rect(surf, color, surf.get_rect(), border_radius=8)
+    text = font_md.render(label, True, COLOR_TEXT)
+    surf.blit(text, text.get_rect(center=surf.get_rect().center))
+    return surf
+
+def button_item(key, label, color, rect):
+    return (key, ('button', label, color), lambda: build_button(label, color), rect.topleft, False)
+
+# Satu sel grid; mark: None/'hit'/'miss'/'pending'
+def build_cell(base_color, mark=None, treasure=False):
+    surf = pygame.Surface((CELL_SIZE, CELL_SIZE))
+    rect = surf.get_rect()
+    surf.fill(base_color)
+    if mark == 'hit':
+        pygame.draw.rect(surf, COLOR_HIT, rect.inflate(-8, -8))
+    elif mark == 'miss':
+        pygame.draw.rect(surf, COLOR_MISS, rect.inflate(-8, -8))
+    elif mark == 'pending': # prediksi, menunggu server
+        pygame.draw.rect(surf, COLOR_PENDING, rect.inflate(-16, -16))
+    pygame.draw.rect(surf, COLOR_GRID_LINE, rect, 1)
+    if treasure:
+        if TREASURE_IMG:
+            surf.blit(TREASURE_IMG, rect.inflate(-8, -8).topleft)
+        else:
+            pygame.draw.rect(surf, COLOR_TREASURE, rect.inflate(-8, -8))
+    return surf
+
+def cell_item(key, base_color, mark, treasure, pos):
+    return (key, ('cell', base_color, mark, treasure), lambda: build_cell(base_color, mark, treasure), pos, False)
+
+def digging_grid_items(off_x, off_y, gs, cells, hover_cell=None, hover_color=None):
+    marks = {(y, x): mark for y, x, mark in cells}
+    return [
+        cell_item(('dig', r, c), hover_color if hover_cell == (r, c) else (60, 60, 60), marks.get((r, c)), False,
+                  (off_x + c*(CELL_SIZE+MARGIN), off_y + r*(CELL_SIZE+MARGIN)))
+        for r in range(gs) for c in range(gs)
+    ]
+
+def treasure_grid_items(off_x, off_y, gs, ts, treasures, hover_cell=None, hover_color=None):
+    covered = {(ty + dy, tx + dx) for ty, tx in treasures for dy in range(ts) for dx in range(ts)}
+    return [
+        cell_item(('my', r, c), hover_color if hover_cell == (r, c) else (60, 60, 60), None, (r, c) in covered,
+                  (off_x + c*(CELL_SIZE+MARGIN), off_y + r*(CELL_SIZE+MARGIN)))
+        for r in range(gs) for c in range(gs)
+    ]
+
+# Label grid dengan kotak abu-abu, digambar sekali ke background
+def draw_grid_label(surf, text, color, x, y):
+    label_surface = font_md.render(text, True, color)
+    label_rect = label_surface.get_rect(topleft=(x, y))
+    box_rect = pygame.Rect(label_rect.x - 10, label_rect.y - 5, label_rect.width + 20, label_rect.height + 10)
+    pygame.draw.rect(surf, (100, 100, 100), box_rect, border_radius=6)  # abu-abu
+    surf.blit(label_surface, label_rect)
 
 # --- Main game loop ---
 def game_loop():
-    global PLAYER_ID, session_should_delete
+    global PLAYER_ID, session_should_delete, WS
     selected = None
     running = True
 
+    disconnected_at = None
+
+    if CLIENT_PROTOCOL == 'websocket':
+        poller = WS = WebSocketPoller(PLAYER_ID)
+    else:
+        poller = StatePoller(PLAYER_ID)
+    poller.start()
+    network = NetworkWorker()
+    network.start()
+    renderer = RetainedRenderer(screen)
+
     while running:
-        state = get_game_state(PLAYER_ID)
-        if not state:
-            draw_text("Koneksi ke server terputus...", font_lg, COLOR_HIT,
-                      screen, WINDOW_W//2, WINDOW_H//2, center=True)
+        state = poller.latest
+        if state:
+            state = PREDICTOR.view(state)
+        if not poller.connected or not state:
+            # Event tetap dipompa agar jendela tidak "not responding"
+            for ev in pygame.event.get():
+                if ev.type == pygame.QUIT or (ev.type == pygame.KEYDOWN and ev.key == pygame.K_ESCAPE):
+                    running = False
+            screen.fill(COLOR_BG)
+            if poller.connected:
+                draw_text("Memuat state game...", font_lg, COLOR_TEXT,
+                          screen, WINDOW_W//2, WINDOW_H//2, center=True)
+            else:
+                disconnected_at = disconnected_at or time.monotonic()
+                draw_text("Koneksi ke server terputus...", font_lg, COLOR_HIT,
+                          screen, WINDOW_W//2, WINDOW_H//2, center=True)
+                if time.monotonic() - disconnected_at > DISCONNECT_NOTICE:
+                    running = False
             pygame.display.flip()
-            time.sleep(2)
-            break
+            renderer.invalidate()
+            clock.tick(FPS)
+            continue
 
         if state['game_phase'] == "ENDED":
             session_should_delete = True
@@ -289,7 +704,10 @@ def game_loop():
                     if cell:
                         y, x = cell
                         if x <= gs - ts and y <= gs - ts:
-                            send_placement(PLAYER_ID, y, x)
+                            seq = PREDICTOR.add(state, 'place', y, x)
+                            replaced = network.submit('place', send_placement, PLAYER_ID, y, x, seq)
+                            if replaced:
+                                PREDICTOR.acknowledge(replaced[-1], None)
                             selected = None
                 elif phase == "BATTLE" and my_turn:
                     if btn_move.collidepoint(mx, my):
@@ -306,19 +724,12 @@ def game_loop():
                             y, x = target
                             if selected == 'move' and (x > gs - ts or y > gs - ts):
                                 continue
-                            send_action(PLAYER_ID, selected, y, x)
+                            seq = PREDICTOR.add(state, selected, y, x)
+                            replaced = network.submit('action', send_action, PLAYER_ID, selected, y, x, seq)
+                            if replaced:
+                                PREDICTOR.acknowledge(replaced[-1], None)
                             selected = None
 
-        if ARENA_BG:
-            screen.blit(ARENA_BG, (0, 0))
-        else:
-            screen.fill(COLOR_BG)
-
-        draw_text(PLAYER_ID, font_xl, COLOR_GOLD, screen, btn_cx, 35, center=True)
-        draw_text(state['action_message'], font_lg, COLOR_TEXT, screen, WINDOW_W // 2, 80, center=True)
-        draw_hp("Opponent", state['opponent_hp'], STARTING_HP, dig_x, 25)
-        draw_hp("My HP", state['my_hp'], STARTING_HP, my_x, 25)
-
         # Identifikasi apakah Player A atau B
         is_player_a = PLAYER_ID.lower().endswith("a")
 
@@ -330,208 +741,76 @@ def game_loop():
         label_color_opponent = (255, 140, 0) if is_player_a else (0, 70, 160)
         label_color_treasure = (0, 191, 255) if is_player_a else (255, 140, 0)
 
-        # Draw Opponent's Grid
-        # Draw background box and label for Opponent's Grid
-        label_text = "Opponent's Grid"
-        label_surface = font_md.render(label_text, True, label_color_opponent)
-        label_rect = label_surface.get_rect(topleft=(dig_x, grid_y - 60))
-        box_rect = pygame.Rect(label_rect.x - 10, label_rect.y - 5, label_rect.width + 20, label_rect.height + 10)
-        pygame.draw.rect(screen, (100, 100, 100), box_rect, border_radius=6)  # abu-abu
-        screen.blit(label_surface, label_rect)
-        for r in range(gs):
-            for c in range(gs):
-                rect = pygame.Rect(
-                    dig_x + c * (CELL_SIZE + MARGIN),
-                    grid_y + r * (CELL_SIZE + MARGIN),
-                    CELL_SIZE, CELL_SIZE
-                )
-                if hover_dig == (r, c):
-                    pygame.draw.rect(screen, hover_color_dig, rect)
-                else:
-                    pygame.draw.rect(screen, (60, 60, 60), rect)
-
-                if state['my_dig_marks'][r][c] == 'hit':
-                    pygame.draw.rect(screen, COLOR_HIT, rect.inflate(-8, -8))
-                elif state['my_dig_marks'][r][c] == 'miss':
-                    pygame.draw.rect(screen, COLOR_MISS, rect.inflate(-8, -8))
-
-                pygame.draw.rect(screen, COLOR_GRID_LINE, rect, 1)
-
-        # Draw My Treasure Grid
-        # Draw background box and label for Your Treasure
-        label_text = "Your Treasure"
-        label_surface = font_md.render(label_text, True, label_color_treasure)
-        label_rect = label_surface.get_rect(topleft=(my_x, grid_y - 60))
-        box_rect = pygame.Rect(label_rect.x - 10, label_rect.y - 5, label_rect.width + 20, label_rect.height + 10)
-        pygame.draw.rect(screen, (100, 100, 100), box_rect, border_radius=6)  # abu-abu
-        screen.blit(label_surface, label_rect)
-        for r in range(gs):
-            for c in range(gs):
-                rect = pygame.Rect(
-                    my_x + c * (CELL_SIZE + MARGIN),
-                    grid_y + r * (CELL_SIZE + MARGIN),
-                    CELL_SIZE, CELL_SIZE
-                )
-                if hover_my == (r, c):
-                    pygame.draw.rect(screen, hover_color_my, rect)
-                else:
-                    pygame.draw.rect(screen, (60, 60, 60), rect)
-
-                pygame.draw.rect(screen, COLOR_GRID_LINE, rect, 1)
-
-        if state['my_treasure_pos']:
-            ty, tx = state['my_treasure_pos']
-            for dy in range(ts):
-                for dx in range(ts):
-                    if tx + dx < gs and ty + dy < gs:
-                        rect = pygame.Rect(
-                            my_x + (tx + dx) * (CELL_SIZE + MARGIN),
-                            grid_y + (ty + dy) * (CELL_SIZE + MARGIN),
-                            CELL_SIZE, CELL_SIZE
-                        )
-                        if TREASURE_IMG:
-                            img = pygame.transform.scale(TREASURE_IMG, (CELL_SIZE - 10, CELL_SIZE - 10))
-                            screen.blit(img, rect.inflate(-8, -8).topleft)
-                        else:
-                            pygame.draw.rect(screen, COLOR_TREASURE, rect.inflate(-8, -8))
+        # Bagian statis: background, nama pemain dan label kedua grid
+        def build_background():
+            bg = pygame.Surface((WINDOW_W, WINDOW_H))
+            if ARENA_BG:
+                bg.blit(ARENA_BG, (0, 0))
+            else:
+                bg.fill(COLOR_BG)
+            draw_text(PLAYER_ID, font_xl, COLOR_GOLD, bg, btn_cx, 35, center=True)
+            draw_grid_label(bg, "Opponent's Grid", label_color_opponent, dig_x, grid_y - 60)
+            draw_grid_label(bg, "Your Treasure", label_color_treasure, my_x, grid_y - 60)
+            return bg
+
+        max_hp = state.get('starting_hp', STARTING_HP)
+        items = [
+            text_item('message', state['action_message'], font_lg, COLOR_TEXT, (WINDOW_W // 2, 80), center=True),
+            hp_item('opponent_hp', "Opponent", state['opponent_hp'], max_hp, (dig_x, 25)),
+            hp_item('my_hp', "My HP", state['my_hp'], max_hp, (my_x, 25)),
+        ]
+        items += digging_grid_items(dig_x, grid_y, gs, state['my_dig_cells'], hover_dig, hover_color_dig)
+        items += treasure_grid_items(my_x, grid_y, gs, ts, state['my_treasures'], hover_my, hover_color_my)
 
         # Tombol dan info bawah
+        footer = (WINDOW_W // 2, txt_y)
         if phase == "PLACEMENT":
             if state['my_treasure_pos'] is None:
-                draw_text("Klik di grid 'Your Treasure' untuk menempatkan harta.",
-                          font_md, COLOR_PENDING, screen, WINDOW_W // 2, txt_y, center=True)
+                items.append(text_item('footer', "Klik di grid 'Your Treasure' untuk menempatkan harta.",
+                                       font_md, COLOR_PENDING, footer, center=True))
             else:
-                draw_text("Menunggu pemain lain...", font_md, COLOR_TEXT,
-                          screen, WINDOW_W // 2, txt_y, center=True)
+                items.append(text_item('footer', "Menunggu pemain lain...", font_md, COLOR_TEXT, footer, center=True))
         elif phase == "BATTLE":
             if my_turn:
-                hover_move = btn_move.collidepoint(mouse_pos)
-                hover_dig = btn_dig.collidepoint(mouse_pos)
-
-                pygame.draw.rect(screen,
-                                COLOR_BTN_HOVER if hover_move else (COLOR_BTN_ACTIVE if selected == 'move' else COLOR_BTN),
-                                btn_move, border_radius=8)
-                draw_text("Move", font_md, COLOR_TEXT,
-                        screen, btn_move.centerx, btn_move.centery, center=True)
-
-                pygame.draw.rect(screen,
-                                COLOR_BTN_HOVER if hover_dig else (COLOR_BTN_ACTIVE if selected == 'dig' else COLOR_BTN),
-                                btn_dig, border_radius=8)
-                draw_text("Dig", font_md, COLOR_TEXT,
-                        screen, btn_dig.centerx, btn_dig.centery, center=True)
-
+                hover_btn_move = btn_move.collidepoint(mouse_pos)
+                hover_btn_dig = btn_dig.collidepoint(mouse_pos)
+                items.append(button_item('btn_move', "Move",
+                                         COLOR_BTN_HOVER if hover_btn_move else (COLOR_BTN_ACTIVE if selected == 'move' else COLOR_BTN),
+                                         btn_move))
+                items.append(button_item('btn_dig', "Dig",
+                                         COLOR_BTN_HOVER if hover_btn_dig else (COLOR_BTN_ACTIVE if selected == 'dig' else COLOR_BTN),
+                                         btn_dig))
                 if selected:
-                    draw_text(f"Mode: {selected.upper()}. Klik grid yang sesuai.",
-                            font_md, COLOR_PENDING, screen, WINDOW_W // 2, txt_y, center=True)
+                    items.append(text_item('footer', f"Mode: {selected.upper()}. Klik grid yang sesuai.",
+                                           font_md, COLOR_PENDING, footer, center=True))
                 else:
-                    draw_text("Giliran Anda! Pilih 'Move' atau 'Dig'.",
-                            font_md, COLOR_PENDING, screen, WINDOW_W // 2, txt_y, center=True)
+                    items.append(text_item('footer', "Giliran Anda! Pilih 'Move' atau 'Dig'.",
+                                           font_md, COLOR_PENDING, footer, center=True))
             else:
-                draw_text(f"Giliran Pemain {state['turn']} untuk beraksi.",
-                          font_md, COLOR_TEXT, screen, WINDOW_W // 2, txt_y, center=True)
+                items.append(text_item('footer', f"Giliran Pemain {state['turn']} untuk beraksi.",
+                                       font_md, COLOR_TEXT, footer, center=True))
         elif phase == "ENDED":
             msg = "Anda Menang!" if state['winner'] == PLAYER_ID else "Anda Kalah."
-            draw_text(msg, font_lg, COLOR_PENDING,
-                      screen, WINDOW_W // 2, WINDOW_H // 2, center=True)
+            items.append(text_item('result', msg, font_lg, COLOR_PENDING, (WINDOW_W // 2, WINDOW_H // 2), center=True))
 
-        pygame.display.flip()
-        clock.tick(10)
+        renderer.render((gs, PLAYER_ID), build_background, items)
+        clock.tick(FPS)
 
+    network.stop()
+    poller.stop()
     pygame.quit()
     sys.exit()
 
 def main_menu():
-    # Fallback flags
-    use_default_bg = False
-    use_default_title_font = False
-    use_default_button_font = False
-
-    # Load background
-    try:
-        bg_image = pygame.image.load("asset/Main_menu.jpg")
-        bg_image = pygame.transform.scale(bg_image, (WINDOW_W, WINDOW_H))
-    except:
-        use_default_bg = True
-        bg_image = pygame.Surface((WINDOW_W, WINDOW_H))
+    # Asset menu sudah dimuat di awal; tidak ada load ulang per pemanggilan
+    use_default_bg = MENU_BG is None
+    if use_default_bg:
+        bg_image = pygame.Surface((WINDOW_W, WINDOW_H)).convert()
         bg_image.fill((0, 0, 0))  # fallback: hitam
-
-    # Load fonts
-    try:
-        title_font = pygame.font.Font("asset/MightySouly-lxggD.ttf", 96)
-    except:
-        title_font = pygame.font.SysFont(None, 96, bold=True)
-        use_default_title_font = True
-
-    try:
-        button_font = pygame.font.Font("asset/rimouski sb.otf", 48)
-    except:
-        button_font = pygame.font.SysFont(None, 48)
-        use_default_button_font = True
-
-    # Tombol Start
-    start_btn_rect = pygame.Rect(WINDOW_W // 2 - 150, WINDOW_H // 2, 300, 80)
-    btn_color_normal = (190, 81, 3) if not use_default_bg else (0, 200, 0)  # fallback: hijau
-    btn_color_hover  = (220, 110, 30) if not use_default_bg else (0, 255, 0)
-
-    while True:
-        mouse_pos = pygame.mouse.get_pos()
-
-        for ev in pygame.event.get():
-            if ev.type == pygame.QUIT or (ev.type == pygame.KEYDOWN and ev.key == pygame.K_ESCAPE):
-                pygame.quit()
-                sys.exit()
-            if ev.type == pygame.MOUSEBUTTONDOWN:
-                if start_btn_rect.collidepoint(mouse_pos):
-                    return  # Start game
-
-        screen.blit(bg_image, (0, 0))
-
-        # Judul
-        title_color = (0, 0, 0) if not use_default_bg else (255, 255, 255)
-        draw_text("Treasure Hunt", title_font, title_color,
-                  screen, WINDOW_W // 2, 150, center=True)
-
-        # Tombol Start dengan efek hover
-        if start_btn_rect.collidepoint(mouse_pos):
-            btn_color = btn_color_hover
-        else:
-            btn_color = btn_color_normal
-
-        pygame.draw.rect(screen, btn_color, start_btn_rect, border_radius=12)
-        draw_text("Start Game", button_font, (255, 255, 255),
-                  screen, start_btn_rect.centerx, start_btn_rect.centery, center=True)
-
-        pygame.display.flip()
-        clock.tick(30)
-
-
-def main_menu():
-    # Fallback flags
-    use_default_bg = False
-    use_default_title_font = False
-    use_default_button_font = False
-
-    # Load background
-    try:
-        bg_image = pygame.image.load("asset/Main_menu.jpg")
-        bg_image = pygame.transform.scale(bg_image, (WINDOW_W, WINDOW_H))
-    except:
-        use_default_bg = True
-        bg_image = pygame.Surface((WINDOW_W, WINDOW_H))
-        bg_image.fill((0, 0, 0))  # fallback: hitam
-
-    # Load fonts
-    try:
-        title_font = pygame.font.Font("asset/MightySouly-lxggD.ttf", 96)
-    except:
-        title_font = pygame.font.SysFont(None, 96, bold=True)
-        use_default_title_font = True
-
-    try:
-        button_font = pygame.font.Font("asset/rimouski sb.otf", 48)
-    except:
-        button_font = pygame.font.SysFont(None, 48)
-        use_default_button_font = True
+    else:
+        bg_image = MENU_BG
+    title_font = font_title
+    button_font = font_button
 
     # Tombol Start
     start_btn_rect = pygame.Rect(WINDOW_W // 2 - 150, WINDOW_H // 2, 300, 80)
@@ -576,25 +855,33 @@ if __name__ == "__main__":
 
     main_menu()
 
-    # loop until join successful
+    # loop until join successful; join berjalan di thread latar
+    joiner = BackgroundCall(join_game)
+    retry_at = None
     while PLAYER_ID is None:
         for ev in pygame.event.get():
             if ev.type == pygame.QUIT or (ev.type==pygame.KEYDOWN and ev.key==pygame.K_ESCAPE):
                 pygame.quit()
                 sys.exit()
-        screen.fill(COLOR_BG)
-        draw_text("Menghubungi server...", font_lg, COLOR_TEXT,
-                  screen, WINDOW_W//2, WINDOW_H//2, center=True)
-        pygame.display.flip()
 
-        PLAYER_ID = join_game()
-        if PLAYER_ID is None:
-            screen.fill(COLOR_BG)
+        if joiner and joiner.done:
+            PLAYER_ID = joiner.result
+            joiner = None
+            if PLAYER_ID is None:
+                retry_at = time.monotonic() + JOIN_RETRY_DELAY
+        if joiner is None and PLAYER_ID is None and time.monotonic() >= retry_at:
+            joiner = BackgroundCall(join_game)
+
+        screen.fill(COLOR_BG)
+        if joiner:
+            draw_text("Menghubungi server...", font_lg, COLOR_TEXT,
+                      screen, WINDOW_W//2, WINDOW_H//2, center=True)
+        else:
             draw_text("Gagal bergabung. Server penuh atau tidak aktif.", font_md, COLOR_HIT,
                       screen, WINDOW_W//2, WINDOW_H//2 - 30, center=True)
-            draw_text("Mencoba lagi dalam 5 detik... (ESC untuk keluar)", font_sm, COLOR_TEXT,
-                      screen, WINDOW_W//2, WINDOW_H//2 + 30, center=True)
-            pygame.display.flip()
-            time.sleep(5)
+            draw_text(f"Mencoba lagi dalam {max(0, int(retry_at - time.monotonic()) + 1)} detik... (ESC untuk keluar)",
+                      font_sm, COLOR_TEXT, screen, WINDOW_W//2, WINDOW_H//2 + 30, center=True)
+        pygame.display.flip()
+        clock.tick(FPS)
 
     game_loop()
@@ -0,0 +1,348 @@
+import os
+import time
+import heapq
+import queue
+import socket
+import logging
+import selectors
+import itertools
+import threading
+from collections import deque
+import access_log
+import metrics
+import profiling
+from websocket import WebSocketSession
+from http_parser import RequestParser, HttpParseError, set_connection_header, KEEPALIVE_TIMEOUT, MAX_KEEPALIVE_REQUESTS, RECV_SIZE
+
+# --- Koneksi HTTP untuk engine thread pool (server.py dan worker server_process_http.py) ---
+# Thread pool hanya dipakai selama ada pekerjaan: membaca dan memproses
+# request yang datanya sudah tiba. Koneksi keep-alive yang menunggu request
+# berikutnya dan long-poll /state?since=N yang menunggu perubahan diparkir di
+# satu thread Parker (selectors + watcher GameState) lalu dikembalikan ke
+# antrean pool saat siap, jadi koneksi yang menunggu tidak memegang thread
+# dan request baru tidak antre di belakang long-poll. Sesi WebSocket
+# berjalan di thread sendiri di luar pool (dibatasi MAX_WEBSOCKETS).
+MAX_WEBSOCKETS = int(os.environ.get('MAX_WEBSOCKETS', 256)) # sesi WebSocket simultan per pool
+SEND_TIMEOUT = KEEPALIVE_TIMEOUT # detik sendall boleh tertahan klien yang tidak membaca
+POLL_INTERVAL = 0.02 # detik antar pengecekan version room tanpa watcher (shared memory)
+
+PARKED_IDLE, PARKED_POLL = 1, 2
+
+
+class Connection:
+    __slots__ = ('sock', 'address', 'parser', 'served', 'pending', 'parked', 'park_seq', 'wait')
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.parser = RequestParser()
+        self.served = 0
+        self.pending = None  # (request, started, spans) long-poll yang sedang diparkir
+        self.parked = None   # PARKED_IDLE / PARKED_POLL selama dipegang Parker
+        self.park_seq = 0    # nomor parkir terakhir, untuk entri deadline yang sudah basi
+        self.wait = None     # (room, since, callback watcher atau None)
+
+
+# Satu thread yang memegang semua koneksi yang sedang menunggu. Thread pool
+# menitipkan koneksi lewat park_idle/park_poll; Parker mengembalikannya
+# lewat resume(conn) saat socket bisa dibaca, version room berubah atau
+# long-poll habis waktunya, dan menutup koneksi idle yang melewati
+# KEEPALIVE_TIMEOUT lewat close(conn).
+class Parker(threading.Thread):
+    def __init__(self, resume, close):
+        super().__init__(daemon=True)
+        self.resume = resume
+        self.close = close
+        self.selector = selectors.DefaultSelector()
+        self.incoming = deque() # koneksi baru diparkir, dari thread pool
+        self.ready = deque()    # long-poll yang dibangunkan watcher room
+        self.deadlines = []     # heap (deadline, nomor parkir, urutan, koneksi)
+        self.polled = set()     # long-poll pada room tanpa watcher, dicek setiap POLL_INTERVAL
+        self.order = itertools.count()
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_r.setblocking(False)
+        self.wake_w.setblocking(False)
+        self.selector.register(self.wake_r, selectors.EVENT_READ)
+
+    def _wake(self):
+        try:
+            self.wake_w.send(b'\0')
+        except (BlockingIOError, OSError): # sudah ada byte yang menunggu dibaca
+            pass
+
+    # Tunggu request berikutnya (atau sisa request yang belum lengkap)
+    def park_idle(self, conn):
+        self.incoming.append((conn, PARKED_IDLE, time.monotonic() + KEEPALIVE_TIMEOUT))
+        self._wake()
+
+    # Tunggu version room berubah dari `since`. Mengembalikan False jika sudah
+    # berubah (koneksi tidak diparkir, langsung dijawab pemanggil).
+    def park_poll(self, conn, room, since, timeout):
+        callback = None
+        if hasattr(room, 'add_watcher'):
+            callback = lambda: (self.ready.append(conn), self._wake())
+        # Di-set sebelum watcher terdaftar: watcher bisa terpanggil sebelum
+        # Parker mengambil koneksi ini dari `incoming`
+        conn.wait = (room, since, callback)
+        if callback is not None:
+            waiting = room.add_watcher(callback, since)
+        else:
+            waiting = room.version == since
+        if not waiting:
+            conn.wait = None
+            return False
+        self.incoming.append((conn, PARKED_POLL, time.monotonic() + timeout))
+        self._wake()
+        return True
+
+    def _take_incoming(self):
+        while self.incoming:
+            conn, kind, deadline = self.incoming.popleft()
+            conn.parked = kind
+            conn.park_seq += 1
+            heapq.heappush(self.deadlines, (deadline, conn.park_seq, next(self.order), conn))
+            if kind == PARKED_IDLE:
+                self.selector.register(conn.sock, selectors.EVENT_READ, conn)
+            elif conn.wait[2] is None:
+                self.polled.add(conn)
+
+    def _unpark(self, conn):
+        kind, conn.parked = conn.parked, None
+        if kind == PARKED_IDLE:
+            self.selector.unregister(conn.sock)
+        elif kind == PARKED_POLL:
+            room, _, callback = conn.wait
+            conn.wait = None
+            if callback is not None:
+                room.remove_watcher(callback)
+            else:
+                self.polled.discard(conn)
+
+    def _wake_changed(self):
+        early = []
+        while self.ready:
+            conn = self.ready.popleft()
+            if conn.parked == PARKED_POLL:
+                self._unpark(conn)
+                self.resume(conn)
+            elif conn.wait is not None: # belum diambil dari `incoming`, coba lagi nanti
+                early.append(conn)
+            # selain itu: watcher terpanggil lebih dari sekali, sudah dibangunkan
+        self.ready.extend(early)
+        for conn in [c for c in self.polled if c.wait[0].version != c.wait[1]]:
+            self._unpark(conn)
+            self.resume(conn)
+
+    # Mengembalikan detik sampai deadline berikutnya (None = tidak ada)
+    def _expire(self):
+        now = time.monotonic()
+        while self.deadlines:
+            deadline, seq, _, conn = self.deadlines[0]
+            if conn.parked is None or conn.park_seq != seq: # sudah dibangunkan lebih dulu
+                heapq.heappop(self.deadlines)
+                continue
+            if deadline > now:
+                return deadline - now
+            heapq.heappop(self.deadlines)
+            kind = conn.parked
+            self._unpark(conn)
+            if kind == PARKED_IDLE:
+                logging.debug("Connection from %s timed out.", conn.address)
+                self.close(conn)
+            else:
+                self.resume(conn) # dijawab 304 Not Modified
+        return None
+
+    def run(self):
+        while True:
+            self._take_incoming()
+            self._wake_changed()
+            timeout = self._expire()
+            if self.polled:
+                timeout = POLL_INTERVAL if timeout is None else min(timeout, POLL_INTERVAL)
+            for key, _ in self.selector.select(timeout):
+                if key.data is None:
+                    try:
+                        while self.wake_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                elif key.data.parked == PARKED_IDLE:
+                    self._unpark(key.data)
+                    self.resume(key.data)
+
+
+# Thread pool + Parker untuk satu proses server. `on_request` (opsional)
+# dipanggil untuk setiap request; worker proses memakainya untuk menghitung
+# request sebelum restart.
+class ConnectionPool:
+    def __init__(self, httpserver, threads, max_connections, max_websockets=MAX_WEBSOCKETS, on_request=None):
+        self.httpserver = httpserver
+        self.max_connections = max_connections
+        self.max_websockets = max_websockets
+        self.on_request = on_request
+        self.keep_alive = True # False saat worker drain: setiap response menutup koneksinya
+        self.queue = queue.SimpleQueue()
+        self.changed = threading.Condition() # jumlah koneksi berubah
+        self.open = 0
+        self.websockets = set()
+        self.parker = Parker(self.submit, self.close)
+        self.parker.start()
+        for _ in range(threads):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    def full(self):
+        return self.open >= self.max_connections
+
+    def backlog(self):
+        return self.queue.qsize()
+
+    # Tunggu sampai ada tempat untuk satu koneksi lagi
+    def wait_for_slot(self):
+        with self.changed:
+            self.changed.wait_for(lambda: not self.full())
+
+    # Tunggu sampai semua koneksi ditutup
+    def wait_closed(self):
+        with self.changed:
+            self.changed.wait_for(lambda: self.open == 0)
+
+    def add(self, sock, address):
+        with self.changed:
+            self.open += 1
+        metrics.connection_opened()
+        sock.settimeout(SEND_TIMEOUT)
+        self.submit(Connection(sock, address))
+
+    def submit(self, conn):
+        self.queue.put(conn)
+
+    def close(self, conn):
+        try:
+            conn.sock.close()
+        except OSError:
+            pass
+        metrics.connection_closed()
+        logging.debug("Connection from %s closed.", conn.address)
+        with self.changed:
+            self.open -= 1
+            self.changed.notify_all()
+
+    def _work(self):
+        while True:
+            conn = self.queue.get()
+            if self._serve(conn):
+                self.close(conn)
+
+    # Data yang sudah tiba di socket tanpa menunggu: bytes, b'' (ditutup
+    # klien) atau None (belum ada, koneksi diparkir)
+    def _receive(self, conn):
+        conn.sock.settimeout(0)
+        try:
+            return conn.sock.recv(RECV_SIZE)
+        except BlockingIOError:
+            return None
+        finally:
+            conn.sock.settimeout(SEND_TIMEOUT)
+
+    def _respond(self, conn, request, started, spans):
+        keep_alive = request.keep_alive and conn.served < MAX_KEEPALIVE_REQUESTS and self.keep_alive
+        hasil = self.httpserver.proses(request, block=False)
+        hasil = set_connection_header(hasil, keep_alive)
+        sent = time.perf_counter()
+        conn.sock.sendall(hasil)
+        access_log.log_request(conn.address, request, hasil, started)
+        profiling.finish(spans, conn.address, request, hasil, started, sent)
+        return keep_alive
+
+    # Layani koneksi sampai harus menunggu (diparkir) atau selesai.
+    # Mengembalikan True jika koneksi harus ditutup.
+    def _serve(self, conn):
+        try:
+            if conn.pending is not None:
+                # Long-poll selesai menunggu (version berubah atau timeout)
+                (request, started, spans), conn.pending = conn.pending, None
+                if spans is not None:
+                    spans['wait'] = time.perf_counter() - started
+                    profiling.attach(spans)
+                if not self._respond(conn, request, started, spans):
+                    return True
+            while True:
+                # Request yang sudah lengkap di buffer diproses dulu (pipelining),
+                # baru baca socket lagi jika buffer belum berisi request utuh
+                parse_started = time.perf_counter()
+                request = conn.parser.next_request()
+                if request is None:
+                    data = self._receive(conn)
+                    if data is None:
+                        self.parker.park_idle(conn)
+                        return False
+                    if not data:
+                        return True
+                    conn.parser.feed(data)
+                    continue
+
+                conn.served += 1
+                if self.on_request is not None:
+                    self.on_request()
+                started = time.perf_counter()
+
+                websocket = self.httpserver.parse_websocket(request)
+                if websocket:
+                    return not self._start_websocket(conn, request, websocket)
+                spans = profiling.begin(parse_started, started)
+                long_poll = self.httpserver.parse_long_poll(request.target) if request.method == 'GET' else None
+                if long_poll and long_poll[2] > 0:
+                    conn.pending = (request, started, spans)
+                    if self.parker.park_poll(conn, *long_poll):
+                        return False
+                    conn.pending = None
+                if not self._respond(conn, request, started, spans):
+                    return True
+        except HttpParseError as e:
+            hasil = self.httpserver.response(e.code, e.message, {'error': e.message})
+            try:
+                conn.sock.sendall(set_connection_header(hasil, False))
+            except OSError:
+                pass
+        except (socket.timeout, ConnectionError):
+            # Argumen lazy: string hanya dibuat jika level DEBUG aktif
+            logging.debug("Connection from %s dropped.", conn.address)
+        except Exception as e:
+            logging.error(f"Error processing client {conn.address}: {e}")
+        return True
+
+    # Koneksi diambil alih sesi WebSocket di thread sendiri sampai ditutup.
+    # Mengembalikan False (dan menjawab 503) jika batas sesi tercapai.
+    def _start_websocket(self, conn, request, websocket):
+        with self.changed:
+            accepted = len(self.websockets) < self.max_websockets
+            if accepted:
+                self.websockets.add(conn)
+        if not accepted:
+            hasil = self.httpserver.response(503, 'Service Unavailable', {'error': 'Terlalu banyak sesi WebSocket'})
+            conn.sock.sendall(set_connection_header(hasil, False))
+            return False
+        threading.Thread(target=self._run_websocket, args=(conn, request, websocket), daemon=True).start()
+        return True
+
+    def _run_websocket(self, conn, request, websocket):
+        try:
+            WebSocketSession(conn.sock, self.httpserver, *websocket, conn.parser.detach()).run(request, RECV_SIZE)
+        except (socket.timeout, OSError):
+            logging.debug("WebSocket from %s closed.", conn.address)
+        except Exception as e:
+            logging.error(f"Error processing client {conn.address}: {e}")
+        finally:
+            with self.changed:
+                self.websockets.discard(conn)
+            self.close(conn)
+
+    # Worker berhenti: response berikutnya menutup koneksinya. Koneksi idle
+    # tidak diputus paksa (klien bisa saja sedang mengirim request di
+    # atasnya) tetapi dijawab sekali lagi atau habis KEEPALIVE_TIMEOUT.
+    # Sesi WebSocket tidak diputus (klien tidak reconnect) dan berjalan
+    # sampai pemainnya pergi; proses utama sudah menjalankan worker
+    # pengganti untuk koneksi baru.
+    def drain(self):
+        self.keep_alive = False
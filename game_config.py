@@ -0,0 +1,46 @@
+from collections import namedtuple
+
+# --- Konfigurasi Game default (satu-satunya sumber untuk server dan klien lokal) ---
+GRID_SIZE = 7
+TREASURE_SIZE = 2
+TREASURE_COUNT = 1
+STARTING_HP = 3
+
+# Batas konfigurasi per room
+MIN_GRID_SIZE = 4
+MAX_GRID_SIZE = 256
+MAX_TREASURE_SIZE = 8
+MAX_TREASURE_COUNT = 64
+
+# Konfigurasi satu room; hashable sehingga bisa dipakai sebagai key antrean room terbuka
+GameConfig = namedtuple('GameConfig', ['grid_size', 'treasure_size', 'treasure_count', 'starting_hp'])
+
+DEFAULT_CONFIG = GameConfig(GRID_SIZE, TREASURE_SIZE, TREASURE_COUNT, STARTING_HP)
+
+# Pemain dan fase game, urutannya dipakai juga sebagai kode di shared memory dan protokol biner
+PLAYER_IDS = ('A', 'B')
+PHASES = ("WAITING_FOR_PLAYERS", "PLACEMENT", "BATTLE", "ENDED")
+
+
+# Buat GameConfig dari payload JSON /join. Field yang tidak diisi memakai
+# nilai default; nilai di luar batas menghasilkan ValueError.
+def config_from_dict(data):
+    if not data:
+        return DEFAULT_CONFIG
+    if not isinstance(data, dict):
+        raise ValueError("config harus berupa object")
+    try:
+        config = DEFAULT_CONFIG._replace(**{k: int(v) for k, v in data.items()})
+    except (TypeError, ValueError):
+        raise ValueError("config tidak valid")
+
+    grid, size, count, hp = config
+    if not MIN_GRID_SIZE <= grid <= MAX_GRID_SIZE:
+        raise ValueError(f"grid_size harus {MIN_GRID_SIZE}..{MAX_GRID_SIZE}")
+    if not 1 <= size <= min(grid, MAX_TREASURE_SIZE):
+        raise ValueError("treasure_size tidak valid")
+    if not 1 <= count <= MAX_TREASURE_COUNT or count * size * size > grid * grid // 2:
+        raise ValueError("treasure_count tidak valid")
+    if not 1 <= hp <= count * size * size:
+        raise ValueError("starting_hp tidak valid")
+    return config
@@ -1,140 +1,495 @@
+import os
 import json
+import time
+import itertools
+from collections import deque, OrderedDict
+from urllib.parse import urlsplit, parse_qs
 from datetime import datetime
 import threading
+from http_parser import HttpRequest, HttpParseError, parse_request
+from game_config import DEFAULT_CONFIG, PLAYER_IDS, config_from_dict
+from board import Treasures, new_marks, marks_from_cells, DENSE_MARKS_MAX_GRID
+from sessions import SessionStore
+import metrics
+import profiling
+
+# --- Konfigurasi server (konfigurasi game ada di game_config.py) ---
+ENDED_ROOM_TTL = 60 # detik room yang sudah selesai tetap disimpan sebelum dihapus
+# Detik tanpa perubahan state sebelum room (fase apa pun) dianggap ditinggalkan dan dihapus; 0 = tidak pernah
+IDLE_ROOM_TTL = int(os.environ.get('IDLE_ROOM_TTL', 600))
+IDLE_SWEEP_INTERVAL = 10 # detik minimum antar pemindaian room yang ditinggalkan
+LONG_POLL_TIMEOUT = 25 # detik default /state?since=N menunggu perubahan
+LONG_POLL_MAX_TIMEOUT = 60
+STATE_HISTORY = 16 # jumlah version terakhir yang disimpan untuk membuat delta
+MASK_STATE_MAX_CELLS = 64 # my_hit_mask/my_miss_mask hanya dikirim jika muat 64 bit
+
+BOARD_FIELDS = ('my_dig_marks', 'my_dig_cells') # dikirim lewat dig_cells pada delta
+
+
+# Bandingkan dua state pemain. Mengembalikan field yang berubah dan sel
+# dig mark yang berubah sebagai [y, x, mark]; O(jumlah mark), bukan O(luas papan).
+def diff_state(old, new):
+    changes = {k: v for k, v in new.items() if k not in BOARD_FIELDS and old.get(k) != v}
+    old_cells = {(y, x): m for y, x, m in old['my_dig_cells']}
+    new_cells = {(y, x): m for y, x, m in new['my_dig_cells']}
+    cells = [[y, x, m] for (y, x), m in new_cells.items() if old_cells.get((y, x)) != m]
+    cells.extend([y, x, None] for (y, x) in old_cells if (y, x) not in new_cells)
+    return changes, cells
+
+
+# Response delta: hanya field dan sel yang berubah sejak `since`
+def make_delta(old, new, since):
+    changes, cells = diff_state(old, new)
+    return {"version": new["version"], "delta": True, "since": since, "changes": changes, "dig_cells": cells}
+
+
+# Potong state ke jendela (y, x, tinggi, lebar) papan yang sedang dilihat klien,
+# untuk papan besar yang tidak perlu dikirim utuh
+def window_state(state, window):
+    wy, wx, wh, ww = window
+    size = state['treasure_size']
+    windowed = {k: v for k, v in state.items() if k not in ('my_dig_marks', 'my_hit_mask', 'my_miss_mask')}
+    windowed['my_dig_cells'] = [c for c in state['my_dig_cells'] if wy <= c[0] < wy + wh and wx <= c[1] < wx + ww]
+    windowed['my_treasures'] = [p for p in state['my_treasures']
+                                if p[0] < wy + wh and p[0] + size > wy and p[1] < wx + ww and p[1] + size > wx]
+    windowed['window'] = list(window)
+    return windowed
+
+
+# Parameter window=y,x,tinggi,lebar pada /state; None jika tidak ada atau tidak valid
+def parse_window(query):
+    try:
+        window = tuple(int(v) for v in query['window'][0].split(','))
+    except (KeyError, ValueError):
+        return None
+    if len(window) != 4 or window[2] <= 0 or window[3] <= 0:
+        return None
+    return window
 
-# --- Konfigurasi Game (disimpan di server) ---
-GRID_SIZE = 7
-TREASURE_SIZE = 2
-STARTING_HP = 3
 
 # Kelas untuk menyimpan semua state game di satu tempat
 # Ini mencegah state tersebar dan sulit dikelola, terutama dengan threading
 class GameState:
-    def __init__(self):
+    def __init__(self, match_id=None, config=DEFAULT_CONFIG):
+        self.match_id = match_id
+        self.config = config
         self.lock = threading.Lock() # Lock untuk mencegah race condition
-        self.players = {} # {'player_A': 'some_addr', 'player_B': 'another_addr'}
+        self.changed = threading.Condition(self.lock) # dibangunkan setiap version naik
+        self.version = 0 # naik setiap kali state berubah
+        self.active_at = time.monotonic() # waktu version terakhir naik, untuk eviksi room yang ditinggalkan
+        self.watchers = set() # callback non-blocking (mis. engine asyncio) saat version naik
+        self._reset_fields()
+        self.on_end = None # callback dari RoomRegistry saat game selesai
+        self.journal = None # game_log.GameLog, diisi registry jika log game aktif
+        self.history = OrderedDict() # {version: {'A': state, 'B': state}}
+        self.encoded = None # (version, {pid: json bytes}, {pid: json bytes delta dari version-1})
+        self._record_snapshot()
+
+    def _reset_fields(self):
+        grid, size, _, starting_hp = self.config
+        self.players = {} # {'A': True, 'B': True}
         self.game_phase = "WAITING_FOR_PLAYERS" # WAITING_FOR_PLAYERS, PLACEMENT, BATTLE, ENDED
-        self.treasure_pos = {'A': None, 'B': None}
-        self.hp = {'A': STARTING_HP, 'B': STARTING_HP}
-        self.dig_marks = {
-            'A': [[None] * GRID_SIZE for _ in range(GRID_SIZE)],
-            'B': [[None] * GRID_SIZE for _ in range(GRID_SIZE)]
-        }
+        self.treasures = {pid: Treasures(grid, size) for pid in PLAYER_IDS}
+        self.hp = {pid: starting_hp for pid in PLAYER_IDS}
+        self.dig_marks = {pid: new_marks(grid) for pid in PLAYER_IDS} # galian pemain di papan lawan
         self.turn = 'A'
         self.winner = None
         self.action_message = "Menunggu kedua pemain bergabung..."
+        self.ended_at = None
+        self.sessions = {} # {player_id: session token}, ikut snapshot agar bisa di-resume sesudah restart
 
-    def reset_game(self):
+    # Snapshot state kedua pemain untuk version saat ini, sekaligus JSON-nya
+    # yang sudah di-encode. Snapshot tidak pernah diubah lagi, jadi aman
+    # dibaca setelah lock dilepas.
+    def _record_snapshot(self):
+        states = {pid: self._build_state(pid) for pid in PLAYER_IDS}
+        previous = self.history.get(self.version - 1)
+        self.history[self.version] = states
+        while len(self.history) > STATE_HISTORY:
+            self.history.popitem(last=False)
+
+        encoded = {pid: json.dumps(states[pid]).encode('utf-8') for pid in PLAYER_IDS}
+        deltas = {}
+        if previous is not None:
+            deltas = {pid: json.dumps(make_delta(previous[pid], states[pid], self.version - 1)).encode('utf-8')
+                      for pid in PLAYER_IDS}
+        # Satu assignment tuple, jadi pembaca tanpa lock selalu melihat set yang konsisten
+        self.encoded = (self.version, encoded, deltas)
+
+    # Harus dipanggil di dalam lock setiap kali state berubah
+    def _bump_version(self):
+        self.version += 1
+        self.active_at = time.monotonic()
+        self._record_snapshot()
+        self.changed.notify_all()
+        for callback in self.watchers:
+            callback()
+
+    # Catat event ke log game; dipanggil di dalam lock sesudah _bump_version
+    def _journal(self, *event):
+        if self.journal is not None:
+            self.journal.record(self, list(event))
+
+    # State ringkas untuk snapshot log game; dipanggil di dalam lock
+    def snapshot(self):
+        return {
+            "version": self.version,
+            "players": sorted(self.players),
+            "phase": self.game_phase,
+            "treasures": {pid: self.treasures[pid].positions for pid in PLAYER_IDS},
+            "hp": self.hp,
+            "dig_cells": {pid: self.dig_marks[pid].cells() for pid in PLAYER_IDS},
+            "turn": self.turn,
+            "winner": self.winner,
+            "message": self.action_message,
+            "sessions": dict(self.sessions)
+        }
+
+    def restore(self, data):
         with self.lock:
-            self.players = {}
-            self.game_phase = "WAITING_FOR_PLAYERS"
-            self.treasure_pos = {'A': None, 'B': None}
-            self.hp = {'A': STARTING_HP, 'B': STARTING_HP}
-            self.dig_marks = {
-                'A': [[None] * GRID_SIZE for _ in range(GRID_SIZE)],
-                'B': [[None] * GRID_SIZE for _ in range(GRID_SIZE)]
-            }
-            self.turn = 'A'
-            self.winner = None
-            self.action_message = "Menunggu kedua pemain bergabung..."
+            self._reset_fields()
+            self.players = {pid: True for pid in data['players']}
+            self.game_phase = data['phase']
+            for pid in PLAYER_IDS:
+                for y, x in data['treasures'][pid]:
+                    self.treasures[pid].place(y, x)
+                for y, x, mark in data['dig_cells'][pid]:
+                    self.dig_marks[pid].mark(y, x, mark == 'hit')
+            self.hp = dict(data['hp'])
+            self.turn = data['turn']
+            self.winner = data['winner']
+            self.action_message = data['message']
+            self.sessions = dict(data.get('sessions', {}))
+            self.version = data['version']
+            self.history.clear()
+            self._record_snapshot()
+
+    def wait_for_change(self, since, timeout):
+        with metrics.timed(self.lock, 'wait_for_change'):
+            return self.changed.wait_for(lambda: self.version != since, timeout)
+
+    # Daftarkan callback untuk perubahan berikutnya. Mengembalikan False jika
+    # version sudah berbeda dari `since` (tidak perlu menunggu).
+    def add_watcher(self, callback, since):
+        with metrics.timed(self.lock, 'add_watcher'):
+            if self.version != since:
+                return False
+            self.watchers.add(callback)
+            return True
+
+    def remove_watcher(self, callback):
+        with metrics.timed(self.lock, 'remove_watcher'):
+            self.watchers.discard(callback)
+
+    def reset_game(self):
+        with metrics.timed(self.lock, 'reset_game'):
+            self._reset_fields()
+            self._bump_version()
+            self._journal('reset')
+
+    def is_full(self):
+        return 'A' in self.players and 'B' in self.players
+
+    # Token session kursi ini (sessions.SessionStore); dicatat ke log game
+    # tanpa menaikkan version karena state yang dilihat pemain tidak berubah
+    def set_session(self, player_id, token):
+        with metrics.timed(self.lock, 'set_session'):
+            self.sessions[player_id] = token
+            self._journal('session', player_id, token)
+
+    def has_player(self, player_id):
+        return player_id in self.players
 
     def add_player(self):
-        with self.lock:
+        with metrics.timed(self.lock, 'add_player'):
             if 'A' not in self.players:
                 player_id = 'A'
                 self.players['A'] = True
                 self.action_message = "Pemain A bergabung. Menunggu Pemain B..."
+                self._bump_version()
+                self._journal('join')
                 return player_id
             elif 'B' not in self.players:
                 player_id = 'B'
                 self.players['B'] = True
                 self.game_phase = "PLACEMENT"
                 self.action_message = "Pemain B bergabung. Tahap penempatan dimulai."
+                self._bump_version()
+                self._journal('join')
                 return player_id
             return None # Game sudah penuh
 
+    # Menempatkan treasure berikutnya milik pemain; dipanggil treasure_count kali
     def place_treasure(self, player_id, y, x):
-        with self.lock:
-            if self.game_phase != "PLACEMENT" or self.treasure_pos.get(player_id) is not None:
+        with metrics.timed(self.lock, 'place_treasure'):
+            if self.game_phase != "PLACEMENT" or player_id not in PLAYER_IDS:
                 return False
-            # Validasi agar treasure tidak keluar dari grid
-            if 0 <= y <= GRID_SIZE - TREASURE_SIZE and 0 <= x <= GRID_SIZE - TREASURE_SIZE:
-                self.treasure_pos[player_id] = (y, x)
-                # Jika kedua pemain sudah menempatkan treasure, mulai pertempuran
-                if self.treasure_pos['A'] is not None and self.treasure_pos['B'] is not None:
-                    self.game_phase = "BATTLE"
-                    self.action_message = "Giliran Pemain A untuk beraksi."
-                return True
-            return False
-
-    def perform_action(self, player_id, action_type, y, x):
-        with self.lock:
+            treasures = self.treasures[player_id]
+            # Validasi agar treasure tidak keluar dari grid atau menumpuk treasure lain
+            if len(treasures.positions) >= self.config.treasure_count or not treasures.place(y, x):
+                return False
+            # Jika kedua pemain sudah menempatkan semua treasure, mulai pertempuran
+            if all(len(t.positions) == self.config.treasure_count for t in self.treasures.values()):
+                self.game_phase = "BATTLE"
+                self.action_message = "Giliran Pemain A untuk beraksi."
+            self._bump_version()
+            self._journal('place', player_id, y, x)
+            return True
+
+    def perform_action(self, player_id, action_type, y, x, treasure=0):
+        with metrics.timed(self.lock, 'perform_action'):
             if self.game_phase != "BATTLE" or self.turn != player_id:
                 return {"success": False, "message": "Bukan giliranmu atau game belum dimulai."}
 
             opponent_id = 'B' if player_id == 'A' else 'A'
+            grid = self.config.grid_size
 
             if action_type == 'move':
-                if 0 <= y <= GRID_SIZE - TREASURE_SIZE and 0 <= x <= GRID_SIZE - TREASURE_SIZE:
-                    self.treasure_pos[player_id] = (y, x)
+                if self.treasures[player_id].move(treasure, y, x):
                     self.turn = opponent_id
                     self.action_message = f"Pemain {player_id} memindahkan hartanya. Giliran Pemain {opponent_id}."
-                    self.dig_marks[opponent_id] = [[None] * GRID_SIZE for _ in range(GRID_SIZE)]
+                    self.dig_marks[opponent_id].clear()
+                    self._bump_version()
+                    self._journal('action', player_id, action_type, y, x, treasure)
                     return {"success": True}
                 return {"success": False, "message": "Lokasi pemindahan tidak valid."}
 
             elif action_type == 'dig':
-                opp_treasure = self.treasure_pos[opponent_id]
-                ty, tx = opp_treasure
-                if ty <= y < ty + TREASURE_SIZE and tx <= x < tx + TREASURE_SIZE:
-                    self.dig_marks[player_id][y][x] = 'hit'
+                if not (0 <= y < grid and 0 <= x < grid):
+                    return {"success": False, "message": "Lokasi penggalian tidak valid."}
+                hit = self.treasures[opponent_id].owner(y, x) is not None
+                self.dig_marks[player_id].mark(y, x, hit)
+                if hit:
                     self.hp[opponent_id] -= 1
                     self.action_message = f"Pemain {player_id} berhasil mengenai harta! Giliran Pemain {opponent_id}."
                     if self.hp[opponent_id] <= 0:
                         self.game_phase = "ENDED"
                         self.winner = player_id
                         self.action_message = f"Game Selesai! Pemenangnya adalah Pemain {self.winner}!"
+                        self.ended_at = time.monotonic()
+                        if self.on_end:
+                            self.on_end(self.match_id, self.ended_at)
                 else:
-                    self.dig_marks[player_id][y][x] = 'miss'
                     self.action_message = f"Pemain {player_id} gagal menemukan harta. Giliran Pemain {opponent_id}."
-                
+
                 self.turn = opponent_id
                 if self.game_phase == "BATTLE":
-                    self.dig_marks[opponent_id] = [[None] * GRID_SIZE for _ in range(GRID_SIZE)]
+                    self.dig_marks[opponent_id].clear()
+                self._bump_version()
+                self._journal('action', player_id, action_type, y, x, treasure)
                 return {"success": True}
-            
+
             return {"success": False, "message": "Aksi tidak dikenal."}
 
+    def _build_state(self, player_id):
+        opponent_id = 'B' if player_id == 'A' else 'A'
+        grid, size, count, starting_hp = self.config
+        marks = self.dig_marks[player_id]
+        cells = marks.cells()
+        positions = self.treasures[player_id].positions
+        state = {
+            "player_id": player_id,
+            "match_id": self.match_id,
+            "version": self.version,
+            "game_phase": self.game_phase,
+            "my_hp": self.hp.get(player_id),
+            "opponent_hp": self.hp.get(opponent_id),
+            "my_treasure_pos": positions[0] if positions else None,
+            "my_treasures": list(positions),
+            "my_dig_cells": cells,
+            "turn": self.turn,
+            "winner": self.winner,
+            "action_message": self.action_message,
+            "grid_size": grid,
+            "treasure_size": size,
+            "treasure_count": count,
+            "starting_hp": starting_hp
+        }
+        # Format lama/kompak hanya untuk papan kecil agar ukuran response tidak
+        # ikut membesar sesuai luas papan
+        if grid <= DENSE_MARKS_MAX_GRID:
+            state["my_dig_marks"] = marks_from_cells(cells, grid)
+        if grid * grid <= MASK_STATE_MAX_CELLS:
+            state["my_hit_mask"], state["my_miss_mask"] = marks.masks()
+        return state
 
     def get_state_for_player(self, player_id):
+        if player_id not in PLAYER_IDS:
+            return {"error": "Player ID tidak valid"}
+        with metrics.timed(self.lock, 'get_state_for_player'):
+            return self.history[self.version][player_id]
+
+    # Jalur baca tanpa lock: (version, JSON bytes) yang di-cache saat mutasi
+    def get_encoded_state(self, player_id):
+        version, encoded, _ = self.encoded
+        return version, encoded.get(player_id)
+
+    # Delta ter-encode dari version sebelumnya (kasus umum long-poll);
+    # body None jika `since` bukan version - 1
+    def get_encoded_delta(self, player_id, since):
+        version, _, deltas = self.encoded
+        if since != version - 1:
+            return version, None
+        return version, deltas.get(player_id)
+
+    # State penuh jika version `since` sudah tidak ada di history,
+    # selain itu hanya perubahan sejak `since`
+    def get_delta_for_player(self, player_id, since):
+        if player_id not in PLAYER_IDS:
+            return {"error": "Player ID tidak valid"}
+        with metrics.timed(self.lock, 'get_delta_for_player'):
+            current = self.history[self.version][player_id]
+            old = self.history.get(since)
+        if old is None:
+            return current
+        return make_delta(old[player_id], current, since)
+
+# Registry semua room/match yang berjalan di satu proses server.
+# Lock registry hanya dipakai saat join dan pembersihan room; setiap room
+# punya lock sendiri sehingga match yang berbeda tidak saling menunggu.
+class RoomRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rooms = {} # {match_id: GameState}
+        self.open_rooms = {} # {GameConfig: deque match_id yang masih menunggu pemain B}
+        self.ended_rooms = deque() # (ended_at, match_id), diisi oleh callback GameState
+        self.idle_swept_at = time.monotonic()
+        self.match_ids = itertools.count(1)
+        self.journal = None # game_log.GameLog, lihat attach_journal
+        self.sessions = SessionStore()
+
+    def _room_ended(self, match_id, ended_at):
+        # Dipanggil dari dalam lock room, jadi tidak boleh mengambil lock registry.
+        # deque.append sudah atomic.
+        self.ended_rooms.append((ended_at, match_id))
+
+    def _sweep_ended_rooms(self):
+        now = time.monotonic()
+        while self.ended_rooms and now - self.ended_rooms[0][0] > ENDED_ROOM_TTL:
+            _, match_id = self.ended_rooms.popleft()
+            room = self.rooms.get(match_id)
+            if room is not None and room.ended_at is not None: # abaikan room yang sudah di-reset
+                self.rooms.pop(match_id, None)
+                if self.journal:
+                    self.journal.remove(match_id)
+
+    # Room fase apa pun yang tidak berubah selama IDLE_ROOM_TTL. Pemindaian
+    # O(jumlah room) dibatasi sekali per IDLE_SWEEP_INTERVAL; entri open_rooms
+    # yang room-nya sudah hilang dibuang oleh join.
+    def _sweep_idle_rooms(self):
+        now = time.monotonic()
+        if not IDLE_ROOM_TTL or now - self.idle_swept_at < IDLE_SWEEP_INTERVAL:
+            return
+        self.idle_swept_at = now
+        for match_id, room in list(self.rooms.items()):
+            if now - room.active_at > IDLE_ROOM_TTL:
+                del self.rooms[match_id]
+                if self.journal:
+                    self.journal.remove(match_id)
+
+    def _create_room(self, config):
+        match_id = str(next(self.match_ids))
+        room = GameState(match_id, config)
+        room.on_end = self._room_ended
+        room.journal = self.journal
+        if self.journal:
+            self.journal.create(room)
+        self.rooms[match_id] = room
+        return room
+
+    # --- Pemulihan dari log game (game_log.recover), sebelum server menerima koneksi ---
+    def restore_room(self, match_id, config, snapshot):
+        room = GameState(match_id, config)
+        room.restore(snapshot)
+        room.on_end = self._room_ended
+        self.rooms[match_id] = room
+        return room
+
+    # Susun ulang antrean room terbuka dan room selesai dari room yang dipulihkan
+    def finish_restore(self):
+        now = time.monotonic()
+        self.match_ids = itertools.count(max((int(m) for m in self.rooms), default=0) + 1)
+        self.open_rooms = {}
+        self.ended_rooms = deque()
+        for match_id in sorted(self.rooms, key=int):
+            room = self.rooms[match_id]
+            self.sessions.restore(room)
+            if room.game_phase == "ENDED":
+                room.ended_at = now
+                self.ended_rooms.append((now, match_id))
+            elif not room.is_full():
+                self.open_rooms.setdefault(room.config, deque()).append(match_id)
+
+    def attach_journal(self, journal):
+        self.journal = journal
+        for room in self.rooms.values():
+            room.journal = journal
+
+    # Semua konfigurasi yang lolos config_from_dict bisa dilayani di mode thread
+    def supports(self, config):
+        return True
+
+    # Pemain hanya dipasangkan dengan room yang konfigurasinya sama
+    def join(self, config=DEFAULT_CONFIG):
+        with metrics.timed(self.lock, 'registry.join'):
+            self._sweep_ended_rooms()
+            self._sweep_idle_rooms()
+            waiting = self.open_rooms.setdefault(config, deque())
+            while waiting:
+                room = self.rooms.get(waiting[0])
+                player_id = room.add_player() if room is not None else None
+                if room is None or room.is_full():
+                    waiting.popleft()
+                if player_id:
+                    return room, player_id
+
+            room = self._create_room(config)
+            player_id = room.add_player()
+            waiting.append(room.match_id)
+            return room, player_id
+
+    def reset_room(self, room):
         with self.lock:
-            if player_id not in ('A', 'B'):
-                return {"error": "Player ID tidak valid"}
+            room.reset_game()
+            self.open_rooms.setdefault(room.config, deque()).append(room.match_id)
 
-            opponent_id = 'B' if player_id == 'A' else 'A'
-            state = {
-                "player_id": player_id,
-                "game_phase": self.game_phase,
-                "my_hp": self.hp.get(player_id),
-                "opponent_hp": self.hp.get(opponent_id),
-                "my_treasure_pos": self.treasure_pos.get(player_id),
-                "my_dig_marks": self.dig_marks.get(player_id),
-                "turn": self.turn,
-                "winner": self.winner,
-                "action_message": self.action_message,
-                "grid_size": GRID_SIZE,
-                "treasure_size": TREASURE_SIZE
-            }
-            return state
-
-# Inisialisasi GameState secara global
-game_state = GameState()
+    def get_room(self, match_id):
+        # dict.get atomic di CPython, jadi jalur baca tidak perlu lock registry
+        return self.rooms.get(str(match_id)) if match_id is not None else None
+
+    def room_count(self):
+        return len(self.rooms)
+
+    # {fase: jumlah room} untuk /metrics
+    def phase_counts(self):
+        counts = {}
+        for room in list(self.rooms.values()):
+            counts[room.game_phase] = counts.get(room.game_phase, 0) + 1
+        return counts
+
+
+# JSON hanya memberi int/float/bool/str; koordinat dan nomor treasure harus
+# int (bool juga subclass int) sebelum masuk ke operasi bit di board.py
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def is_coords(coords):
+    return isinstance(coords, list) and len(coords) == 2 and all(is_int(c) for c in coords)
+
+
+# Inisialisasi registry room secara global
+room_registry = RoomRegistry()
 
 class HttpServer:
-    def __init__(self):
-        self.sessions = {}
+    def __init__(self, registry=None):
+        self.rooms = registry if registry is not None else room_registry
+        self.sessions = self.rooms.sessions # token -> kursi pemain, dimiliki registry
+        self.binary_port = None # port server biner yang sedang berjalan (diisi engine), diiklankan di /protocol
 
-    def response(self, code=404, message='Not Found', body=b'', headers={}):
+    def response(self, code=404, message='Not Found', body=b'', headers=None):
+        spans = profiling.current()
+        started = time.perf_counter() if spans is not None else 0.0
+        headers = dict(headers) if headers else {}
         if 'Content-Type' not in headers:
             headers['Content-Type'] = 'application/json'
         
@@ -159,87 +514,272 @@ class HttpServer:
         resp.append("\r\n")
 
         response_headers = "".join(resp).encode('utf-8')
+        if spans is not None:
+            spans['serialize'] = spans.get('serialize', 0.0) + time.perf_counter() - started
         return response_headers + body
 
-    def get_request_body(self, request_lines):
-        # Cari baris kosong yang memisahkan header dan body
+    # Parameter long-poll dari /state?since=N[&timeout=detik].
+    # Mengembalikan (room, since, timeout) atau None jika bukan request long-poll.
+    def parse_long_poll(self, object_address):
+        url = urlsplit(object_address)
+        query = parse_qs(url.query)
+        if url.path != '/state' or 'since' not in query:
+            return None
+        room = self.rooms.get_room(query.get('match_id', [None])[0])
+        if room is None:
+            return None
         try:
-            separator_index = request_lines.index('')
-            body_lines = request_lines[separator_index+1:]
-            return "".join(body_lines)
+            since = int(query['since'][0])
+            timeout = float(query.get('timeout', [LONG_POLL_TIMEOUT])[0])
         except ValueError:
-            return ""
+            return None
+        return room, since, max(0.0, min(timeout, LONG_POLL_MAX_TIMEOUT))
 
-    def proses(self, data):
-        requests = data.split("\r\n")
-        baris = requests[0]
-        
-        j = baris.split(" ")
+    # `request` berupa HttpRequest dari http_parser.RequestParser; str/bytes
+    # request utuh juga diterima dan di-parse dulu
+    def proses(self, request, block=True):
+        if not isinstance(request, HttpRequest):
+            try:
+                request = parse_request(request)
+            except HttpParseError:
+                return self.response(400, 'Bad Request', {'error': 'Malformed request'})
+
+        started = time.perf_counter()
+        if request.target.startswith('/admin/profile'):
+            # Tidak ikut diprofil: perintah stop menunggu request yang sedang diprofil selesai
+            hasil = self.admin_profile(request)
+        else:
+            hasil = profiling.run(self.dispatch, request, block)
+        metrics.observe_request(request.method, request.target, hasil, started)
+        return hasil
+
+    def dispatch(self, request, block=True):
+        method = request.method
+        object_address = request.target
+
+        if method == 'OPTIONS': # Handle pre-flight request for CORS
+            return self.response(204, 'No Content', headers={'Allow': 'OPTIONS, GET, POST'})
+
+        if method == 'GET':
+            return self.http_get(object_address, block, request.headers)
+        elif method == 'POST':
+            return self.http_post(object_address, request.body)
+        else:
+            return self.response(400, 'Bad Request', {'error': 'Unsupported method'})
+
+    # GET: status profiling proses ini, POST: perintah profiling.command.
+    # Hanya aktif jika PROFILE_TOKEN di-set; token dikirim di header X-Profile-Token.
+    def admin_profile(self, request):
+        if not profiling.PROFILE_TOKEN:
+            return self.response(404, 'Not Found', {'error': f"Endpoint {request.method} /admin/profile tidak ditemukan"})
+        if not profiling.authorized(request.headers):
+            return self.response(403, 'Forbidden', {'error': 'Token profiling tidak valid'})
+        if request.method == 'GET':
+            return self.response(200, 'OK', profiling.status())
+        if request.method != 'POST':
+            return self.response(400, 'Bad Request', {'error': 'Unsupported method'})
+        try:
+            payload = json.loads(request.body) if request.body else {}
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return self.response(400, 'Bad Request', {'error': 'Invalid JSON body'})
+        if not isinstance(payload, dict):
+            return self.response(400, 'Bad Request', {'error': 'Invalid JSON body'})
         try:
-            method = j[0].upper().strip()
-            object_address = j[1].strip()
-
-            if method == 'OPTIONS': # Handle pre-flight request for CORS
-                return self.response(204, 'No Content', headers={'Allow': 'OPTIONS, GET, POST'})
-
-            if method == 'GET':
-                return self.http_get(object_address)
-            elif method == 'POST':
-                body = self.get_request_body(requests)
-                return self.http_post(object_address, body)
-            else:
-                return self.response(400, 'Bad Request', {'error': 'Unsupported method'})
-        except IndexError:
-            return self.response(400, 'Bad Request', {'error': 'Malformed request'})
-
-    def http_get(self, object_address):
-        if object_address.startswith('/state?player_id='):
-            player_id = object_address.split('=')[-1]
-            state = game_state.get_state_for_player(player_id)
-            return self.response(200, 'OK', state)
+            return self.response(200, 'OK', profiling.command(payload))
+        except ValueError as e:
+            return self.response(400, 'Bad Request', {'error': str(e)})
+        except OSError as e:
+            return self.response(500, 'Internal Server Error', {'error': f"Dump profiling gagal: {e}"})
+
+    # block=False dipakai engine yang sudah menunggu perubahan sendiri (asyncio, connections.Parker)
+    def http_get(self, object_address, block=True, headers=None):
+        headers = headers or {}
+        url = urlsplit(object_address)
+        if url.path == '/protocol':
+            # Negosiasi protokol: klien yang mendukung framing biner pindah ke port ini
+            protocols = {'http': True, 'binary_port': self.binary_port}
+            return self.response(200, 'OK', protocols)
+        if url.path == '/metrics':
+            return self.response(200, 'OK', metrics.render(self.rooms),
+                                 headers={'Content-Type': 'text/plain; version=0.0.4'})
+        if url.path == '/state':
+            query = parse_qs(url.query)
+            player_id = query.get('player_id', [None])[0]
+            room = self.rooms.get_room(query.get('match_id', [None])[0])
+            if room is None:
+                return self.response(404, 'Not Found', {'error': 'Match tidak ditemukan'})
+            window = parse_window(query)
+            long_poll = self.parse_long_poll(object_address)
+            if long_poll:
+                _, since, timeout = long_poll
+                if block:
+                    waited = time.perf_counter()
+                    changed = room.wait_for_change(since, timeout)
+                    profiling.add('wait', time.perf_counter() - waited)
+                else:
+                    changed = room.version != since
+                if not changed:
+                    return self.response(304, 'Not Modified')
+            if window is not None:
+                # Jendela papan besar: dipotong per request, tidak lewat cache ETag/delta
+                state = room.get_state_for_player(player_id)
+                if 'error' in state:
+                    return self.response(200, 'OK', state)
+                return self.response(200, 'OK', window_state(state, window))
+            if long_poll:
+                _, body = self.encode_delta(room, player_id, since)
+                return self.response(200, 'OK', body)
+
+            version, body = room.get_encoded_state(player_id)
+            if body is None:
+                return self.response(200, 'OK', {"error": "Player ID tidak valid"})
+            etag = f'"{room.match_id}-{version}-{player_id}"'
+            if headers.get('if-none-match') == etag:
+                return self.response(304, 'Not Modified', headers={'ETag': etag})
+            return self.response(200, 'OK', body, headers={'ETag': etag})
+        if url.path == '/ws':
+            # Request upgrade yang valid sudah diambil alih engine sebelum sampai sini
+            return self.response(426, 'Upgrade Required', {'error': 'Gunakan WebSocket dengan player_id dan match_id yang valid'},
+                                 headers={'Upgrade': 'websocket'})
         return self.response(404, 'Not Found', {'error': f"Endpoint GET {object_address} tidak ditemukan"})
 
+    # (version, JSON bytes) perubahan sejak `since`: delta ter-encode jika ada,
+    # selain itu delta/state yang di-encode sekarang
+    def encode_delta(self, room, player_id, since):
+        version, body = room.get_encoded_delta(player_id, since)
+        if body is not None:
+            return version, body
+        data = room.get_delta_for_player(player_id, since)
+        return data.get('version'), json.dumps(data).encode('utf-8')
+
+    # Request GET /ws?player_id=..&match_id=.. dengan header upgrade WebSocket.
+    # Mengembalikan (room, player_id) atau None jika bukan upgrade yang valid.
+    def parse_websocket(self, request):
+        if request.method != 'GET' or request.headers.get('upgrade', '').lower() != 'websocket':
+            return None
+        if 'sec-websocket-key' not in request.headers:
+            return None
+        url = urlsplit(request.target)
+        query = parse_qs(url.query)
+        player_id = query.get('player_id', [None])[0]
+        room = self.rooms.get_room(query.get('match_id', [None])[0])
+        if url.path != '/ws' or room is None or player_id not in PLAYER_IDS:
+            return None
+        return room, player_id
+
+    # Pesan dari klien WebSocket: {"type": "place"|"action", ...} dengan field
+    # yang sama seperti body POST /place dan /action. Mengembalikan body hasil.
+    def websocket_message(self, room, player_id, text):
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            return {'error': 'Invalid JSON body'}
+        if not isinstance(payload, dict):
+            return {'error': 'Invalid JSON body'}
+        if payload.get('type') == 'place':
+            return self.place(room, player_id, payload)[2]
+        if payload.get('type') == 'action':
+            payload = dict(payload, type=payload.get('action'))
+            return self.action(room, player_id, payload)[2]
+        return {'error': 'Tipe pesan tidak dikenal'}
+
+    # Hasil aksi untuk prediksi di klien: `seq` dari klien dikembalikan apa
+    # adanya, dan aksi yang berhasil menyertakan version room sesudahnya
+    # (state dengan version >= ini sudah memuat aksi tersebut)
+    def _ack(self, game_state, payload, code, message, body):
+        body = dict(body)
+        if body.get('success'):
+            body['version'] = game_state.version
+        if 'seq' in payload:
+            body['seq'] = payload['seq']
+        return code, message, body
+
+    # Room milik session_token di payload /join jika token masih berlaku dan
+    # pemainnya masih duduk di room itu, selain itu None (join biasa)
+    def resume_session(self, payload):
+        token, player_id = payload.get('session_token'), payload.get('player_id')
+        if not isinstance(token, str) or not isinstance(player_id, str):
+            return None
+        seat = self.sessions.resume(token, player_id)
+        if seat is None:
+            return None
+        room = self.rooms.get_room(seat[0])
+        if room is None or not room.has_player(player_id):
+            return None
+        return room
+
+    # Mengembalikan (code, message, body) untuk POST /place
+    def place(self, game_state, player_id, payload):
+        self.sessions.touch(game_state.match_id, player_id)
+        coords = payload.get('coords')
+        if is_coords(coords):
+            success = game_state.place_treasure(player_id, coords[0], coords[1])
+            if success:
+                return self._ack(game_state, payload, 200, 'OK', {'success': True})
+            return self._ack(game_state, payload, 400, 'Bad Request', {'error': 'Penempatan tidak valid'})
+        return self._ack(game_state, payload, 400, 'Bad Request', {'error': 'Koordinat tidak valid'})
+
+    # Mengembalikan (code, message, body) untuk POST /action
+    def action(self, game_state, player_id, payload):
+        self.sessions.touch(game_state.match_id, player_id)
+        action_type = payload.get('type')
+        coords = payload.get('coords')
+        treasure = payload.get('treasure', 0)
+        if not is_int(treasure):
+            return self._ack(game_state, payload, 400, 'Bad Request', {'error': 'Nomor treasure tidak valid'})
+        if action_type and is_coords(coords):
+            result = game_state.perform_action(player_id, action_type, coords[0], coords[1], treasure)
+            if result.get('success'):
+                return self._ack(game_state, payload, 200, 'OK', result)
+            return self._ack(game_state, payload, 400, 'Bad Request', result)
+        return self._ack(game_state, payload, 400, 'Bad Request', {'error': 'Payload aksi tidak lengkap'})
+
     def http_post(self, object_address, body):
         try:
             payload = json.loads(body) if body else {}
-        except json.JSONDecodeError:
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return self.response(400, 'Bad Request', {'error': 'Invalid JSON body'})
+        if not isinstance(payload, dict):
             return self.response(400, 'Bad Request', {'error': 'Invalid JSON body'})
 
         if object_address == '/join':
-            if game_state.game_phase == "ENDED":
-                game_state.reset_game()
-
-            player_id = game_state.add_player()
-            if player_id:
-                return self.response(200, 'OK', {'player_id': player_id})
-            else:
-                return self.response(403, 'Forbidden', {'error': 'Game sudah penuh'})
+            # Klien yang menyimpan token kembali ke kursinya sendiri
+            if 'session_token' in payload and payload.get('player_id') not in PLAYER_IDS:
+                return self.response(400, 'Bad Request', {'error': 'player_id tidak valid'})
+            room = self.resume_session(payload)
+            if room is not None:
+                return self.response(200, 'OK', {'player_id': payload['player_id'], 'match_id': room.match_id,
+                                                 'config': room.config._asdict(),
+                                                 'session_token': payload['session_token'], 'resumed': True})
+            try:
+                config = config_from_dict(payload.get('config'))
+            except ValueError as e:
+                return self.response(400, 'Bad Request', {'error': str(e)})
+            if not self.rooms.supports(config):
+                return self.response(400, 'Bad Request', {'error': 'Konfigurasi tidak didukung server ini'})
+            room, player_id = self.rooms.join(config)
+            if room is None:
+                return self.response(403, 'Forbidden', {'error': 'Semua room penuh'})
+            token = self.sessions.issue(room, player_id)
+            return self.response(200, 'OK', {'player_id': player_id, 'match_id': room.match_id,
+                                             'config': config._asdict(), 'session_token': token})
 
         player_id = payload.get('player_id')
         if not player_id:
             return self.response(400, 'Bad Request', {'error': 'player_id dibutuhkan'})
 
+        game_state = self.rooms.get_room(payload.get('match_id'))
+        if game_state is None:
+            return self.response(404, 'Not Found', {'error': 'Match tidak ditemukan'})
+
         if object_address == '/place':
-            coords = payload.get('coords')
-            if coords and isinstance(coords, list) and len(coords) == 2:
-                success = game_state.place_treasure(player_id, coords[0], coords[1])
-                if success:
-                    return self.response(200, 'OK', {'success': True})
-                return self.response(400, 'Bad Request', {'error': 'Penempatan tidak valid'})
-            return self.response(400, 'Bad Request', {'error': 'Koordinat tidak valid'})
+            return self.response(*self.place(game_state, player_id, payload))
 
         if object_address == '/action':
-            action_type = payload.get('type')
-            coords = payload.get('coords')
-            if action_type and coords and isinstance(coords, list) and len(coords) == 2:
-                result = game_state.perform_action(player_id, action_type, coords[0], coords[1])
-                if result.get('success'):
-                    return self.response(200, 'OK', result)
-                return self.response(400, 'Bad Request', result)
-            return self.response(400, 'Bad Request', {'error': 'Payload aksi tidak lengkap'})
+            return self.response(*self.action(game_state, player_id, payload))
             
         if object_address == '/reset': # Endpoint tambahan untuk testing
-            game_state.reset_game()
+            self.rooms.reset_room(game_state)
             return self.response(200, 'OK', {'message': 'Game state has been reset.'})
 
         return self.response(404, 'Not Found', {'error': f"Endpoint POST {object_address} tidak ditemukan"})
\ No newline at end of file
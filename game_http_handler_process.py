@@ -1,243 +1,518 @@
+import os
 import json
-from datetime import datetime
+import time
+import struct
+import threading
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+import game_http_handler
+from game_http_handler import ENDED_ROOM_TTL, IDLE_ROOM_TTL, STATE_HISTORY
+from game_config import DEFAULT_CONFIG, PLAYER_IDS as PLAYERS, PHASES
+from board import cell_bit, treasure_mask, cells_from_masks, marks_from_cells
+from sessions import SharedSessionStore
+import metrics
 
-# Konfigurasi Game
-GRID_SIZE = 7
-TREASURE_SIZE = 2
-STARTING_HP = 3
+# Registry (memoryview shared memory + lock) tidak bisa di-pickle, jadi
+# hanya bisa diwariskan lewat fork. Lock dan proses worker selalu dibuat dari
+# konteks ini, apa pun start method default Python (forkserver sejak 3.14).
+FORK = get_context('fork')
 
-class GameState:
-    def __init__(self, lock):
+MAX_ROOMS = int(os.environ.get('MAX_ROOMS', 256)) # jumlah slot room di shared memory (112 byte per slot)
+LONG_POLL_INTERVAL = 0.02 # detik antar pengecekan version saat long-poll
+
+PHASE_WAITING, PHASE_PLACEMENT, PHASE_BATTLE, PHASE_ENDED = range(4)
+NO_POS = 255 # treasure belum ditempatkan
+
+# Pesan aksi disimpan sebagai (kode, pemain) agar muat di shared memory
+MESSAGES = (
+    "Menunggu kedua pemain bergabung...",
+    "Pemain A bergabung. Menunggu Pemain B...",
+    "Pemain B bergabung. Tahap penempatan dimulai.",
+    "Giliran Pemain A untuk beraksi.",
+    "Pemain {p} memindahkan hartanya. Giliran Pemain {o}.",
+    "Pemain {p} berhasil mengenai harta! Giliran Pemain {o}.",
+    "Game Selesai! Pemenangnya adalah Pemain {p}!",
+    "Pemain {p} gagal menemukan harta. Giliran Pemain {o}.",
+)
+(MSG_WAITING, MSG_A_JOINED, MSG_B_JOINED, MSG_BATTLE_START,
+ MSG_MOVED, MSG_HIT, MSG_WINNER, MSG_MISS) = range(len(MESSAGES))
+
+# Layout satu room di shared memory (offset dalam byte)
+OFF_MATCH_NO = 0    # uint32, 0 = slot kosong
+OFF_VERSION = 4     # uint32
+OFF_ACTIVE_AT = 8   # double, time.time() perubahan terakhir (game selesai = perubahan terakhir)
+OFF_PHASE = 16
+OFF_PLAYERS = 17    # bitmask: 1 = A, 2 = B
+OFF_TURN = 18       # 0 = A, 1 = B
+OFF_WINNER = 19     # 0 = belum ada, 1 = A, 2 = B
+OFF_HP = 20         # 2 byte: A, B
+OFF_TREASURE = 22   # 4 byte: A (y, x), B (y, x)
+OFF_MESSAGE = 26    # 2 byte: kode pesan, indeks pemain
+OFF_GRID = 28       # konfigurasi room: grid_size
+OFF_TREASURE_SIZE = 29
+OFF_STARTING_HP = 30
+# Bitboard (lihat board.cell_bit): satu uint64 per pemain
+OFF_HIT_MASK = 32       # 2 x uint64: A, B
+OFF_MISS_MASK = 48      # 2 x uint64: A, B
+OFF_TREASURE_MASK = 64  # 2 x uint64: jejak treasure A, B
+OFF_SESSION = 80        # 2 x uint64: secret session token A, B (0 = belum ada)
+OFF_SESSION_SEEN = 96   # 2 x double: time.time() token terakhir dipakai
+ROOM_SIZE = 112
+BITBOARD_CELLS = 64 # grid maksimum 8x8 agar bitboard muat satu uint64
+
+# Header registry di awal segmen shared memory
+OFF_NEXT_MATCH_NO = 0 # uint32
+REGISTRY_HEADER_SIZE = 4
+
+UINT32 = struct.Struct('<I')
+UINT64 = struct.Struct('<Q')
+DOUBLE = struct.Struct('<d')
+
+
+# State satu room yang tinggal di shared memory. Semua proses worker membaca
+# dan menulis buffer yang sama secara langsung; lock-nya multiprocessing.Lock
+# asli (semaphore), bukan proxy BaseManager.
+class SharedGameState:
+    def __init__(self, buf, offset, lock):
+        self.buf = buf
+        self.offset = offset
         self.lock = lock
-        self.players = {}
-        self.game_phase = "WAITING_FOR_PLAYERS"
-        self.treasure_pos = {'A': None, 'B': None}
-        self.hp = {'A': STARTING_HP, 'B': STARTING_HP}
-        self.dig_marks = {
-            'A': [[None] * GRID_SIZE for _ in range(GRID_SIZE)],
-            'B': [[None] * GRID_SIZE for _ in range(GRID_SIZE)]
-        }
-        self.turn = 'A'
-        self.winner = None
-        self.action_message = "Menunggu kedua pemain bergabung..."
+        # State yang baru di-decode oleh proses ini, {(version, player_id): state}.
+        # Lokal per worker: delta hanya bisa dibuat jika worker ini pernah
+        # melayani version `since`, selain itu dikirim state penuh.
+        self.recent = {}
+        self.encoded = {} # {(version, player_id): JSON bytes}, juga lokal per worker
+        self.recent_lock = threading.Lock()
+        self.journal = None # game_log.GameLog, diisi registry jika log game aktif
+
+    def _get_u32(self, off):
+        return UINT32.unpack_from(self.buf, self.offset + off)[0]
+
+    def _set_u32(self, off, value):
+        UINT32.pack_into(self.buf, self.offset + off, value)
+
+    def _get(self, off):
+        return self.buf[self.offset + off]
+
+    def _set(self, off, value):
+        self.buf[self.offset + off] = value
+
+    def _get_mask(self, off, idx):
+        return UINT64.unpack_from(self.buf, self.offset + off + 8 * idx)[0]
+
+    def _set_mask(self, off, idx, value):
+        UINT64.pack_into(self.buf, self.offset + off + 8 * idx, value)
+
+    def _clear_marks(self, idx):
+        self._set_mask(OFF_HIT_MASK, idx, 0)
+        self._set_mask(OFF_MISS_MASK, idx, 0)
+
+    def _set_treasure(self, idx, y, x):
+        self._set(OFF_TREASURE + 2 * idx, y)
+        self._set(OFF_TREASURE + 2 * idx + 1, x)
+        self._set_mask(OFF_TREASURE_MASK, idx, treasure_mask(y, x, self._get(OFF_TREASURE_SIZE), self._get(OFF_GRID)))
+
+    def _set_message(self, code, player_idx=0):
+        self._set(OFF_MESSAGE, code)
+        self._set(OFF_MESSAGE + 1, player_idx)
+
+    def _bump_version(self):
+        self._set_u32(OFF_VERSION, (self._get_u32(OFF_VERSION) + 1) & 0xFFFFFFFF)
+        DOUBLE.pack_into(self.buf, self.offset + OFF_ACTIVE_AT, time.time())
+
+    # Catat event ke log game; dipanggil di dalam lock sesudah _bump_version
+    def _journal(self, *event):
+        if self.journal is not None:
+            self.journal.record(self, list(event))
+
+    # Snapshot log game: byte mentah slot room (dipanggil di dalam lock)
+    def snapshot(self):
+        return {"version": self.version, "raw": bytes(self.buf[self.offset:self.offset + ROOM_SIZE]).hex()}
+
+    def restore(self, data):
+        raw = bytes.fromhex(data['raw'])
+        if len(raw) != ROOM_SIZE:
+            raise ValueError("Ukuran snapshot room tidak cocok")
+        with self.lock:
+            self.buf[self.offset:self.offset + ROOM_SIZE] = raw
+
+    @property
+    def match_id(self):
+        return str(self._get_u32(OFF_MATCH_NO))
+
+    @property
+    def match_no(self):
+        return self._get_u32(OFF_MATCH_NO)
+
+    @property
+    def version(self):
+        return self._get_u32(OFF_VERSION)
+
+    @property
+    def config(self):
+        return DEFAULT_CONFIG._replace(grid_size=self._get(OFF_GRID), treasure_size=self._get(OFF_TREASURE_SIZE),
+                                       treasure_count=1, starting_hp=self._get(OFF_STARTING_HP))
+
+    # Treasure muat di papan pada posisi (y, x)
+    def _fits(self, y, x):
+        limit = self._get(OFF_GRID) - self._get(OFF_TREASURE_SIZE)
+        return 0 <= y <= limit and 0 <= x <= limit
+
+    def _reset_fields(self):
+        self._set(OFF_PHASE, PHASE_WAITING)
+        self._set(OFF_PLAYERS, 0)
+        self._set(OFF_TURN, 0)
+        self._set(OFF_WINNER, 0)
+        self._set(OFF_HP, self._get(OFF_STARTING_HP))
+        self._set(OFF_HP + 1, self._get(OFF_STARTING_HP))
+        for i in range(4):
+            self._set(OFF_TREASURE + i, NO_POS)
+        self._set_message(MSG_WAITING)
+        for idx in range(2):
+            self._clear_marks(idx)
+            self._set_mask(OFF_TREASURE_MASK, idx, 0)
+            self._set_mask(OFF_SESSION, idx, 0)
+        self._bump_version()
+
+    # Dipanggil registry (di bawah lock registry) saat slot dipakai match baru
+    def init_match(self, match_no, config=DEFAULT_CONFIG):
+        with metrics.timed(self.lock, 'init_match'):
+            self._set_u32(OFF_MATCH_NO, match_no)
+            self._set(OFF_GRID, config.grid_size)
+            self._set(OFF_TREASURE_SIZE, config.treasure_size)
+            self._set(OFF_STARTING_HP, config.starting_hp)
+            self._reset_fields()
+
+    # Room masih menunggu pemain (baru dibuat atau di-reset)
+    def is_waiting(self):
+        return self.match_no != 0 and self._get(OFF_PHASE) == PHASE_WAITING and not self.is_full()
+
+    # Room ditinggalkan: tidak ada perubahan selama IDLE_ROOM_TTL, fase apa pun
+    def is_idle(self, now):
+        active_at = DOUBLE.unpack_from(self.buf, self.offset + OFF_ACTIVE_AT)[0]
+        return bool(IDLE_ROOM_TTL) and now - active_at > IDLE_ROOM_TTL
+
+    # Slot boleh dipakai match baru: kosong, game sudah lama selesai, atau ditinggalkan
+    def is_free(self, now):
+        if self.match_no == 0:
+            return True
+        active_at = DOUBLE.unpack_from(self.buf, self.offset + OFF_ACTIVE_AT)[0]
+        return (self._get(OFF_PHASE) == PHASE_ENDED and now - active_at > ENDED_ROOM_TTL) or self.is_idle(now)
+
+    def is_full(self):
+        return self._get(OFF_PLAYERS) == 3
+
+    def has_player(self, player_id):
+        return player_id in PLAYERS and bool(self._get(OFF_PLAYERS) & (1 << PLAYERS.index(player_id)))
+
+    # --- Session token (sessions.SharedSessionStore) ---
+    def _seen(self, idx):
+        DOUBLE.pack_into(self.buf, self.offset + OFF_SESSION_SEEN + 8 * idx, time.time())
+
+    def set_session(self, player_id, secret):
+        idx = PLAYERS.index(player_id)
+        with self.lock:
+            self._set_mask(OFF_SESSION, idx, secret)
+            self._seen(idx)
+            self._journal('session', player_id, secret)
+
+    def resume_session(self, player_id, secret, ttl):
+        idx = PLAYERS.index(player_id)
+        with self.lock:
+            seen = DOUBLE.unpack_from(self.buf, self.offset + OFF_SESSION_SEEN + 8 * idx)[0]
+            if self._get_mask(OFF_SESSION, idx) != secret or time.time() - seen > ttl:
+                return False
+            self._seen(idx)
+            return True
+
+    def touch_session(self, player_id):
+        if player_id in PLAYERS:
+            with self.lock:
+                self._seen(PLAYERS.index(player_id))
 
     def reset_game(self):
-        self.lock.acquire()
-        try:
-            self.players = {}
-            self.game_phase = "WAITING_FOR_PLAYERS"
-            self.treasure_pos = {'A': None, 'B': None}
-            self.hp = {'A': STARTING_HP, 'B': STARTING_HP}
-            self.dig_marks = {
-                'A': [[None] * GRID_SIZE for _ in range(GRID_SIZE)],
-                'B': [[None] * GRID_SIZE for _ in range(GRID_SIZE)]
-            }
-            self.turn = 'A'
-            self.winner = None
-            self.action_message = "Menunggu kedua pemain bergabung..."
-        finally:
-            self.lock.release()
+        with metrics.timed(self.lock, 'reset_game'):
+            self._reset_fields()
+            self._journal('reset')
 
     def add_player(self):
-        self.lock.acquire()
-        try:
-            if 'A' not in self.players:
-                player_id = 'A'
-                self.players['A'] = True
-                self.action_message = "Pemain A bergabung. Menunggu Pemain B..."
-                return player_id
-            elif 'B' not in self.players:
-                player_id = 'B'
-                self.players['B'] = True
-                self.game_phase = "PLACEMENT"
-                self.action_message = "Pemain B bergabung. Tahap penempatan dimulai."
-                return player_id
+        with metrics.timed(self.lock, 'add_player'):
+            players = self._get(OFF_PLAYERS)
+            if not players & 1:
+                self._set(OFF_PLAYERS, players | 1)
+                self._set_message(MSG_A_JOINED)
+                self._bump_version()
+                self._journal('join')
+                return 'A'
+            elif not players & 2:
+                self._set(OFF_PLAYERS, players | 2)
+                self._set(OFF_PHASE, PHASE_PLACEMENT)
+                self._set_message(MSG_B_JOINED)
+                self._bump_version()
+                self._journal('join')
+                return 'B'
             return None
-        finally:
-            self.lock.release()
 
     def place_treasure(self, player_id, y, x):
-        self.lock.acquire()
-        try:
-            if self.game_phase != "PLACEMENT" or self.treasure_pos.get(player_id) is not None:
+        with metrics.timed(self.lock, 'place_treasure'):
+            if player_id not in PLAYERS:
+                return False
+            idx = PLAYERS.index(player_id)
+            if self._get(OFF_PHASE) != PHASE_PLACEMENT or self._get(OFF_TREASURE + 2 * idx) != NO_POS:
                 return False
-            if 0 <= y <= GRID_SIZE - TREASURE_SIZE and 0 <= x <= GRID_SIZE - TREASURE_SIZE:
-                self.treasure_pos[player_id] = (y, x)
-                if self.treasure_pos['A'] is not None and self.treasure_pos['B'] is not None:
-                    self.game_phase = "BATTLE"
-                    self.action_message = "Giliran Pemain A untuk beraksi."
+            if self._fits(y, x):
+                self._set_treasure(idx, y, x)
+                if self._get(OFF_TREASURE) != NO_POS and self._get(OFF_TREASURE + 2) != NO_POS:
+                    self._set(OFF_PHASE, PHASE_BATTLE)
+                    self._set_message(MSG_BATTLE_START)
+                self._bump_version()
+                self._journal('place', player_id, y, x)
                 return True
             return False
-        finally:
-            self.lock.release()
 
-    def perform_action(self, player_id, action_type, y, x):
-        self.lock.acquire()
-        try:
-            if self.game_phase != "BATTLE" or self.turn != player_id:
+    # Mode proses hanya mendukung satu treasure per pemain (treasure=0)
+    def perform_action(self, player_id, action_type, y, x, treasure=0):
+        with metrics.timed(self.lock, 'perform_action'):
+            if self._get(OFF_PHASE) != PHASE_BATTLE or player_id not in PLAYERS or self._get(OFF_TURN) != PLAYERS.index(player_id):
                 return {"success": False, "message": "Bukan giliranmu atau game belum dimulai."}
-            opponent_id = 'B' if player_id == 'A' else 'A'
+            idx = PLAYERS.index(player_id)
+            opp = 1 - idx
+
             if action_type == 'move':
-                if 0 <= y <= GRID_SIZE - TREASURE_SIZE and 0 <= x <= GRID_SIZE - TREASURE_SIZE:
-                    self.treasure_pos[player_id] = (y, x)
-                    self.turn = opponent_id
-                    self.dig_marks[opponent_id] = [[None] * GRID_SIZE for _ in range(GRID_SIZE)]
-                    self.action_message = f"Pemain {player_id} memindahkan hartanya. Giliran Pemain {opponent_id}."
+                if treasure == 0 and self._fits(y, x):
+                    self._set_treasure(idx, y, x)
+                    self._set(OFF_TURN, opp)
+                    self._clear_marks(opp)
+                    self._set_message(MSG_MOVED, idx)
+                    self._bump_version()
+                    self._journal('action', player_id, action_type, y, x, treasure)
                     return {"success": True}
                 return {"success": False, "message": "Lokasi pemindahan tidak valid."}
+
             elif action_type == 'dig':
-                opp_treasure = self.treasure_pos[opponent_id]
-                ty, tx = opp_treasure
-                if ty <= y < ty + TREASURE_SIZE and tx <= x < tx + TREASURE_SIZE:
-                    self.dig_marks[player_id][y][x] = 'hit'
-                    self.hp[opponent_id] -= 1
-                    self.action_message = f"Pemain {player_id} berhasil mengenai harta! Giliran Pemain {opponent_id}."
-                    if self.hp[opponent_id] <= 0:
-                        self.game_phase = "ENDED"
-                        self.winner = player_id
-                        self.action_message = f"Game Selesai! Pemenangnya adalah Pemain {self.winner}!"
+                grid = self._get(OFF_GRID)
+                if not (0 <= y < grid and 0 <= x < grid):
+                    return {"success": False, "message": "Lokasi penggalian tidak valid."}
+                bit = cell_bit(y, x, grid)
+                if bit & self._get_mask(OFF_TREASURE_MASK, opp):
+                    self._set_mask(OFF_HIT_MASK, idx, self._get_mask(OFF_HIT_MASK, idx) | bit)
+                    hp = self._get(OFF_HP + opp) - 1
+                    self._set(OFF_HP + opp, hp)
+                    self._set_message(MSG_HIT, idx)
+                    if hp <= 0:
+                        self._set(OFF_PHASE, PHASE_ENDED)
+                        self._set(OFF_WINNER, idx + 1)
+                        self._set_message(MSG_WINNER, idx)
                 else:
-                    self.dig_marks[player_id][y][x] = 'miss'
-                    self.action_message = f"Pemain {player_id} gagal menemukan harta. Giliran Pemain {opponent_id}."
-                self.turn = opponent_id
-                if self.game_phase == "BATTLE":
-                    self.dig_marks[opponent_id] = [[None] * GRID_SIZE for _ in range(GRID_SIZE)]
+                    self._set_mask(OFF_MISS_MASK, idx, self._get_mask(OFF_MISS_MASK, idx) | bit)
+                    self._set_message(MSG_MISS, idx)
+
+                self._set(OFF_TURN, opp)
+                if self._get(OFF_PHASE) == PHASE_BATTLE:
+                    self._clear_marks(opp)
+                self._bump_version()
+                self._journal('action', player_id, action_type, y, x, treasure)
                 return {"success": True}
+
             return {"success": False, "message": "Aksi tidak dikenal."}
-        finally:
-            self.lock.release()
 
     def get_state_for_player(self, player_id):
-        self.lock.acquire()
-        try:
-            if player_id not in ('A', 'B'):
-                return {"error": "Player ID tidak valid"}
-            opponent_id = 'B' if player_id == 'A' else 'A'
-            state = {
-                "player_id": player_id,
-                "game_phase": self.game_phase,
-                "my_hp": self.hp.get(player_id),
-                "opponent_hp": self.hp.get(opponent_id),
-                "my_treasure_pos": self.treasure_pos.get(player_id),
-                "my_dig_marks": self.dig_marks.get(player_id),
-                "turn": self.turn,
-                "winner": self.winner,
-                "action_message": self.action_message,
-                "grid_size": GRID_SIZE,
-                "treasure_size": TREASURE_SIZE
-            }
-            return state
-        finally:
-            self.lock.release()
+        if player_id not in PLAYERS:
+            return {"error": "Player ID tidak valid"}
+        idx = PLAYERS.index(player_id)
+        opp = 1 - idx
+        with metrics.timed(self.lock, 'get_state_for_player'):
+            # Salin byte mentah di dalam lock, decode di luar lock
+            raw = bytes(self.buf[self.offset:self.offset + ROOM_SIZE])
+
+        ty, tx = raw[OFF_TREASURE + 2 * idx], raw[OFF_TREASURE + 2 * idx + 1]
+        hit = UINT64.unpack_from(raw, OFF_HIT_MASK + 8 * idx)[0]
+        miss = UINT64.unpack_from(raw, OFF_MISS_MASK + 8 * idx)[0]
+        winner = raw[OFF_WINNER]
+        msg_code, msg_player = raw[OFF_MESSAGE], raw[OFF_MESSAGE + 1]
+        grid = raw[OFF_GRID]
+        cells = cells_from_masks(hit, miss, grid)
+        treasures = [(ty, tx)] if ty != NO_POS else []
+        state = {
+            "player_id": player_id,
+            "match_id": str(UINT32.unpack_from(raw, OFF_MATCH_NO)[0]),
+            "version": UINT32.unpack_from(raw, OFF_VERSION)[0],
+            "game_phase": PHASES[raw[OFF_PHASE]],
+            "my_hp": raw[OFF_HP + idx],
+            "opponent_hp": raw[OFF_HP + opp],
+            "my_treasure_pos": treasures[0] if treasures else None,
+            "my_treasures": treasures,
+            "my_dig_cells": cells,
+            "turn": PLAYERS[raw[OFF_TURN]],
+            "winner": PLAYERS[winner - 1] if winner else None,
+            "action_message": MESSAGES[msg_code].format(p=PLAYERS[msg_player], o=PLAYERS[1 - msg_player]),
+            "grid_size": grid,
+            "treasure_size": raw[OFF_TREASURE_SIZE],
+            "treasure_count": 1,
+            "starting_hp": raw[OFF_STARTING_HP],
+            "my_dig_marks": marks_from_cells(cells, grid),
+            "my_hit_mask": hit,
+            "my_miss_mask": miss
+        }
+        self._remember(state)
+        return state
+
+    def _remember(self, state):
+        with self.recent_lock:
+            self.recent[(state["version"], state["player_id"])] = state
+            while len(self.recent) > STATE_HISTORY * 2:
+                del self.recent[next(iter(self.recent))]
+
+    # Version dibaca langsung dari shared memory tanpa lock; JSON hanya
+    # di-decode dan di-encode ulang jika worker ini belum punya version tsb
+    def get_encoded_state(self, player_id):
+        if player_id not in PLAYERS:
+            return self.version, None
+        body = self.encoded.get((self.version, player_id))
+        if body is not None:
+            return self.version, body
+        state = self.get_state_for_player(player_id)
+        body = json.dumps(state).encode('utf-8')
+        with self.recent_lock:
+            self.encoded[(state["version"], player_id)] = body
+            while len(self.encoded) > STATE_HISTORY * 2:
+                del self.encoded[next(iter(self.encoded))]
+        return state["version"], body
+
+    def get_encoded_delta(self, player_id, since):
+        return self.version, None
+
+    def get_delta_for_player(self, player_id, since):
+        current = self.get_state_for_player(player_id)
+        if "error" in current:
+            return current
+        with self.recent_lock:
+            old = self.recent.get((since, player_id))
+        if old is None or old["match_id"] != current["match_id"]:
+            return current
+        return game_http_handler.make_delta(old, current, since)
 
     def get_game_phase(self):
-        self.lock.acquire()
-        try:
-            return self.game_phase
-        finally:
-            self.lock.release()
-
-class HttpServer:
-    def __init__(self, shared_game_state):
-        self.sessions = {}
-        self.game_state = shared_game_state
-
-    def response(self, code=404, message='Not Found', body=b'', headers={}):
-        if 'Content-Type' not in headers:
-            headers['Content-Type'] = 'application/json'
-        headers['Access-Control-Allow-Origin'] = '*'
-        headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
-        headers['Access-Control-Allow-Headers'] = 'Content-Type'
-        if isinstance(body, dict) or isinstance(body, list):
-            body = json.dumps(body).encode('utf-8')
-        elif isinstance(body, str):
-            body = body.encode('utf-8')
-        resp = [
-            f"HTTP/1.1 {code} {message}\r\n",
-            f"Date: {datetime.now().strftime('%c')}\r\n",
-            "Server: GameServer/1.0\r\n",
-            f"Content-Length: {len(body)}\r\n"
+        return PHASES[self._get(OFF_PHASE)]
+
+    # Tidak ada Condition lintas proses, jadi long-poll mengecek version di
+    # shared memory secara berkala (pembacaan memori lokal, tanpa IPC)
+    def wait_for_change(self, since, timeout):
+        deadline = time.monotonic() + timeout
+        while self.version == since:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(LONG_POLL_INTERVAL, remaining))
+        return True
+
+
+# Registry room untuk mode proses. Semua room tinggal di satu segmen
+# SharedMemory yang dibuat proses utama; proses worker mewarisi segmen dan
+# lock-nya saat fork (lihat FORK).
+class SharedRoomRegistry:
+    def __init__(self, max_rooms=MAX_ROOMS):
+        self.max_rooms = max_rooms
+        self.shm = SharedMemory(create=True, size=REGISTRY_HEADER_SIZE + max_rooms * ROOM_SIZE)
+        self.shm.buf[:] = bytes(self.shm.size)
+        UINT32.pack_into(self.shm.buf, OFF_NEXT_MATCH_NO, 1)
+        self.lock = FORK.Lock()
+        self.journal = None # game_log.GameLog, lihat attach_journal
+        self.sessions = SharedSessionStore(self)
+        self.rooms = [
+            SharedGameState(self.shm.buf, REGISTRY_HEADER_SIZE + i * ROOM_SIZE, FORK.Lock())
+            for i in range(max_rooms)
         ]
-        for k, v in headers.items():
-            resp.append(f"{k}: {v}\r\n")
-        resp.append("\r\n")
-        response_headers = "".join(resp).encode('utf-8')
-        return response_headers + body
 
-    def get_request_body(self, request_lines):
-        try:
-            separator_index = request_lines.index('')
-            body_lines = request_lines[separator_index+1:]
-            return "".join(body_lines)
-        except ValueError:
-            return ""
-
-    def proses(self, data):
-        requests = data.split("\r\n")
-        baris = requests[0]
-        j = baris.split(" ")
-        try:
-            method = j[0].upper().strip()
-            object_address = j[1].strip()
-            if method == 'OPTIONS':
-                return self.response(204, 'No Content', headers={'Allow': 'OPTIONS, GET, POST'})
-            if method == 'GET':
-                return self.http_get(object_address)
-            elif method == 'POST':
-                body = self.get_request_body(requests)
-                return self.http_post(object_address, body)
-            else:
-                return self.response(400, 'Bad Request', {'error': 'Unsupported method'})
-        except IndexError:
-            return self.response(400, 'Bad Request', {'error': 'Malformed request'})
-
-    def http_get(self, object_address):
-        if object_address.startswith('/state?player_id='):
-            player_id = object_address.split('=')[-1]
-            state = self.game_state.get_state_for_player(player_id)
-            return self.response(200, 'OK', state)
-        return self.response(404, 'Not Found', {'error': f"Endpoint GET {object_address} tidak ditemukan"})
-
-    def http_post(self, object_address, body):
+    def _get_u32(self, off):
+        return UINT32.unpack_from(self.shm.buf, off)[0]
+
+    def _set_u32(self, off, value):
+        UINT32.pack_into(self.shm.buf, off, value)
+
+    # Room disimpan sebagai bitboard uint64 dengan satu treasure per pemain
+    def supports(self, config):
+        return (config.grid_size * config.grid_size <= BITBOARD_CELLS and config.treasure_count == 1
+                and config.starting_hp <= 255)
+
+    def join(self, config=DEFAULT_CONFIG):
+        with metrics.timed(self.lock, 'registry.join'):
+            # Room yang menunggu pemain dengan konfigurasi yang sama
+            # (kecuali yang pemain pertamanya sudah lama pergi)
+            now = time.time()
+            for room in self.rooms:
+                if room.is_waiting() and room.config == config and not room.is_idle(now):
+                    player_id = room.add_player()
+                    if player_id:
+                        return room, player_id
+
+            # Cari slot kosong (atau yang game-nya sudah lama selesai/ditinggalkan)
+            for _ in range(self.max_rooms):
+                match_no = self._get_u32(OFF_NEXT_MATCH_NO)
+                self._set_u32(OFF_NEXT_MATCH_NO, match_no + 1)
+                room = self.rooms[(match_no - 1) % self.max_rooms]
+                if room.is_free(now):
+                    old_match_no = room.match_no
+                    room.init_match(match_no, config)
+                    if self.journal:
+                        if old_match_no:
+                            self.journal.remove(str(old_match_no))
+                        self.journal.create(room)
+                    player_id = room.add_player()
+                    return room, player_id
+            return None, None
+
+    def reset_room(self, room):
+        with self.lock:
+            room.reset_game()
+
+    # --- Pemulihan dari log game (game_log.recover), di proses utama sebelum fork ---
+    def restore_room(self, match_id, config, snapshot):
+        match_no = int(match_id)
+        room = self.rooms[(match_no - 1) % self.max_rooms]
+        if room.match_no > match_no: # slot sudah dipakai match yang lebih baru
+            return None
+        room.restore(snapshot)
+        return room if room.match_no == match_no else None
+
+    def finish_restore(self):
+        last = max((room.match_no for room in self.rooms), default=0)
+        self._set_u32(OFF_NEXT_MATCH_NO, max(self._get_u32(OFF_NEXT_MATCH_NO), last + 1))
+
+    def attach_journal(self, journal):
+        self.journal = journal
+        for room in self.rooms:
+            room.journal = journal
+
+    def get_room(self, match_id):
         try:
-            payload = json.loads(body) if body else {}
-        except json.JSONDecodeError:
-            return self.response(400, 'Bad Request', {'error': 'Invalid JSON body'})
-
-        if object_address == '/join':
-            if self.game_state.get_game_phase() == "ENDED":
-                self.game_state.reset_game()
-            player_id = self.game_state.add_player()
-            if player_id:
-                return self.response(200, 'OK', {'player_id': player_id})
-            else:
-                return self.response(403, 'Forbidden', {'error': 'Game sudah penuh'})
-
-        player_id = payload.get('player_id')
-        if not player_id:
-            return self.response(400, 'Bad Request', {'error': 'player_id dibutuhkan'})
-
-        if object_address == '/place':
-            coords = payload.get('coords')
-            if coords and isinstance(coords, list) and len(coords) == 2:
-                success = self.game_state.place_treasure(player_id, coords[0], coords[1])
-                if success:
-                    return self.response(200, 'OK', {'success': True})
-                return self.response(400, 'Bad Request', {'error': 'Penempatan tidak valid'})
-            return self.response(400, 'Bad Request', {'error': 'Koordinat tidak valid'})
-
-        if object_address == '/action':
-            action_type = payload.get('type')
-            coords = payload.get('coords')
-            if action_type and coords and isinstance(coords, list) and len(coords) == 2:
-                result = self.game_state.perform_action(player_id, action_type, coords[0], coords[1])
-                if result.get('success'):
-                    return self.response(200, 'OK', result)
-                return self.response(400, 'Bad Request', result)
-            return self.response(400, 'Bad Request', {'error': 'Payload aksi tidak lengkap'})
-            
-        if object_address == '/reset':
-            self.game_state.reset_game()
-            return self.response(200, 'OK', {'message': 'Game state has been reset.'})
-
-        return self.response(404, 'Not Found', {'error': f"Endpoint POST {object_address} tidak ditemukan"})
\ No newline at end of file
+            match_no = int(match_id)
+        except (TypeError, ValueError):
+            return None
+        if match_no <= 0:
+            return None
+        room = self.rooms[(match_no - 1) % self.max_rooms]
+        return room if room.match_no == match_no else None
+
+    def room_count(self):
+        return sum(1 for room in self.rooms if room.match_no != 0)
+
+    # {fase: jumlah room} untuk /metrics, dibaca langsung dari shared memory
+    def phase_counts(self):
+        counts = {}
+        for room in self.rooms:
+            if room.match_no != 0:
+                phase = room.get_game_phase()
+                counts[phase] = counts.get(phase, 0) + 1
+        return counts
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+# Routing HTTP sama persis dengan mode thread; hanya registry room-nya
+# yang diganti dengan versi shared memory.
+class HttpServer(game_http_handler.HttpServer):
+    def __init__(self, registry):
+        super().__init__(registry)
@@ -0,0 +1,314 @@
+import os
+import json
+import time
+import logging
+import threading
+from game_config import GameConfig
+from game_http_handler import IDLE_ROOM_TTL
+
+# --- Log event per room ---
+# Setiap room punya file di GAME_LOG_DIR:
+#   <match_id>.<version>.snap -> snapshot ringkas state room pada version itu (JSON)
+#   <match_id>.<segmen>.log   -> event JSONL: {"v": version, "e": [jenis, argumen...]}
+# Event ditulis dengan satu os.write ke file O_APPEND di dalam lock room
+# (urutan sama dengan urutan version, juga lintas proses worker). Segmen
+# ditentukan dari version saja (SNAPSHOT_INTERVAL version per segmen), jadi
+# semua worker menulis ke file yang sama tanpa koordinasi. Setiap
+# SNAPSHOT_INTERVAL version snapshot di-serialize di dalam lock room; thread
+# flusher yang menulis file-nya (fsync + fsync direktori) lalu menghapus
+# snapshot lama dan segmen yang sudah tercakup, bersama fsync event setiap
+# LOG_FSYNC_INTERVAL. Jalur di dalam lock room tidak pernah menunggu disk,
+# dan pemulihan saat start hanya membaca satu snapshot + sekitar
+# SNAPSHOT_INTERVAL event per room, berapa pun panjang match-nya.
+GAME_LOG_DIR = os.environ.get('GAME_LOG_DIR', 'game_log') # '' = log dimatikan
+LOG_FSYNC_INTERVAL = 0.05 # detik; event yang lebih baru bisa hilang jika mesin mati
+SNAPSHOT_INTERVAL = 64
+MAX_OPEN_LOGS = 256 # fd segmen yang dibiarkan terbuka per proses (yang paling lama ditutup)
+# Event yang tidak menaikkan version: masuk segmen sesudah version-nya dan
+# tetap di-replay jika version-nya sama dengan snapshot
+META_EVENTS = ('session',)
+
+
+# Terapkan ulang satu event ke room lewat method yang sama dengan request asli
+def apply_event(room, event):
+    kind, args = event[0], event[1:]
+    if kind == 'join':
+        room.add_player()
+    elif kind == 'place':
+        room.place_treasure(*args)
+    elif kind == 'action':
+        room.perform_action(*args)
+    elif kind == 'reset':
+        room.reset_game()
+    elif kind == 'session':
+        room.set_session(*args)
+    else:
+        raise ValueError(f"Event tidak dikenal: {kind}")
+
+
+# (match_id, nomor, 'snap'|'log') dari nama file di GAME_LOG_DIR, atau None
+def parse_name(name):
+    parts = name.split('.')
+    if len(parts) == 3 and parts[0].isdigit() and parts[1].isdigit() and parts[2] in ('snap', 'log'):
+        return parts[0], int(parts[1]), parts[2]
+    return None
+
+# File room yang sudah tercakup snapshot `version` (snapshot lama dan segmen sebelumnya)
+def stale_files(entries, version):
+    return [(m, n, ext) for m, n, ext in entries
+            if (ext == 'snap' and n < version) or (ext == 'log' and n < version // SNAPSHOT_INTERVAL)]
+
+
+class GameLog:
+    def __init__(self, directory=GAME_LOG_DIR, fsync_interval=LOG_FSYNC_INTERVAL):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+        self.pid = None
+        self.files = {}
+        self._check_fork()
+
+    # Worker hasil fork mewarisi objek ini tanpa thread flusher-nya;
+    # setiap proses memakai fd, lock dan flusher sendiri
+    def _check_fork(self):
+        if self.pid == os.getpid():
+            return
+        for _, fd in self.files.values():
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.files = {}       # {match_id: (segmen, fd)}, urutan = paling lama dipakai dulu
+        self.dirty = set()    # fd yang menunggu fsync
+        self.retired = []     # fd segmen lama, ditutup flusher sesudah fsync
+        self.snapshots = {}   # {match_id: (version, JSON)} menunggu ditulis flusher
+        self.removed = set()  # match_id yang semua file-nya dihapus flusher
+        self.new_files = False # ada file baru, direktori perlu di-fsync
+        self.flusher = None
+
+    def _path(self, match_id, number, ext):
+        return os.path.join(self.directory, f"{match_id}.{number}.{ext}")
+
+    def _open(self, match_id, segment):
+        with self.lock:
+            entry = self.files.pop(match_id, None)
+            if entry is not None and entry[0] == segment:
+                self.files[match_id] = entry
+                return entry[1]
+            if entry is not None:
+                self.retired.append(entry[1])
+            fd = os.open(self._path(match_id, segment, 'log'), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            self.files[match_id] = (segment, fd)
+            self.new_files = True
+            # Mode proses: room milik worker lain atau yang sudah selesai tetap
+            # punya fd di sini; yang paling lama tidak dipakai ditutup
+            while len(self.files) > MAX_OPEN_LOGS:
+                self.retired.append(self.files.pop(next(iter(self.files)))[1])
+            return fd
+
+    def _start_flusher(self):
+        if self.flusher is None:
+            self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self.flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.fsync_interval)
+            try:
+                self.flush()
+            except OSError as e: # mis. direktori log tidak bisa dibaca; dicoba lagi di putaran berikutnya
+                logging.warning(f"Log game gagal di-flush: {e}")
+
+    def flush(self):
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+            retired, self.retired = self.retired, []
+            snapshots, self.snapshots = self.snapshots, {}
+            removed, self.removed = self.removed, set()
+            new_files, self.new_files = self.new_files, False
+        for fd in dirty:
+            try:
+                os.fsync(fd)
+            except OSError as e:
+                logging.warning(f"fsync log game gagal: {e}")
+        for fd in retired:
+            os.close(fd)
+        written = set()
+        for match_id, (version, data) in snapshots.items():
+            if match_id in removed:
+                continue
+            try:
+                self._write_snapshot(match_id, version, data)
+                written.add(match_id)
+            except OSError as e:
+                logging.warning(f"Snapshot room {match_id} gagal ditulis: {e}")
+        # Nama snapshot dan segmen baru harus tahan crash sebelum file lama dihapus
+        if written or new_files:
+            self._fsync_dir()
+        if written or removed:
+            self._compact(written, removed)
+
+    def _fsync_dir(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    # Dipanggil di dalam lock room (room.snapshot() membaca state tanpa lock)
+    def _serialize(self, room):
+        return json.dumps({'match_id': room.match_id, 'config': list(room.config), 'state': room.snapshot()})
+
+    # Di thread flusher. Snapshot tidak pernah ditimpa (nama memuat version),
+    # jadi dua worker yang menulis snapshot room yang sama tidak saling balapan.
+    def _write_snapshot(self, match_id, version, data):
+        path = self._path(match_id, version, 'snap')
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    # Hapus snapshot lama dan segmen sebelum snapshot terbaru room yang baru
+    # ditulis, serta semua file room yang dihapus registry
+    def _compact(self, written, removed):
+        files = {}
+        for name in os.listdir(self.directory):
+            parsed = parse_name(name)
+            if parsed and (parsed[0] in written or parsed[0] in removed):
+                files.setdefault(parsed[0], []).append(parsed)
+        for match_id, entries in files.items():
+            if match_id in removed:
+                stale = entries
+            else:
+                stale = stale_files(entries, max(n for _, n, ext in entries if ext == 'snap'))
+            self._remove_files(stale)
+
+    def _remove_files(self, entries):
+        for entry in entries:
+            try:
+                os.remove(self._path(*entry))
+            except FileNotFoundError:
+                pass
+
+    # Room baru: snapshot awal sebelum event pertamanya (dipanggil registry)
+    def create(self, room):
+        self._check_fork()
+        with room.lock:
+            version, data = room.version, self._serialize(room)
+        with self.lock:
+            self.snapshots[room.match_id] = (version, data)
+        self._start_flusher()
+
+    # Dipanggil GameState di dalam lock room, sesudah version naik
+    def record(self, room, event):
+        self._check_fork()
+        version = room.version
+        meta = event[0] in META_EVENTS
+        segment = max(0, version if meta else version - 1) // SNAPSHOT_INTERVAL
+        line = json.dumps({'v': version, 'e': event}) + '\n'
+        try:
+            fd = self._open(room.match_id, segment)
+            os.write(fd, line.encode('utf-8'))
+        except OSError as e:
+            logging.warning(f"Event room {room.match_id} gagal ditulis: {e}")
+            return
+        data = self._serialize(room) if not meta and version % SNAPSHOT_INTERVAL == 0 else None
+        with self.lock:
+            self.dirty.add(fd)
+            if data is not None:
+                self.snapshots[room.match_id] = (version, data)
+        self._start_flusher()
+
+    # Room dihapus registry: log dan snapshot-nya dihapus flusher
+    def remove(self, match_id):
+        self._check_fork()
+        with self.lock:
+            entry = self.files.pop(match_id, None)
+            if entry is not None:
+                self.retired.append(entry[1])
+            self.snapshots.pop(match_id, None)
+            self.removed.add(match_id)
+        self._start_flusher()
+
+    def _replay(self, room, segments):
+        since = room.version
+        for segment in segments:
+            try:
+                with open(self._path(room.match_id, segment, 'log'), 'rb') as f:
+                    lines = f.read().splitlines()
+            except FileNotFoundError:
+                continue
+            for line in lines:
+                try:
+                    record = json.loads(line)
+                except ValueError: # baris terakhir terpotong saat proses mati
+                    logging.warning(f"Log room {room.match_id}: record rusak, replay dihentikan")
+                    return
+                # Sudah termasuk di snapshot
+                if record['v'] < since or (record['v'] == since and record['e'][0] not in META_EVENTS):
+                    continue
+                apply_event(room, record['e'])
+                if room.version != record['v']:
+                    logging.warning(f"Log room {room.match_id}: version {room.version} != {record['v']}, replay dihentikan")
+                    return
+
+    # Bangun ulang semua room dari snapshot terbaru + segmen sesudahnya.
+    # Mengembalikan jumlah room.
+    def recover(self, registry):
+        rooms = {} # {match_id: [(match_id, nomor, ext)]}
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'): # snapshot yang belum selesai ditulis saat proses mati
+                os.remove(os.path.join(self.directory, name))
+                continue
+            parsed = parse_name(name)
+            if parsed:
+                rooms.setdefault(parsed[0], []).append(parsed)
+        now = time.time()
+        latest = {}
+        for match_id in sorted(rooms, key=int):
+            entries = rooms[match_id]
+            snaps = [n for _, n, ext in entries if ext == 'snap']
+            if not snaps: # snapshot awal belum sempat ditulis
+                continue
+            # Room yang sudah ditinggalkan sebelum server mati tidak dipulihkan
+            modified = max(os.path.getmtime(self._path(*entry)) for entry in entries)
+            if IDLE_ROOM_TTL and now - modified > IDLE_ROOM_TTL:
+                continue
+            version = latest[match_id] = max(snaps)
+            try:
+                with open(self._path(match_id, version, 'snap')) as f:
+                    data = json.load(f)
+                room = registry.restore_room(match_id, GameConfig(*data['config']), data['state'])
+                if room is not None:
+                    self._replay(room, sorted(n for _, n, ext in entries
+                                              if ext == 'log' and n >= version // SNAPSHOT_INTERVAL))
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logging.warning(f"Room {match_id} tidak bisa dipulihkan: {e}")
+        registry.finish_restore()
+        # Hapus room yang tidak dipulihkan (ditinggalkan, rusak, atau slot-nya
+        # sudah dipakai match lebih baru), lalu file lama room yang dipulihkan
+        recovered = 0
+        for match_id, entries in rooms.items():
+            if registry.get_room(match_id) is None:
+                stale = entries
+            else:
+                recovered += 1
+                stale = stale_files(entries, latest[match_id])
+            self._remove_files(stale)
+        return recovered
+
+
+# Pulihkan room dari GAME_LOG_DIR lalu catat semua perubahan berikutnya.
+# Harus dipanggil sebelum server menerima koneksi.
+def start(registry, directory=GAME_LOG_DIR):
+    if not directory:
+        return None
+    log = GameLog(directory)
+    recovered = log.recover(registry)
+    registry.attach_journal(log)
+    logging.warning(f"Log game di {directory}: {recovered} room dipulihkan")
+    return log
@@ -0,0 +1,137 @@
+# Parser HTTP/1.1 inkremental berbasis byte, dipakai bersama oleh semua engine
+# server (thread, proses, asyncio). Data dari socket cukup di-feed apa adanya;
+# header setiap request hanya di-parse sekali, lalu body dibaca tepat sebanyak
+# Content-Length tanpa decode/encode ulang seluruh buffer.
+
+# --- Konfigurasi koneksi persisten (HTTP/1.1 keep-alive) ---
+KEEPALIVE_TIMEOUT = 5.0       # detik koneksi boleh idle sebelum ditutup
+MAX_KEEPALIVE_REQUESTS = 100  # jumlah request maksimum per koneksi
+
+MAX_HEADER_SIZE = 16 * 1024
+MAX_BODY_SIZE = 1024 * 1024
+RECV_SIZE = 4096
+
+
+class HttpParseError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class HttpRequest:
+    __slots__ = ('method', 'target', 'version', 'headers', 'body')
+
+    def __init__(self, method, target, version, headers, body=b''):
+        self.method = method
+        self.target = target
+        self.version = version
+        self.headers = headers # nama header dalam huruf kecil
+        self.body = body
+
+    # HTTP/1.1 default-nya keep-alive, HTTP/1.0 default-nya close
+    @property
+    def keep_alive(self):
+        connection = self.headers.get('connection', '').lower()
+        if connection == 'close':
+            return False
+        if connection == 'keep-alive':
+            return True
+        return self.version == 'HTTP/1.1'
+
+    def __repr__(self):
+        return f"{self.method} {self.target} {self.version} {self.headers}"
+
+
+def parse_head(head):
+    try:
+        text = head.decode('latin-1')
+    except UnicodeDecodeError:
+        raise HttpParseError(400, 'Bad Request')
+    lines = text.split('\r\n')
+    parts = lines[0].split(' ')
+    if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+        raise HttpParseError(400, 'Bad Request')
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if not sep:
+            raise HttpParseError(400, 'Bad Request')
+        headers[name.strip().lower()] = value.strip()
+    return parts[0].upper(), parts[1], parts[2], headers
+
+
+class RequestParser:
+    def __init__(self):
+        self.buffer = bytearray()
+        self.scan_from = 0  # posisi awal pencarian \r\n\r\n berikutnya
+        self.pending = None # request yang header-nya sudah di-parse, menunggu body
+        self.body_length = 0
+
+    def feed(self, data):
+        self.buffer += data
+
+    def has_buffered_data(self):
+        return bool(self.buffer) or self.pending is not None
+
+    # Ambil sisa buffer mentah saat koneksi berganti protokol (upgrade WebSocket)
+    def detach(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+    # Mengembalikan HttpRequest berikutnya yang sudah lengkap, atau None jika
+    # masih butuh data. Sisa buffer (request pipelined) tetap disimpan.
+    def next_request(self):
+        if self.pending is None:
+            header_end = self.buffer.find(b'\r\n\r\n', self.scan_from)
+            if header_end < 0:
+                if len(self.buffer) > MAX_HEADER_SIZE:
+                    raise HttpParseError(431, 'Request Header Fields Too Large')
+                # \r\n\r\n bisa terpotong di antara dua chunk
+                self.scan_from = max(0, len(self.buffer) - 3)
+                return None
+
+            method, target, version, headers = parse_head(bytes(self.buffer[:header_end]))
+            try:
+                self.body_length = int(headers.get('content-length', 0))
+            except ValueError:
+                raise HttpParseError(400, 'Bad Request')
+            if self.body_length < 0:
+                raise HttpParseError(400, 'Bad Request')
+            if self.body_length > MAX_BODY_SIZE:
+                raise HttpParseError(413, 'Payload Too Large')
+            del self.buffer[:header_end + 4]
+            self.scan_from = 0
+            self.pending = HttpRequest(method, target, version, headers)
+
+        if len(self.buffer) < self.body_length:
+            return None
+        request = self.pending
+        request.body = bytes(self.buffer[:self.body_length])
+        del self.buffer[:self.body_length]
+        self.pending = None
+        self.body_length = 0
+        return request
+
+
+# Sisipkan header Connection tepat setelah status line response
+def set_connection_header(response, keep_alive):
+    if keep_alive:
+        header = f"Connection: keep-alive\r\nKeep-Alive: timeout={int(KEEPALIVE_TIMEOUT)}, max={MAX_KEEPALIVE_REQUESTS}\r\n"
+    else:
+        header = "Connection: close\r\n"
+    status_line, _, rest = response.partition(b'\r\n')
+    return status_line + b'\r\n' + header.encode('utf-8') + rest
+
+
+# Parse satu request utuh (str atau bytes), dipakai jika data sudah lengkap
+def parse_request(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    parser = RequestParser()
+    parser.feed(data)
+    request = parser.next_request()
+    if request is None:
+        raise HttpParseError(400, 'Bad Request')
+    return request
@@ -0,0 +1,281 @@
+import os
+import sys
+import json
+import time
+import random
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlencode
+
+# Load test end-to-end: menjalankan run_server.py untuk setiap engine, lalu
+# N match berisi dua bot yang bermain seperti client_pygame (join, place,
+# lalu dig/move bergantian sambil long-poll /state). Hasilnya: request/detik,
+# latency p50/p99 per jenis request, error rate dan RSS server, ditulis
+# sebagai JSON per engine + commit agar bisa dibandingkan antar commit.
+#
+#   python loadtest.py --engines thread,process --matches 20 --duration 20
+HOST = '127.0.0.1'
+PORT = 8889
+POLL_TIMEOUT = 5       # detik long-poll /state bot (lebih pendek dari klien agar run cepat selesai)
+STARTUP_TIMEOUT = 15   # detik menunggu server siap
+RSS_INTERVAL = 0.5     # detik antar sampel RSS
+RESULTS_DIR = 'bench_results'
+# Jenis request yang dihitung di latency keseluruhan; long-poll sengaja menunggu
+BLOCKING_KINDS = ('poll',)
+
+
+class Bot(threading.Thread):
+    def __init__(self, port, deadline, seed):
+        super().__init__(daemon=True)
+        self.port = port
+        self.deadline = deadline
+        self.rng = random.Random(seed)
+        self.conn = http.client.HTTPConnection(HOST, port, timeout=POLL_TIMEOUT + 5)
+        self.latencies = {} # {jenis: [detik]}
+        self.errors = {}    # {jenis: jumlah}
+        self.matches = 0
+
+    def request(self, kind, method, path, payload=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        started = time.perf_counter()
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            res = self.conn.getresponse()
+            data = res.read()
+        except (OSError, http.client.HTTPException):
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+            self.conn.close() # HTTPConnection membuka koneksi baru di request berikutnya
+            return None, None
+        self.latencies.setdefault(kind, []).append(time.perf_counter() - started)
+        if res.status >= 400:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+        return res.status, data
+
+    # State berikutnya sesudah version `state`; delta diterapkan ke state lama
+    def poll(self, state, pid, match_id):
+        query = {'player_id': pid, 'match_id': match_id}
+        if state is not None:
+            remaining = max(0.0, self.deadline - time.monotonic())
+            query.update(since=state['version'], timeout=round(min(POLL_TIMEOUT, remaining), 3))
+        status, data = self.request('poll' if state is not None else 'state', 'GET', f"/state?{urlencode(query)}")
+        if status == 304 or status != 200:
+            return state
+        data = json.loads(data)
+        if data.get('delta'):
+            state = dict(state, **data['changes'])
+            state['version'] = data['version']
+            return state
+        return data
+
+    def act(self, state, pid, match_id):
+        grid, size = state['grid_size'], state['treasure_size']
+        payload = {'player_id': pid, 'match_id': match_id}
+        if self.rng.random() < 0.2:
+            payload.update(type='move', coords=[self.rng.randrange(grid - size + 1), self.rng.randrange(grid - size + 1)])
+        else:
+            payload.update(type='dig', coords=[self.rng.randrange(grid), self.rng.randrange(grid)])
+        self.request('action', 'POST', '/action', payload)
+
+    def play_match(self):
+        status, data = self.request('join', 'POST', '/join', {})
+        if status != 200:
+            time.sleep(0.1)
+            return
+        info = json.loads(data)
+        pid, match_id = info['player_id'], info['match_id']
+        self.matches += 1
+        state = self.poll(None, pid, match_id)
+        while state is not None and time.monotonic() < self.deadline:
+            phase = state['game_phase']
+            if phase == 'ENDED':
+                return
+            if phase == 'PLACEMENT' and not state['my_treasures']:
+                grid, size = state['grid_size'], state['treasure_size']
+                self.request('place', 'POST', '/place', {'player_id': pid, 'match_id': match_id,
+                                                          'coords': [self.rng.randrange(grid - size + 1),
+                                                                     self.rng.randrange(grid - size + 1)]})
+            elif phase == 'BATTLE' and state['turn'] == pid:
+                self.act(state, pid, match_id)
+            state = self.poll(state, pid, match_id)
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            self.play_match()
+        self.conn.close()
+
+
+# --- RSS server (proses utama + semua anaknya, dari /proc) ---
+def process_tree(pid):
+    pids, i = [pid], 0
+    while i < len(pids):
+        try:
+            with open(f"/proc/{pids[i]}/task/{pids[i]}/children") as f:
+                pids.extend(int(p) for p in f.read().split())
+        except OSError:
+            pass
+        i += 1
+    return pids
+
+def rss_bytes(pid):
+    total = 0
+    for p in process_tree(pid):
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(RSS_INTERVAL):
+            self.samples.append(rss_bytes(self.pid))
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def summarize(values):
+    values = sorted(values)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3),
+        'mean_ms': round(sum(values) / len(values) * 1000, 3),
+    }
+
+
+def start_server(engine, port, log_dir):
+    env = dict(os.environ, BINARY_PORT='0', ACCESS_LOG_LEVEL='WARNING', GAME_LOG_DIR=log_dir)
+    proc = subprocess.Popen([sys.executable, 'run_server.py', engine], env=env, start_new_session=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server {engine} keluar dengan kode {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection(HOST, port, timeout=1)
+            conn.request('GET', '/protocol')
+            conn.getresponse().read()
+            conn.close()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    stop_server(proc)
+    raise RuntimeError(f"Server {engine} tidak siap dalam {STARTUP_TIMEOUT} detik")
+
+# SIGINT dulu agar engine proses sempat menghentikan worker-nya, lalu paksa
+def stop_server(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGINT)
+        proc.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        pass
+    except ProcessLookupError:
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    proc.wait()
+
+
+def run_engine(engine, matches, duration, port=PORT):
+    with tempfile.TemporaryDirectory() as log_dir:
+        proc = start_server(engine, port, log_dir)
+        try:
+            sampler = RssSampler(proc.pid)
+            sampler.start()
+            rss_start = rss_bytes(proc.pid)
+            started = time.monotonic()
+            bots = [Bot(port, started + duration, seed) for seed in range(matches * 2)]
+            for bot in bots:
+                bot.start()
+            for bot in bots:
+                bot.join()
+            elapsed = time.monotonic() - started
+            sampler.stopped.set()
+            rss_end = rss_bytes(proc.pid)
+        finally:
+            stop_server(proc)
+
+    by_kind, errors, overall = {}, {}, []
+    for bot in bots:
+        for kind, values in bot.latencies.items():
+            by_kind.setdefault(kind, []).extend(values)
+            if kind not in BLOCKING_KINDS:
+                overall.extend(values)
+        for kind, n in bot.errors.items():
+            errors[kind] = errors.get(kind, 0) + n
+    requests = sum(len(v) for v in by_kind.values()) + sum(errors.values())
+    return {
+        'engine': engine,
+        'matches': matches,
+        'duration_s': round(elapsed, 3),
+        'matches_played': sum(bot.matches for bot in bots) // 2,
+        'requests': requests,
+        'rps': round(requests / elapsed, 1),
+        'errors': errors,
+        'error_rate': round(sum(errors.values()) / requests, 5) if requests else 0.0,
+        'latency': summarize(overall),
+        'latency_by_kind': {kind: summarize(values) for kind, values in sorted(by_kind.items())},
+        'rss_mb': {
+            'start': round(rss_start / 2**20, 1),
+            'peak': round(max(sampler.samples + [rss_end]) / 2**20, 1),
+            'end': round(rss_end / 2**20, 1),
+        },
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test server Treasure Hunt')
+    parser.add_argument('--engines', default='thread,process,async', help='engine dipisah koma')
+    parser.add_argument('--matches', type=int, default=20, help='match simultan (2 bot per match)')
+    parser.add_argument('--duration', type=float, default=20, help='detik per engine')
+    parser.add_argument('--output', default=RESULTS_DIR, help="folder hasil JSON ('' = tidak ditulis)")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    for engine in args.engines.split(','):
+        result = run_engine(engine.strip(), args.matches, args.duration)
+        result.update(commit=commit, timestamp=round(time.time()), python=sys.version.split()[0], cpus=os.cpu_count())
+        latency = result['latency']
+        print(f"{engine:8} {result['rps']:9.1f} req/s  p50 {latency.get('p50_ms')} ms  p99 {latency.get('p99_ms')} ms  "
+              f"error {result['error_rate']:.2%}  RSS puncak {result['rss_mb']['peak']} MB  "
+              f"({result['matches_played']} match)")
+        if args.output:
+            os.makedirs(args.output, exist_ok=True)
+            path = os.path.join(args.output, f"{engine}-{commit}.json")
+            with open(path, 'w') as f:
+                json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+import os
+import time
+import pickle
+import logging
+import weakref
+import threading
+from collections import deque
+from bisect import bisect_left
+from urllib.parse import urlsplit
+import profiling
+
+# --- Metrics (format teks Prometheus, GET /metrics) ---
+# Pencatatan tanpa lock: setiap thread menulis ke shard miliknya sendiri
+# (dict biasa), dan shard semua thread baru dijumlahkan saat /metrics
+# di-scrape. Shard thread yang sudah selesai digabung ke `_retired`.
+# Pada mode proses setiap worker mencatat di prosesnya sendiri lalu
+# membagikan snapshot-nya lewat direktori bersama (lihat aggregate_in), jadi
+# satu scrape berisi total server; gauge room dibaca dari shared memory.
+PREFIX = 'treasure'
+
+# Bucket log-linear ala HDR histogram: SUB_BUCKETS bucket per pangkat dua,
+# dari 2^MIN_EXPONENT sampai 2^MAX_EXPONENT mikrodetik (8 us .. ~67 s),
+# galat relatif maksimum 1/SUB_BUCKETS
+SUB_BUCKETS = 4
+MIN_EXPONENT = 3
+MAX_EXPONENT = 26
+BOUNDS = [(1 << e) + (sub + 1) * (1 << e) // SUB_BUCKETS
+          for e in range(MIN_EXPONENT, MAX_EXPONENT) for sub in range(SUB_BUCKETS)]
+BOUNDS.insert(0, 1 << MIN_EXPONENT)
+
+# Route dengan label sendiri; path lain digabung agar jumlah seri tidak tumbuh
+ROUTES = {'/join', '/place', '/action', '/reset', '/state', '/protocol', '/ws', '/metrics', '/admin/profile'}
+# Method dari klien juga dibatasi; method lain (atau sampah) jadi 'other'
+METHODS = {'GET', 'POST', 'OPTIONS', 'HEAD'}
+
+
+class Shard:
+    __slots__ = ('counters', 'histograms', '__weakref__')
+
+    def __init__(self):
+        self.counters = {}   # {(nama, label): nilai}
+        self.histograms = {} # {(nama, label): [hitungan per bucket..., +Inf, jumlah detik]}
+
+
+_local = threading.local()
+_shards = set()
+_shards_lock = threading.Lock() # hanya saat thread baru/selesai dan saat scrape
+_retired = Shard()
+_dead = deque() # shard thread yang sudah selesai, menunggu digabung ke _retired
+_gauges = [] # (nama, help, fungsi) -> angka atau {label: angka}
+_aggregate_dir = None # direktori snapshot antar proses; None = hanya proses ini (engine thread/async)
+
+PUBLISH_INTERVAL = 1.0 # detik antar penulisan snapshot worker ke _aggregate_dir
+RETIRED_FILE = 'retired.pickle'
+
+
+def _merge(target, shard):
+    for key, value in list(shard.counters.items()):
+        target.counters[key] = target.counters.get(key, 0) + value
+    for key, counts in list(shard.histograms.items()):
+        merged = target.histograms.setdefault(key, [0] * len(counts))
+        for i, v in enumerate(counts):
+            merged[i] += v
+
+
+# Di bawah _shards_lock. Finalizer thread bisa jalan dari GC kapan saja
+# (termasuk saat lock sedang dipegang), jadi ia hanya menaruh shard di _dead.
+def _collect_dead():
+    while _dead:
+        shard = _dead.popleft()
+        _shards.discard(shard)
+        _merge(_retired, shard)
+
+
+def _shard():
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _local.shard = Shard()
+        with _shards_lock:
+            _collect_dead()
+            _shards.add(shard)
+        weakref.finalize(threading.current_thread(), _dead.append, shard)
+        return shard
+
+
+# Proses worker hasil fork mulai dari nol (angka proses utama tidak ikut
+# dihitung) dan, jika agregasi aktif, mulai menulis snapshot-nya
+def reset():
+    global _retired
+    with _shards_lock:
+        _shards.clear()
+        _dead.clear()
+        _retired = Shard()
+    _local.__dict__.pop('shard', None)
+    if _aggregate_dir is not None:
+        threading.Thread(target=_publish_loop, daemon=True).start()
+
+
+# --- Agregasi antar proses (mode proses) ---
+# Setiap proses anak menulis snapshot metrics-nya sebagai <pid>.pickle di
+# direktori bersama setiap PUBLISH_INTERVAL dan saat keluar; /metrics di
+# worker mana pun menjumlahkan semua file itu. Proses utama (yang tidak
+# boleh punya thread) hanya menggabungkan file proses yang sudah keluar ke
+# RETIRED_FILE lewat retire(), agar counter tetap naik dan file tidak menumpuk.
+def aggregate_in(directory):
+    global _aggregate_dir
+    _aggregate_dir = directory
+
+def _read(path):
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+def _write(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        pickle.dump(data, f)
+    os.replace(tmp, path)
+
+def _shard_of(data):
+    shard = Shard()
+    shard.counters, shard.histograms = data['counters'], data['histograms']
+    return shard
+
+def _publish_loop():
+    while True:
+        time.sleep(PUBLISH_INTERVAL)
+        publish()
+
+def publish():
+    if _aggregate_dir is None:
+        return
+    total = _snapshot()
+    try:
+        _write(os.path.join(_aggregate_dir, f"{os.getpid()}.pickle"),
+               {'counters': total.counters, 'histograms': total.histograms, 'threads': threading.active_count()})
+    except OSError as e:
+        logging.warning(f"Snapshot metrics gagal ditulis: {e}")
+
+# Proses utama: snapshot terakhir proses `pid` yang sudah keluar digabung ke
+# RETIRED_FILE; semua koneksinya sudah pasti tertutup. File yang digabung
+# pada panggilan sebelumnya baru dihapus sekarang, agar scrape yang masih
+# membaca RETIRED_FILE lama tidak kehilangan angkanya.
+def retire(pid):
+    if _aggregate_dir is None:
+        return
+    path = os.path.join(_aggregate_dir, RETIRED_FILE)
+    retired = _read(path) or {'counters': {}, 'histograms': {}, 'merged': ()}
+    for old in retired['merged']:
+        try:
+            os.remove(os.path.join(_aggregate_dir, f"{old}.pickle"))
+        except OSError:
+            pass
+    total = _shard_of(retired)
+    data = _read(os.path.join(_aggregate_dir, f"{pid}.pickle"))
+    if data is not None:
+        dead = _shard_of(data)
+        dead.counters[('connections_closed_total', ())] = dead.counters.get(('connections_opened_total', ()), 0)
+        _merge(total, dead)
+    try:
+        _write(path, {'counters': total.counters, 'histograms': total.histograms,
+                      'merged': (pid,) if data is not None else ()})
+    except OSError as e:
+        logging.warning(f"Metrics worker {pid} gagal digabung: {e}")
+
+# Total semua proses: snapshot proses ini ditambah file proses lain
+def _aggregate():
+    total = _snapshot()
+    threads = threading.active_count()
+    skip = {f"{os.getpid()}.pickle", RETIRED_FILE}
+    retired = _read(os.path.join(_aggregate_dir, RETIRED_FILE))
+    if retired is not None:
+        _merge(total, _shard_of(retired))
+        skip.update(f"{pid}.pickle" for pid in retired['merged'])
+    try:
+        names = os.listdir(_aggregate_dir)
+    except OSError:
+        names = []
+    for name in names:
+        if name.endswith('.pickle') and name not in skip:
+            data = _read(os.path.join(_aggregate_dir, name))
+            if data is not None:
+                _merge(total, _shard_of(data))
+                threads += data['threads']
+    return total, threads
+
+
+def route_of(target):
+    path = urlsplit(target).path
+    return path if path in ROUTES else 'other'
+
+def method_of(method):
+    return method if method in METHODS else 'other'
+
+
+def inc(name, labels=(), value=1):
+    counters = _shard().counters
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + value
+
+
+def observe(name, labels, seconds):
+    histograms = _shard().histograms
+    key = (name, labels)
+    counts = histograms.get(key)
+    if counts is None:
+        counts = histograms[key] = [0] * (len(BOUNDS) + 2)
+    counts[bisect_left(BOUNDS, seconds * 1e6)] += 1
+    counts[-1] += seconds
+
+
+def register_gauge(name, help_text, func):
+    _gauges.append((name, help_text, func))
+
+
+# Satu request HTTP selesai diproses HttpServer.proses
+def observe_request(method, target, response, started):
+    route = route_of(target)
+    status = response[9:12].decode('ascii', 'replace')
+    inc('http_requests_total', (('route', route), ('method', method_of(method)), ('status', status)))
+    observe('http_request_duration_seconds', (('route', route),), time.perf_counter() - started)
+
+
+def connection_opened():
+    inc('connections_opened_total')
+
+def connection_closed():
+    inc('connections_closed_total')
+
+# Koneksi ditolak 503 karena server penuh
+def connection_rejected():
+    inc('connections_rejected_total')
+
+
+# `with timed(room.lock, 'perform_action'):` -- lock biasa plus histogram
+# lama menunggu acquire per method (juga span `lock` request, lihat profiling).
+# Jalur tanpa kontensi (acquire non-blocking berhasil) tidak membaca jam sama sekali.
+class timed:
+    __slots__ = ('lock', 'key')
+
+    def __init__(self, lock, method):
+        self.lock = lock
+        self.key = ('lock_wait_seconds', (('method', method),))
+
+    def __enter__(self):
+        if self.lock.acquire(False):
+            histograms = _shard().histograms
+            counts = histograms.get(self.key)
+            if counts is None:
+                counts = histograms[self.key] = [0] * (len(BOUNDS) + 2)
+            counts[0] += 1
+            return self
+        started = time.perf_counter()
+        self.lock.acquire()
+        waited = time.perf_counter() - started
+        observe(*self.key, waited)
+        profiling.add('lock', waited)
+        return self
+
+    def __exit__(self, *exc):
+        self.lock.release()
+
+
+HELP = {
+    'http_requests_total': ('counter', 'Request HTTP per route, method dan status'),
+    'http_request_duration_seconds': ('histogram', 'Lama HttpServer.proses per route'),
+    'lock_wait_seconds': ('histogram', 'Lama menunggu lock room per method GameState'),
+    'connections_opened_total': ('counter', 'Koneksi yang diterima'),
+    'connections_closed_total': ('counter', 'Koneksi yang ditutup'),
+    'connections_rejected_total': ('counter', 'Koneksi yang ditolak karena server penuh'),
+}
+
+
+# Escape nilai label sesuai format teks Prometheus (backslash, kutip ganda, newline)
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _snapshot():
+    total = Shard()
+    with _shards_lock:
+        _collect_dead()
+        _merge(total, _retired)
+        for shard in list(_shards):
+            _merge(total, shard)
+    return total
+
+
+# Teks Prometheus untuk semua metrics proses ini (mode proses: semua
+# worker, tanpa label `pid`) ditambah gauge registry room
+def render(registry=None):
+    if _aggregate_dir is None:
+        total, threads = _snapshot(), threading.active_count()
+        pid = (('pid', os.getpid()),)
+    else:
+        (total, threads), pid = _aggregate(), ()
+    lines = []
+
+    def header(name, kind, help_text):
+        lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+    by_name = {}
+    for (name, labels), value in total.counters.items():
+        by_name.setdefault(name, []).append((labels, value))
+    for name in sorted(by_name):
+        kind, help_text = HELP.get(name, ('counter', name))
+        header(name, kind, help_text)
+        for labels, value in sorted(by_name[name]):
+            lines.append(f"{PREFIX}_{name}{_labels(labels, pid)} {value}")
+
+    by_name = {}
+    for (name, labels), counts in total.histograms.items():
+        by_name.setdefault(name, []).append((labels, counts))
+    for name in sorted(by_name):
+        kind, help_text = HELP.get(name, ('histogram', name))
+        header(name, kind, help_text)
+        for labels, counts in sorted(by_name[name]):
+            cumulative = 0
+            for bound, count in zip(BOUNDS, counts):
+                cumulative += count
+                lines.append(f"{PREFIX}_{name}_bucket{_labels(labels, pid + (('le', f'{bound / 1e6:g}'),))} {cumulative}")
+            cumulative += counts[len(BOUNDS)]
+            lines.append(f"{PREFIX}_{name}_bucket{_labels(labels, pid + (('le', '+Inf'),))} {cumulative}")
+            lines.append(f"{PREFIX}_{name}_sum{_labels(labels, pid)} {counts[-1]:.6f}")
+            lines.append(f"{PREFIX}_{name}_count{_labels(labels, pid)} {cumulative}")
+
+    opened = sum(v for (n, _), v in total.counters.items() if n == 'connections_opened_total')
+    closed = sum(v for (n, _), v in total.counters.items() if n == 'connections_closed_total')
+    gauges = [
+        ('active_connections', 'Koneksi yang sedang terbuka', opened - closed),
+        ('threads', 'Thread aktif (mode proses: semua worker)', threads),
+    ]
+    if registry is not None:
+        gauges.append(('rooms', 'Room per fase game',
+                       {(('phase', phase),): n for phase, n in registry.phase_counts().items()}))
+    gauges.extend((name, help_text, func()) for name, help_text, func in _gauges)
+    for name, help_text, value in gauges:
+        header(name, 'gauge', help_text)
+        if isinstance(value, dict):
+            for labels, v in sorted(value.items()):
+                lines.append(f"{PREFIX}_{name}{_labels(labels, pid)} {v}")
+        else:
+            lines.append(f"{PREFIX}_{name}{_labels((), pid)} {value}")
+    return '\n'.join(lines) + '\n'
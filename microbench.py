@@ -0,0 +1,213 @@
+import os
+import sys
+import json
+import time
+import timeit
+import argparse
+import subprocess
+from multiprocessing.managers import BaseManager
+import game_http_handler
+import game_http_handler_process
+from http_parser import parse_request
+
+# Micro-benchmark jalur panas server, tanpa jaringan: GameState.perform_action,
+# get_state_for_player, parsing HttpServer.proses dan encoding
+# HttpServer.response, untuk mode thread dan mode proses (shared memory).
+# Sebagai pembanding, GameState mode thread yang sama dipanggil lewat proxy
+# BaseManager (cara mode proses berbagi room sebelum shared memory) untuk
+# mengukur ongkos proxy per panggilan terhadap kelas yang sama.
+#
+#   python microbench.py [--baseline bench_results/micro-<commit>.json] [--filter thread.]
+#
+# Keluar dengan kode 1 jika ada benchmark di atas THRESHOLDS_US atau lebih
+# lambat dari baseline * REGRESSION_TOLERANCE.
+ROUNDS = 5                  # ulangan timeit; yang tercepat yang dipakai
+MIN_ROUND_TIME = 0.2        # detik minimum per ulangan (jumlah iterasi dikalibrasi)
+REGRESSION_TOLERANCE = 1.5  # batas relatif terhadap hasil --baseline
+RESULTS_DIR = 'bench_results'
+
+# Batas absolut mikrodetik per panggilan. Sengaja longgar (sekitar 5-10x
+# hasil di mesin pengembang) agar hanya regresi besar yang menggagalkan run;
+# perbandingan yang lebih ketat memakai --baseline.
+THRESHOLDS_US = {
+    'thread.perform_action': 500,
+    'thread.get_state_for_player': 20,
+    'thread.parse_request': 50,
+    'thread.proses_get_state': 300,
+    'thread.proses_post_action': 1000,
+    'thread.response_encode': 200,
+    'process.perform_action': 50,
+    'process.get_state_for_player': 100,
+    'process.parse_request': 50,
+    'process.proses_get_state': 300,
+    'process.proses_post_action': 400,
+    'process.response_encode': 200,
+}
+
+GET_STATE = b"GET /state?player_id=A&match_id=%s HTTP/1.1\r\nHost: localhost\r\n\r\n"
+POST_ACTION = (b"POST /action HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+               b"Content-Length: %d\r\n\r\n%s")
+
+
+# Room dalam fase BATTLE: treasure kedua pemain di pojok kiri atas, jadi
+# galian di pojok kanan bawah selalu meleset dan game tidak pernah selesai
+def battle_room(registry):
+    room, _ = registry.join()
+    registry.join()
+    room.place_treasure('A', 0, 0)
+    room.place_treasure('B', 0, 0)
+    return room
+
+def miss_cell(room):
+    return room.config.grid_size - 1, room.config.grid_size - 1
+
+
+def action_request(room, player_id, y, x):
+    body = json.dumps({'player_id': player_id, 'match_id': room.match_id, 'type': 'dig', 'coords': [y, x]}).encode()
+    return POST_ACTION % (len(body), body)
+
+
+# {nama: (fungsi, panggilan per iterasi)} untuk satu varian server
+def server_benchmarks(server):
+    room = battle_room(server.rooms)
+    y, x = miss_cell(room)
+
+    def perform_action():
+        room.perform_action('A', 'dig', y, x)
+        room.perform_action('B', 'dig', y, x)
+
+    # Giliran A dan B bergantian lewat request HTTP lengkap
+    post_a, post_b = action_request(room, 'A', y, x), action_request(room, 'B', y, x)
+    def proses_post_action():
+        server.proses(post_a)
+        server.proses(post_b)
+
+    get_state = GET_STATE % room.match_id.encode()
+    state = room.get_state_for_player('A')
+    return {
+        'perform_action': (perform_action, 2),
+        'get_state_for_player': (lambda: room.get_state_for_player('A'), 1),
+        'parse_request': (lambda: parse_request(post_a), 1),
+        'proses_get_state': (lambda: server.proses(get_state, block=False), 1),
+        'proses_post_action': (proses_post_action, 2),
+        'response_encode': (lambda: server.response(200, 'OK', state), 1),
+    }
+
+
+class ProxyManager(BaseManager):
+    pass
+
+ProxyManager.register('GameState', game_http_handler.GameState)
+
+# GameState mode thread yang hidup di proses manager, dipanggil lewat proxy
+def proxy_benchmarks(manager):
+    room = manager.GameState('1')
+    room.add_player()
+    room.add_player()
+    room.place_treasure('A', 0, 0)
+    room.place_treasure('B', 0, 0)
+    y = x = game_http_handler.DEFAULT_CONFIG.grid_size - 1
+
+    def perform_action():
+        room.perform_action('A', 'dig', y, x)
+        room.perform_action('B', 'dig', y, x)
+
+    return {
+        'perform_action': (perform_action, 2),
+        'get_state_for_player': (lambda: room.get_state_for_player('A'), 1),
+    }
+
+
+# Mikrodetik per panggilan: ulangan tercepat dari ROUNDS
+def measure(func, calls):
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * MIN_ROUND_TIME / max(elapsed, 1e-9)))
+    best = min(timer.repeat(ROUNDS, number)) / number
+    return best / calls * 1e6
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(selected):
+    results = {}
+
+    def run_group(variant, benchmarks):
+        for name, (func, calls) in benchmarks.items():
+            key = f"{variant}.{name}"
+            if selected and not key.startswith(selected):
+                continue
+            results[key] = round(measure(func, calls), 3)
+            print(f"{key:36} {results[key]:10.3f} us")
+
+    run_group('thread', server_benchmarks(game_http_handler.HttpServer()))
+
+    registry = game_http_handler_process.SharedRoomRegistry(max_rooms=4)
+    try:
+        run_group('process', server_benchmarks(game_http_handler_process.HttpServer(registry)))
+    finally:
+        registry.close()
+
+    if not selected or 'proxy.'.startswith(selected) or selected.startswith('proxy.'):
+        with ProxyManager() as manager:
+            run_group('proxy', proxy_benchmarks(manager))
+    return results
+
+
+# Pelanggaran batas absolut dan regresi terhadap baseline, sebagai daftar teks
+def check(results, baseline):
+    failures = []
+    for key, us in results.items():
+        limit = THRESHOLDS_US.get(key)
+        if limit is not None and us > limit:
+            failures.append(f"{key}: {us:.3f} us > batas {limit} us")
+        old = baseline.get(key)
+        if old and us > old * REGRESSION_TOLERANCE:
+            failures.append(f"{key}: {us:.3f} us > {REGRESSION_TOLERANCE}x baseline {old:.3f} us")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmark GameState dan HttpServer')
+    parser.add_argument('--filter', default='', help="hanya benchmark dengan awalan ini, mis. 'thread.'")
+    parser.add_argument('--baseline', help='file JSON hasil run sebelumnya untuk cek regresi')
+    parser.add_argument('--output', default=RESULTS_DIR, help="folder hasil JSON ('' = tidak ditulis)")
+    args = parser.parse_args()
+
+    results = run(args.filter)
+    # Proxy hanya dibandingkan dengan GameState yang sama dipanggil langsung
+    # (mode thread). Selisihnya = ongkos proxy BaseManager per panggilan;
+    # GameState mode thread juga meng-encode snapshot JSON yang tidak
+    # dilakukan mode proses, jadi membandingkannya dengan mode proses menyesatkan.
+    overhead = {}
+    for name in ('perform_action', 'get_state_for_player'):
+        proxy, direct = results.get(f"proxy.{name}"), results.get(f"thread.{name}")
+        if proxy and direct:
+            overhead[name] = {'us': round(proxy - direct, 3), 'ratio': round(proxy / direct, 1)}
+            print(f"ongkos proxy {name}: +{overhead[name]['us']:.3f} us ({overhead[name]['ratio']}x langsung)")
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results_us']
+    failures = check(results, baseline)
+    for failure in failures:
+        print(f"GAGAL {failure}")
+
+    commit = git_commit()
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+        with open(os.path.join(args.output, f"micro-{commit}.json"), 'w') as f:
+            json.dump({'commit': commit, 'timestamp': round(time.time()), 'python': sys.version.split()[0],
+                       'results_us': results, 'proxy_overhead': overhead, 'failures': failures}, f, indent=2)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import os
+import hmac
+import json
+import time
+import signal
+import cProfile
+import logging
+import itertools
+import threading
+import contextvars
+import tracemalloc
+
+# --- Profiling opt-in untuk server yang sedang berjalan ---
+# cProfile dan tracemalloc bisa dinyalakan/dimatikan tanpa restart, lewat
+# sinyal (SIGUSR1 = cProfile, SIGUSR2 = tracemalloc) atau POST /admin/profile.
+# Saat dimatikan hasilnya ditulis ke PROFILE_DIR untuk dianalisis offline
+# (pstats / tracemalloc.Snapshot.load). Semua state per proses: pada mode
+# proses, sinyal ke setiap worker (endpoint admin hanya mengenai satu worker).
+#
+# Span per request (parse, route, lock, serialize, send) dikumpulkan jika
+# SLOW_REQUEST_MS > 0 dan dilampirkan ke log request yang lebih lambat dari itu.
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')            # '' = /admin/profile mati
+PROFILE_SAMPLE = int(os.environ.get('PROFILE_SAMPLE', 10))     # cProfile 1 dari N request
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 0))  # 0 = span dan log request lambat mati
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 10 # baris alokasi terbesar yang ikut ditulis ke log saat dump
+
+_profile = None # cProfile.Profile aktif
+_profile_lock = threading.Lock() # cProfile hanya boleh aktif di satu thread sekaligus
+_requests = itertools.count()
+_dumps = itertools.count(1) # nomor urut file dump, agar dua dump dalam satu detik tidak saling menimpa
+_spans = contextvars.ContextVar('spans', default=None) # per thread dan per task asyncio
+
+
+def _dump_path(kind, ext):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    return os.path.join(PROFILE_DIR, f"{kind}-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}-{next(_dumps)}.{ext}")
+
+
+# --- cProfile sampling ---
+# Jalankan func(*args), diprofil jika cProfile aktif dan giliran sampel.
+# Request yang kebetulan datang saat thread lain sedang diprofil dilewati.
+def run(func, *args):
+    profile = _profile
+    if profile is None or next(_requests) % PROFILE_SAMPLE or not _profile_lock.acquire(False):
+        return func(*args)
+    try:
+        return profile.runcall(func, *args)
+    finally:
+        _profile_lock.release()
+
+def start_cpu():
+    global _profile
+    if _profile is None:
+        _profile = cProfile.Profile()
+        logging.warning(f"cProfile aktif (1 dari {PROFILE_SAMPLE} request, pid {os.getpid()})")
+
+# Matikan cProfile dan tulis statistiknya. Mengembalikan path dump atau None.
+def stop_cpu():
+    global _profile
+    profile, _profile = _profile, None
+    if profile is None:
+        return None
+    with _profile_lock: # tunggu request yang sedang diprofil selesai
+        path = _dump_path('cpu', 'prof')
+        profile.dump_stats(path)
+    logging.warning(f"cProfile dimatikan, statistik ditulis ke {path}")
+    return path
+
+
+# --- tracemalloc ---
+def start_memory():
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        logging.warning(f"tracemalloc aktif (pid {os.getpid()})")
+
+# Tulis snapshot alokasi saat ini (tracemalloc tetap jalan kecuali stop=True)
+def dump_memory(stop=False):
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot()
+    if stop:
+        tracemalloc.stop()
+    path = _dump_path('memory', 'tracemalloc')
+    snapshot.dump(path)
+    top = '\n'.join(str(stat) for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS])
+    logging.warning(f"Snapshot tracemalloc ditulis ke {path}, alokasi terbesar:\n{top}")
+    return path
+
+
+def status():
+    return {
+        'pid': os.getpid(),
+        'cpu': _profile is not None,
+        'memory': tracemalloc.is_tracing(),
+        'slow_request_ms': SLOW_REQUEST_MS,
+    }
+
+
+# Perintah dari body POST /admin/profile:
+#   {"cpu": "start"|"stop", "memory": "start"|"dump"|"stop", "slow_request_ms": angka}
+# Mengembalikan status ditambah path dump yang ditulis. ValueError jika tidak valid.
+def command(payload):
+    global SLOW_REQUEST_MS
+    dumps = []
+    cpu, memory = payload.get('cpu'), payload.get('memory')
+    if cpu not in (None, 'start', 'stop') or memory not in (None, 'start', 'dump', 'stop'):
+        raise ValueError("cpu: start|stop, memory: start|dump|stop")
+    if 'slow_request_ms' in payload:
+        try:
+            SLOW_REQUEST_MS = max(0.0, float(payload['slow_request_ms']))
+        except (TypeError, ValueError):
+            raise ValueError("slow_request_ms harus berupa angka")
+    if cpu == 'start':
+        start_cpu()
+    elif cpu == 'stop':
+        dumps.append(stop_cpu())
+    if memory == 'start':
+        start_memory()
+    elif memory in ('dump', 'stop'):
+        dumps.append(dump_memory(stop=memory == 'stop'))
+    return dict(status(), dumps=[path for path in dumps if path])
+
+
+def authorized(headers):
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(headers.get('x-profile-token', ''), PROFILE_TOKEN)
+
+
+# --- Sinyal ---
+def toggle_cpu():
+    if _profile is None:
+        start_cpu()
+    else:
+        stop_cpu()
+
+def toggle_memory():
+    if tracemalloc.is_tracing():
+        dump_memory(stop=True)
+    else:
+        start_memory()
+
+# Handler sinyal jalan di thread utama, yang pada engine asyncio juga sedang
+# melayani request (mungkin sambil memegang _profile_lock), jadi pekerjaannya
+# dipindah ke thread lain. Dipanggil dari thread utama setiap proses yang
+# melayani request (mode proses: di setiap worker, bukan di proses utama).
+def install_signals():
+    for signum, action in ((signal.SIGUSR1, toggle_cpu), (signal.SIGUSR2, toggle_memory)):
+        signal.signal(signum, lambda *_, action=action: threading.Thread(target=action, daemon=True).start())
+
+
+# --- Span per request ---
+# Mulai kumpulkan span untuk request yang baru di-parse. Mengembalikan dict
+# span, atau None jika log request lambat mati (engine melewati semuanya).
+def begin(parse_started, started):
+    if not SLOW_REQUEST_MS:
+        return None
+    spans = {'parse': started - parse_started}
+    _spans.set(spans)
+    return spans
+
+# Tambah durasi ke span request yang sedang diproses thread/task ini
+def add(name, seconds):
+    spans = _spans.get()
+    if spans is not None:
+        spans[name] = spans.get(name, 0.0) + seconds
+
+def current():
+    return _spans.get()
+
+# Lanjutkan span request yang diparkir (long-poll) di thread lain
+def attach(spans):
+    _spans.set(spans)
+
+
+# Request selesai dikirim. `started` = awal proses (sesudah parse),
+# `sent` = awal sendall/write. Waktu long-poll menunggu perubahan (span
+# `wait`) tidak dihitung sebagai lambat.
+def finish(spans, address, request, response, started, sent):
+    if spans is None:
+        return
+    _spans.set(None)
+    now = time.perf_counter()
+    spans['send'] = now - sent
+    spans['route'] = max(0.0, sent - started - spans.get('lock', 0.0) - spans.get('serialize', 0.0) - spans.get('wait', 0.0))
+    total = spans['parse'] + (now - started) - spans.get('wait', 0.0)
+    if total * 1000 < SLOW_REQUEST_MS:
+        return
+    record = {
+        'client': address[0] if isinstance(address, tuple) else address,
+        'method': request.method,
+        'path': request.target,
+        'status': int(response[9:12]) if response[9:12].isdigit() else 0,
+        'ms': round(total * 1000, 2),
+        'spans_ms': {name: round(value * 1000, 3) for name, value in spans.items()},
+    }
+    logging.warning("Request lambat: %s", json.dumps(record))
@@ -0,0 +1,35 @@
+import os
+import sys
+import logging
+
+# Pilih engine server lewat argumen atau environment variable SERVER_ENGINE:
+#   thread  -> server.py (thread pool)
+#   process -> server_process_http.py (multiprocessing)
+#   async   -> server_async.py (event loop asyncio)
+ENGINES = ('thread', 'process', 'async')
+DEFAULT_ENGINE = 'thread'
+
+
+def main():
+    engine = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('SERVER_ENGINE', DEFAULT_ENGINE)
+    engine = engine.strip().lower()
+    if engine not in ENGINES:
+        print(f"Engine tidak dikenal: {engine}. Pilihan: {', '.join(ENGINES)}")
+        sys.exit(1)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.warning(f"Menjalankan server dengan engine '{engine}'")
+
+    if engine == 'thread':
+        import server
+        server.main()
+    elif engine == 'process':
+        import server_process_http
+        server_process_http.main()
+    else:
+        import server_async
+        server_async.main()
+
+
+if __name__ == "__main__":
+    main()
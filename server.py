@@ -1,7 +1,15 @@
+import os
 import socket
 import threading
 import logging
 from game_http_handler import HttpServer
+import server_binary
+import game_log
+import access_log
+import profiling
+import metrics
+from connections import ConnectionPool
+from http_parser import set_connection_header
 
 # Setup logging
 logging.basicConfig(level=logging.WARNING,
@@ -21,82 +29,56 @@ def get_local_ip():
         return "127.0.0.1"
 
 
-class ProcessTheClient(threading.Thread):
-    def __init__(self, connection, address, server_ref):
-        super().__init__()
-        self.connection = connection
-        self.address = address
-        self.server_ref = server_ref
-
-    def run(self):
-        rcv = ""
-        self.connection.settimeout(5.0)
-        while True:
-            try:
-                data = self.connection.recv(4096)
-                if data:
-                    d = data.decode('utf-8')
-                    rcv += d
-
-                    if "\r\n\r\n" in rcv:
-                        headers_part, _, body_part = rcv.partition('\r\n\r\n')
-                        content_length_header = [h for h in headers_part.split('\r\n') if h.lower().startswith('content-length:')]
-                        if content_length_header:
-                            content_length = int(content_length_header[0].split(':')[-1].strip())
-                            if len(body_part.encode('utf-8')) < content_length:
-                                continue
-
-                        logging.warning(f"Data dari client {self.address}: {rcv.strip()}")
-                        hasil = httpserver.proses(rcv)
-                        separator = b'\r\n\r\n'
-                        header = hasil.split(separator)[0]
-                        logging.warning(f"Balas ke client {self.address}: {header}...")
-                        self.connection.sendall(hasil)
-                        break
-                else:
-                    break
-            except socket.timeout:
-                logging.warning(f"Connection from {self.address} timed out.")
-                break
-            except Exception as e:
-                logging.error(f"Error processing client {self.address}: {e}")
-                break
-
-        self.connection.close()
-        logging.warning(f"Connection from {self.address} closed.")
-        self.server_ref.remove_client(self)
+# --- Konfigurasi thread pool ---
+# Thread pool hanya memproses request yang datanya sudah tiba; koneksi
+# keep-alive dan long-poll yang menunggu diparkir (lihat connections.py),
+# jadi jumlah koneksi dibatasi MAX_CONNECTIONS, bukan jumlah thread.
+POOL_SIZE = int(os.environ.get('POOL_SIZE', 32))              # jumlah thread worker tetap
+MAX_CONNECTIONS = int(os.environ.get('MAX_CONNECTIONS', 768)) # koneksi terbuka maksimum (jaga di bawah ulimit -n)
+ACCEPT_QUEUE_SIZE = 256  # koneksi siap proses yang boleh antre menunggu thread
+RETRY_AFTER = 1          # detik, dikirim di header Retry-After saat server penuh
 
 
 class Server(threading.Thread):
-    def __init__(self, port=8889):
+    def __init__(self, port=8889, pool_size=POOL_SIZE, max_connections=MAX_CONNECTIONS, queue_size=ACCEPT_QUEUE_SIZE):
         super().__init__()
-        self.the_clients = []
         self.port = port
+        self.pool_size = pool_size
+        self.max_connections = max_connections
+        self.queue_size = queue_size
+        self.pool = None
         self.my_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.my_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
-    def remove_client(self, client_thread):
-        if client_thread in self.the_clients:
-            self.the_clients.remove(client_thread)
-            logging.warning(f"Client {client_thread.address} dihapus dari daftar aktif.")
-
-    def print_active_clients(self):
-        active_ips = [str(client.address[0]) for client in self.the_clients if client.is_alive()]
-        logging.warning(f"Daftar client aktif: {', '.join(active_ips)}")
+    # Server penuh: tolak dengan 503 + Retry-After daripada menumpuk koneksi.
+    # Jalur ini harus murah justru saat server kelebihan beban: penolakan
+    # dihitung di metrics (connections_rejected_total), log hanya di DEBUG.
+    def reject(self, connection, client_address):
+        metrics.connection_rejected()
+        logging.debug("Server penuh, menolak %s", client_address)
+        hasil = httpserver.response(503, 'Service Unavailable', {'error': 'Server sedang penuh, coba lagi nanti'},
+                                    headers={'Retry-After': str(RETRY_AFTER)})
+        try:
+            connection.settimeout(0.5)
+            connection.sendall(set_connection_header(hasil, False))
+        except OSError:
+            pass
+        connection.close()
 
     def run(self):
         self.my_socket.bind(('0.0.0.0', self.port))
-        self.my_socket.listen(5)
-        logging.warning(f"Server berjalan di port {self.port}")
+        self.my_socket.listen(128)
+        logging.warning(f"Server berjalan di port {self.port} dengan {self.pool_size} worker")
+        self.pool = ConnectionPool(httpserver, self.pool_size, self.max_connections)
 
         while True:
             try:
                 connection, client_address = self.my_socket.accept()
-                logging.warning(f"Koneksi baru dari {client_address}")
-                clt = ProcessTheClient(connection, client_address, self)
-                clt.start()
-                self.the_clients.append(clt)
-                self.print_active_clients()
+                logging.debug("Koneksi baru dari %s", client_address)
+                if self.pool.full() or self.pool.backlog() >= self.queue_size:
+                    self.reject(connection, client_address)
+                else:
+                    self.pool.add(connection, client_address)
             except KeyboardInterrupt:
                 logging.warning("Server dihentikan oleh pengguna.")
                 break
@@ -106,6 +88,11 @@ class Server(threading.Thread):
 
 
 def main():
+    access_log.setup()
+    profiling.install_signals()
+    game_log.start(httpserver.rooms)
+    binary = server_binary.start(httpserver.rooms)
+    httpserver.binary_port = binary.port if binary else None
     svr = Server(port=8889)
     svr.start()
 
@@ -0,0 +1,174 @@
+import json
+import time
+import asyncio
+import logging
+from game_http_handler import HttpServer
+import server_binary
+import game_log
+import access_log
+import metrics
+import profiling
+from websocket import FrameParser, WebSocketError, encode_frame, handshake_response, IDLE_TIMEOUT, OP_TEXT, OP_CLOSE, OP_PING, OP_PONG
+from http_parser import RequestParser, HttpParseError, set_connection_header, KEEPALIVE_TIMEOUT, MAX_KEEPALIVE_REQUESTS, RECV_SIZE
+
+# Engine berbasis event loop asyncio: satu thread melayani ribuan koneksi
+# keep-alive/idle. Routing tetap memakai HttpServer.proses yang sama dengan
+# server.py; method GameState hanya memegang lock sebentar sehingga aman
+# dipanggil langsung dari event loop, kecuali long-poll yang ditunggu secara async.
+class AsyncServer:
+    def __init__(self, port=8889, httpserver=None):
+        self.port = port
+        self.httpserver = httpserver if httpserver is not None else HttpServer()
+
+    # Long-poll /state?since=N ditunggu di event loop (bukan dengan memblokir
+    # thread) memakai watcher GameState yang membangunkan Event lewat
+    # call_soon_threadsafe.
+    async def wait_for_change(self, request):
+        if request.method != 'GET':
+            return
+        long_poll = self.httpserver.parse_long_poll(request.target)
+        if not long_poll:
+            return
+        room, since, timeout = long_poll
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+        notify = lambda: loop.call_soon_threadsafe(changed.set)
+        if not room.add_watcher(notify, since):
+            return
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            room.remove_watcher(notify)
+
+    # Sesi WebSocket di event loop: task pusher menunggu watcher GameState,
+    # loop utama membaca pesan aksi dari klien
+    async def serve_websocket(self, reader, writer, request, room, player_id, buffered):
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+        notify = lambda: loop.call_soon_threadsafe(changed.set)
+
+        async def push_changes(version):
+            while True:
+                changed.clear()
+                if room.add_watcher(notify, version):
+                    try:
+                        await changed.wait()
+                    finally:
+                        room.remove_watcher(notify)
+                version, body = self.httpserver.encode_delta(room, player_id, version)
+                writer.write(encode_frame(body))
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    return
+
+        writer.write(handshake_response(request.headers['sec-websocket-key']))
+        version, body = room.get_encoded_state(player_id)
+        writer.write(encode_frame(body))
+        await writer.drain()
+        pusher = asyncio.ensure_future(push_changes(version))
+        parser = FrameParser()
+        parser.feed(buffered)
+        try:
+            while True:
+                message = parser.next_message()
+                if message is None:
+                    data = await asyncio.wait_for(reader.read(RECV_SIZE), IDLE_TIMEOUT)
+                    if not data:
+                        break
+                    parser.feed(data)
+                    continue
+                opcode, payload = message
+                if opcode == OP_CLOSE:
+                    writer.write(encode_frame(payload[:2], OP_CLOSE))
+                    break
+                if opcode == OP_PING:
+                    writer.write(encode_frame(payload, OP_PONG))
+                elif opcode == OP_TEXT:
+                    result = self.httpserver.websocket_message(room, player_id, payload)
+                    writer.write(encode_frame(json.dumps({'result': result}), OP_TEXT))
+                await writer.drain()
+        except WebSocketError as e:
+            logging.warning(f"WebSocket {player_id}@{room.match_id} ditutup: {e}")
+        finally:
+            pusher.cancel()
+
+    async def handle_client(self, reader, writer):
+        address = writer.get_extra_info('peername')
+        metrics.connection_opened()
+        parser = RequestParser()
+        served = 0
+        try:
+            while True:
+                parse_started = time.perf_counter()
+                request = parser.next_request()
+                if request is None:
+                    data = await asyncio.wait_for(reader.read(RECV_SIZE), KEEPALIVE_TIMEOUT)
+                    if not data:
+                        break
+                    parser.feed(data)
+                    continue
+
+                served += 1
+                keep_alive = request.keep_alive and served < MAX_KEEPALIVE_REQUESTS
+                started = time.perf_counter()
+
+                websocket = self.httpserver.parse_websocket(request)
+                if websocket:
+                    await self.serve_websocket(reader, writer, request, *websocket, parser.detach())
+                    break
+                spans = profiling.begin(parse_started, started)
+                await self.wait_for_change(request)
+                if spans is not None:
+                    spans['wait'] = time.perf_counter() - started
+                hasil = self.httpserver.proses(request, block=False)
+                hasil = set_connection_header(hasil, keep_alive)
+                sent = time.perf_counter()
+                writer.write(hasil)
+                await writer.drain()
+                access_log.log_request(address, request, hasil, started)
+                profiling.finish(spans, address, request, hasil, started, sent)
+                if not keep_alive:
+                    break
+        except HttpParseError as e:
+            hasil = self.httpserver.response(e.code, e.message, {'error': e.message})
+            writer.write(set_connection_header(hasil, False))
+        except asyncio.TimeoutError:
+            # Argumen lazy: string hanya dibuat jika level DEBUG aktif
+            logging.debug("Connection from %s timed out.", address)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logging.error(f"Error processing client {address}: {e}")
+        finally:
+            metrics.connection_closed()
+            writer.close()
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_client, '0.0.0.0', self.port, backlog=1024)
+        logging.warning(f"Async server berjalan di port {self.port}")
+        async with server:
+            await server.serve_forever()
+
+    def start(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            logging.warning("Server dihentikan oleh pengguna.")
+
+
+def main():
+    svr = AsyncServer(port=8889)
+    access_log.setup()
+    profiling.install_signals()
+    game_log.start(svr.httpserver.rooms)
+    binary = server_binary.start(svr.httpserver.rooms)
+    svr.httpserver.binary_port = binary.port if binary else None
+    svr.start()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
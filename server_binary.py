@@ -0,0 +1,163 @@
+import socket
+import struct
+import logging
+import threading
+from collections import OrderedDict
+from binary_protocol import (
+    FrameParser, ProtocolError, encode_frame, encode_config, decode_config, pack_state,
+    BINARY_PORT, NO_VERSION, PLAYERS, ACTIONS,
+    MSG_JOIN, MSG_PLACE, MSG_ACTION, MSG_STATE,
+    MSG_JOINED, MSG_RESULT, MSG_SNAPSHOT, MSG_NOT_MODIFIED, MSG_ERROR,
+    JOINED, PLACE, ACTION, STATE_REQUEST, RESULT, NOT_MODIFIED, ERROR,
+)
+from game_config import config_from_dict
+from http_parser import RECV_SIZE
+
+# --- Konfigurasi server protokol biner ---
+MAX_CONNECTIONS = 256  # koneksi biner simultan (satu thread per koneksi)
+IDLE_TIMEOUT = 120     # detik koneksi persisten boleh diam
+SNAPSHOT_CACHE = 256   # snapshot ter-pack yang disimpan, {(match_id, version, pemain): bytes}
+MAX_WAIT = 60          # detik maksimum MSG_STATE menunggu perubahan
+
+
+# Server TCP untuk protokol biner (binary_protocol.py). Memakai registry
+# room yang sama dengan engine HTTP, jadi pemain HTTP dan biner bisa
+# bermain di room yang sama.
+class BinaryServer(threading.Thread):
+    def __init__(self, registry, port=BINARY_PORT, max_connections=MAX_CONNECTIONS):
+        super().__init__(daemon=True)
+        self.rooms = registry
+        self.port = port
+        self.slots = threading.BoundedSemaphore(max_connections)
+        self.snapshots = OrderedDict()
+        self.snapshots_lock = threading.Lock()
+        self.my_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.my_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Bind di sini, bukan di run(): port yang terpakai gagal di pemanggil
+        # sebelum port ini diiklankan lewat /protocol
+        try:
+            self.my_socket.bind(('0.0.0.0', port))
+            self.my_socket.listen(128)
+        except OSError:
+            self.my_socket.close()
+            raise
+
+    def run(self):
+        logging.warning(f"Server protokol biner berjalan di port {self.port}")
+        while True:
+            self.slots.acquire()
+            try:
+                connection, address = self.my_socket.accept()
+            except OSError as e:
+                logging.error(f"Server biner berhenti: {e}")
+                self.slots.release()
+                break
+            clt = threading.Thread(target=self.serve_connection, args=(connection, address), daemon=True)
+            clt.start()
+
+    def serve_connection(self, connection, address):
+        parser = FrameParser()
+        connection.settimeout(IDLE_TIMEOUT)
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while True:
+                frame = parser.next_frame()
+                if frame is None:
+                    data = connection.recv(RECV_SIZE)
+                    if not data:
+                        break
+                    parser.feed(data)
+                    continue
+                connection.sendall(self.handle(*frame))
+        except ProtocolError as e:
+            connection.sendall(self.error(400, str(e)))
+        except socket.timeout:
+            pass
+        except Exception as e:
+            logging.error(f"Error processing binary client {address}: {e}")
+        finally:
+            connection.close()
+            self.slots.release()
+
+    def error(self, code, message):
+        return encode_frame(MSG_ERROR, ERROR.pack(code) + message.encode('utf-8'))
+
+    def result(self, result):
+        payload = RESULT.pack(bool(result.get('success'))) + result.get('message', '').encode('utf-8')
+        return encode_frame(MSG_RESULT, payload)
+
+    # Satu frame request -> satu frame response
+    def handle(self, msg_type, payload):
+        try:
+            if msg_type == MSG_JOIN:
+                return self.handle_join(payload)
+            if msg_type == MSG_PLACE:
+                match_no, player, y, x = PLACE.unpack_from(payload)
+                room = self.rooms.get_room(match_no)
+                if room is None:
+                    return self.error(404, 'Match tidak ditemukan')
+                if room.place_treasure(PLAYERS[player], y, x):
+                    return self.result({'success': True})
+                return self.result({'success': False, 'message': 'Penempatan tidak valid'})
+            if msg_type == MSG_ACTION:
+                match_no, player, action, y, x, treasure = ACTION.unpack_from(payload)
+                room = self.rooms.get_room(match_no)
+                if room is None:
+                    return self.error(404, 'Match tidak ditemukan')
+                return self.result(room.perform_action(PLAYERS[player], ACTIONS[action], y, x, treasure))
+            if msg_type == MSG_STATE:
+                return self.handle_state(payload)
+        except (struct.error, IndexError):
+            return self.error(400, 'Payload tidak valid')
+        return self.error(400, 'Tipe pesan tidak dikenal')
+
+    def handle_join(self, payload):
+        try:
+            config = config_from_dict(decode_config(payload)._asdict())
+        except ValueError as e:
+            return self.error(400, str(e))
+        if not self.rooms.supports(config):
+            return self.error(400, 'Konfigurasi tidak didukung server ini')
+        room, player_id = self.rooms.join(config)
+        if room is None:
+            return self.error(403, 'Semua room penuh')
+        return encode_frame(MSG_JOINED, JOINED.pack(int(room.match_id), PLAYERS.index(player_id)) + encode_config(config))
+
+    def handle_state(self, payload):
+        match_no, player, since, timeout_ms = STATE_REQUEST.unpack_from(payload)
+        room = self.rooms.get_room(match_no)
+        if room is None:
+            return self.error(404, 'Match tidak ditemukan')
+        if since != NO_VERSION and not room.wait_for_change(since, min(timeout_ms / 1000, MAX_WAIT)):
+            return encode_frame(MSG_NOT_MODIFIED, NOT_MODIFIED.pack(since))
+        player_id = PLAYERS[player]
+        key = (room.match_id, room.version, player_id)
+        with self.snapshots_lock:
+            body = self.snapshots.get(key)
+        if body is None:
+            state = room.get_state_for_player(player_id)
+            body = encode_frame(MSG_SNAPSHOT, pack_state(state))
+            with self.snapshots_lock:
+                self.snapshots[(room.match_id, state['version'], player_id)] = body
+                while len(self.snapshots) > SNAPSHOT_CACHE:
+                    self.snapshots.popitem(last=False)
+        return body
+
+
+# Server biner yang sudah bind ke port-nya, atau None jika BINARY_PORT 0
+# atau port tidak bisa dipakai (engine HTTP tetap jalan tanpa protokol biner)
+def create(registry, port=BINARY_PORT):
+    if not port:
+        return None
+    try:
+        return BinaryServer(registry, port)
+    except OSError as e:
+        logging.error(f"Server protokol biner tidak dijalankan, port {port} gagal dipakai: {e}")
+        return None
+
+# Jalankan server biner di thread latar. Mengembalikan server-nya atau None.
+def start(registry, port=BINARY_PORT):
+    svr = create(registry, port)
+    if svr is not None:
+        svr.start()
+    return svr
@@ -1,107 +1,199 @@
+import os
+import shutil
+import signal
+import tempfile
 import socket
+import select
 import logging
-from multiprocessing import Process, Lock
-from multiprocessing.managers import BaseManager
-from game_http_handler_process import HttpServer, GameState
+import threading
+from multiprocessing.connection import wait
+from game_http_handler_process import HttpServer, SharedRoomRegistry, FORK
+import server_binary
+import game_log
+import access_log
+import metrics
+import profiling
+from connections import ConnectionPool
 
-class GameStateManagerServer(BaseManager):
-    pass
+# --- Konfigurasi worker pool (prefork) ---
+WORKER_COUNT = int(os.environ.get('WORKERS', os.cpu_count() or 1))
+MAX_REQUESTS_PER_WORKER = int(os.environ.get('MAX_REQUESTS_PER_WORKER', 10000)) # worker di-restart setelah melayani sebanyak ini
+WORKER_THREADS = int(os.environ.get('WORKER_THREADS', 8))            # thread pool per worker (request yang sedang diproses)
+WORKER_CONNECTIONS = int(os.environ.get('WORKER_CONNECTIONS', 512))  # koneksi terbuka maksimum per worker
+ACCEPT_POLL = 1.0 # detik antar pengecekan drain saat menunggu koneksi baru
 
-GameStateManagerServer.register('GameState', GameState)
-GameStateManagerServer.register('Lock', Lock)
 
-class ProcessTheClient(Process):
-    def __init__(self, connection, address, httpserver):
-        self.connection = connection
-        self.address = address
+# Worker berumur panjang: menerima koneksi langsung dari socket listen yang
+# diwarisi dari proses utama dan melayaninya dengan ConnectionPool (thread
+# pool + Parker), jadi koneksi keep-alive dan long-poll yang menunggu tidak
+# memegang thread. Setelah max_requests tercapai worker berhenti menerima
+# koneksi baru dan memberi tahu proses utama lewat pipe agar pengganti
+# langsung dijalankan, lalu menunggu koneksi yang sedang berjalan (termasuk
+# sesi WebSocket) selesai sebelum keluar.
+class Worker(FORK.Process):
+    def __init__(self, listen_socket, httpserver, max_requests=MAX_REQUESTS_PER_WORKER,
+                 threads=WORKER_THREADS, connections=WORKER_CONNECTIONS):
+        super().__init__(daemon=True)
+        self.listen_socket = listen_socket
         self.httpserver = httpserver
-        super().__init__()
+        self.max_requests = max_requests
+        self.threads = threads
+        self.connections = connections
+        self.drain_reader, self.drain_writer = FORK.Pipe(duplex=False)
 
     def run(self):
-        rcv = ""
-        # Set timeout pada socket untuk mencegah proses macet
-        self.connection.settimeout(5.0)
-        while True:
+        access_log.setup() # thread penulis access log tidak ikut ter-fork
+        metrics.reset()
+        profiling.install_signals()
+        self.served = 0
+        self.served_lock = threading.Lock()
+        self.draining = False
+        self.pool = pool = ConnectionPool(self.httpserver, self.threads, self.connections, on_request=self.count_request)
+
+        while not self.draining:
+            pool.wait_for_slot()
+            # accept() yang sedang menunggu tidak terbangun saat drain dimulai
+            if not select.select([self.listen_socket], [], [], ACCEPT_POLL)[0]:
+                continue
             try:
-                data = self.connection.recv(4096)
-                if data:
-                    d = data.decode('utf-8')
-                    rcv += d
-
-                    # Cek jika header sudah lengkap diterima
-                    if "\r\n\r\n" in rcv:
-                        headers_part, _, body_part = rcv.partition('\r\n\r\n')
-                        content_length_header = [h for h in headers_part.split('\r\n') if h.lower().startswith('content-length:')]
-
-                        if content_length_header:
-                            content_length = int(content_length_header[0].split(':')[-1].strip())
-                            if len(body_part.encode('utf-8')) < content_length:
-                                continue # Body belum lengkap, tunggu lagi
-
-                        # LOGGING 
-                        logging.warning(f"Data dari client {self.address}: {rcv.strip()}")
-                        hasil = self.httpserver.proses(rcv)
-                        
-                        header, _, _ = hasil.partition(b'\r\n\r\n')
-                        logging.warning(f"Balas ke client {self.address}: {header.decode()}...")
-                        
-                        self.connection.sendall(hasil)
-                        break
-                else:
-                    break
-            except socket.timeout:
-                logging.warning(f"Connection from {self.address} timed out.")
-                break
-            except Exception as e:
-                logging.error(f"Error processing client {self.address}: {e}")
+                connection, client_address = self.listen_socket.accept()
+            except OSError as e:
+                logging.error(f"Worker {self.pid} gagal accept: {e}")
                 break
-        
-        logging.warning(f"Connection from {self.address} closed.")
-        self.connection.close()
+            logging.debug("Connection from %s (worker %s)", client_address, self.pid)
+            pool.add(connection, client_address)
+
+        # Tunggu semua koneksi (termasuk yang idle dan sesi WebSocket)
+        # selesai sebelum keluar, lihat ConnectionPool.drain
+        pool.wait_closed()
+        metrics.publish()
+        logging.warning(f"Worker {self.pid} selesai setelah {self.served} request.")
+
+    def count_request(self):
+        with self.served_lock:
+            self.served += 1
+            if self.served >= self.max_requests and not self.draining:
+                self.draining = True
+                self.drain_writer.send(self.served)
+                self.pool.drain()
+
+
+# Server protokol biner di proses anak sendiri, langsung ke shared memory.
+# Proses utama harus tetap satu thread: thread biner di sana bisa sedang
+# memegang lock (metrics, room) saat worker pengganti di-fork, dan anak
+# yang mewarisi lock itu akan deadlock. Socket-nya sudah di-bind proses
+# utama (server_binary.create), jadi pengganti memakai socket yang sama.
+class BinaryWorker(FORK.Process):
+    def __init__(self, server):
+        super().__init__(daemon=True)
+        self.server = server
+
+    def run(self):
+        metrics.reset()
+        profiling.install_signals()
+        self.server.run()
 
 
 class Server:
-    def __init__(self, httpserver):
-        self.the_clients = []
+    def __init__(self, httpserver, port=8889, workers=WORKER_COUNT, max_requests=MAX_REQUESTS_PER_WORKER,
+                 binary_server=None):
         self.httpserver = httpserver
+        self.port = port
+        self.worker_count = workers
+        self.max_requests = max_requests
+        self.binary_server = binary_server # server_binary.BinaryServer yang sudah bind, dijalankan di BinaryWorker
+        self.binary = None
+        self.workers = []
+        self.retiring = [] # worker yang sedang drain, sudah punya pengganti
         self.my_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.my_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
+    def spawn_worker(self):
+        worker = Worker(self.my_socket, self.httpserver, self.max_requests)
+        worker.start()
+        return worker
+
+    def spawn_binary(self):
+        binary = BinaryWorker(self.binary_server)
+        binary.start()
+        return binary
+
+    def reap(self, worker):
+        worker.join()
+        metrics.retire(worker.pid)
+        worker.drain_reader.close()
+        worker.drain_writer.close()
+
     def start(self):
-        self.my_socket.bind(('0.0.0.0', 8889))
-        self.my_socket.listen(10)
-        logging.warning("Server listening on port 8889")
-        while True:
-            try:
-                connection, client_address = self.my_socket.accept()
-                # --- LOGGING DITAMBAHKAN ---
-                logging.warning(f"Connection from {client_address}")
-
-                clt = ProcessTheClient(connection, client_address, self.httpserver)
-                clt.start()
-                self.the_clients.append(clt)
-            except KeyboardInterrupt:
-                logging.warning("Server shutting down.")
-                break
-            except Exception as e:
-                logging.error(f"Error in server loop: {e}")
-                break
-        self.my_socket.close()
+        self.my_socket.bind(('0.0.0.0', self.port))
+        self.my_socket.listen(128)
+        logging.warning(f"Server listening on port {self.port} dengan {self.worker_count} worker")
+        metrics.register_gauge('worker_processes', 'Proses worker HTTP', lambda: self.worker_count)
+        self.workers = [self.spawn_worker() for _ in range(self.worker_count)]
+        if self.binary_server is not None:
+            self.binary = self.spawn_binary()
+        children = lambda: self.workers + self.retiring + ([self.binary] if self.binary else [])
+        try:
+            while True:
+                # Tunggu worker mulai drain (restart terjadwal) atau keluar
+                # (crash), lalu jalankan pengganti
+                wait([w.sentinel for w in children()] + [w.drain_reader for w in self.workers])
+                for i, worker in enumerate(self.workers):
+                    if worker.drain_reader.poll():
+                        worker.drain_reader.recv()
+                        logging.warning(f"Worker {worker.pid} berhenti menerima koneksi, menjalankan pengganti.")
+                        self.retiring.append(worker)
+                    elif not worker.is_alive():
+                        self.reap(worker)
+                        logging.warning(f"Worker {worker.pid} keluar (exitcode {worker.exitcode}), menjalankan pengganti.")
+                    else:
+                        continue
+                    self.workers[i] = self.spawn_worker()
+                for worker in [w for w in self.retiring if not w.is_alive()]:
+                    self.retiring.remove(worker)
+                    self.reap(worker)
+                if self.binary and not self.binary.is_alive():
+                    self.binary.join()
+                    metrics.retire(self.binary.pid)
+                    logging.warning(f"Server biner {self.binary.pid} keluar (exitcode {self.binary.exitcode}), menjalankan pengganti.")
+                    self.binary = self.spawn_binary()
+        except KeyboardInterrupt:
+            logging.warning("Server shutting down.")
+        finally:
+            for child in children():
+                child.terminate()
+            for child in children():
+                child.join()
+            self.my_socket.close()
 
 def main():
-    game_state_manager = GameStateManagerServer()
-    game_state_manager.start()
-    lock = game_state_manager.Lock()
-    shared_game_state = game_state_manager.GameState(lock=lock)
-    httpserver_instance = HttpServer(shared_game_state)
-    svr = Server(httpserver_instance)
-    
+    # State semua room tinggal di shared memory; worker membacanya
+    # langsung tanpa round trip IPC ke proses manager
+    registry = SharedRoomRegistry()
+    # Proses utama tidak melayani request dan tidak boleh memulai thread
+    # (handler sinyal profiling memakai thread); worker dan server biner
+    # memasang handler-nya sendiri
+    for signum in (signal.SIGUSR1, signal.SIGUSR2):
+        signal.signal(signum, signal.SIG_IGN)
+    # Metrics setiap worker dijumlahkan lewat direktori ini (lihat metrics.aggregate_in)
+    metrics_dir = tempfile.mkdtemp(prefix='treasure-metrics-')
+    metrics.aggregate_in(metrics_dir)
+    # Room dari log game dipulihkan ke shared memory sebelum worker di-fork
+    game_log.start(registry)
+    httpserver_instance = HttpServer(registry)
+    # Port biner di-bind di sini agar /protocol hanya mengiklankannya jika
+    # bind berhasil; thread-nya tidak dijalankan di proses utama
+    binary = server_binary.create(registry)
+    httpserver_instance.binary_port = binary.port if binary else None
+    svr = Server(httpserver_instance, binary_server=binary)
+
     try:
         svr.start()
     finally:
-        logging.warning("Shutting down game state manager.")
-        game_state_manager.shutdown()
+        logging.warning("Releasing shared game state.")
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        registry.close()
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
-    main()
\ No newline at end of file
+    main()
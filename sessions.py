@@ -0,0 +1,120 @@
+import time
+import secrets
+import threading
+from game_config import PLAYER_IDS
+
+# --- Session token pemain ---
+# /join memberi setiap pemain token; klien yang terputus mengirim token itu
+# lagi ke /join dan kembali ke kursinya (room + player_id yang sama).
+SESSION_TTL = 600 # detik token berlaku sejak terakhir dipakai (join/place/action)
+WHEEL_TICK = 10   # resolusi roda TTL dalam detik
+
+
+# Index token -> (match_id, player_id) untuk registry mode thread/asyncio.
+# Kedaluwarsa diatur roda TTL: token ada di slot tick terakhir dipakai, dan
+# setiap tick yang lewat satu slot dikosongkan, jadi issue/resume/touch dan
+# pembersihan token semuanya O(1) (amortized), tanpa memindai semua session.
+class SessionStore:
+    def __init__(self, ttl=SESSION_TTL, tick=WHEEL_TICK):
+        self.lock = threading.Lock()
+        self.tick = tick
+        self.tokens = {} # {token: [match_id, player_id, indeks slot roda]}
+        self.seats = {}  # {(match_id, player_id): token}
+        self.wheel = [set() for _ in range(-(-ttl // tick) + 1)]
+        self.position = self._now()
+
+    def _now(self):
+        return int(time.monotonic() // self.tick)
+
+    # Kosongkan slot untuk setiap tick yang sudah lewat sejak pemanggilan terakhir
+    def _advance(self):
+        now = self._now()
+        for t in range(self.position + 1, min(now, self.position + len(self.wheel)) + 1):
+            slot = self.wheel[t % len(self.wheel)]
+            for token in slot:
+                match_id, player_id, _ = self.tokens.pop(token)
+                if self.seats.get((match_id, player_id)) == token:
+                    del self.seats[(match_id, player_id)]
+            slot.clear()
+        self.position = max(self.position, now)
+
+    def _place(self, token, entry):
+        self.wheel[entry[2]].discard(token)
+        entry[2] = self.position % len(self.wheel)
+        self.wheel[entry[2]].add(token)
+
+    def _add(self, token, match_id, player_id):
+        seat = (match_id, player_id)
+        old = self.seats.get(seat)
+        if old is not None: # kursi dipakai pemain baru (mis. room di-reset)
+            self.wheel[self.tokens.pop(old)[2]].discard(old)
+        entry = self.tokens[token] = [match_id, player_id, 0]
+        self.seats[seat] = token
+        self._place(token, entry)
+
+    # Token juga disimpan di room (dan log game-nya), lihat restore
+    def issue(self, room, player_id):
+        token = secrets.token_urlsafe(16)
+        with self.lock:
+            self._advance()
+            self._add(token, room.match_id, player_id)
+        room.set_session(player_id, token)
+        return token
+
+    # Daftarkan lagi token room yang dipulihkan dari log game; TTL mulai dari sekarang
+    def restore(self, room):
+        with self.lock:
+            self._advance()
+            for player_id, token in room.sessions.items():
+                self._add(token, room.match_id, player_id)
+
+    # (match_id, player_id) pemilik token, atau None jika tidak dikenal/kedaluwarsa
+    def resume(self, token, player_id):
+        with self.lock:
+            self._advance()
+            entry = self.tokens.get(token)
+            if entry is None or entry[1] != player_id:
+                return None
+            self._place(token, entry)
+            return entry[0], entry[1]
+
+    def touch(self, match_id, player_id):
+        with self.lock:
+            self._advance()
+            token = self.seats.get((match_id, player_id))
+            if token is not None:
+                self._place(token, self.tokens[token])
+
+
+# Session untuk registry shared memory (mode proses). Worker tidak berbagi
+# dict, jadi secret token dan waktu terakhir dipakai disimpan di slot room.
+# Token memuat match_id sehingga resume cukup membuka slot room-nya (O(1));
+# kedaluwarsa dicek dari waktu terakhir dipakai dan slot ikut dikosongkan
+# saat room di-reset atau dipakai match baru.
+class SharedSessionStore:
+    def __init__(self, registry, ttl=SESSION_TTL):
+        self.registry = registry
+        self.ttl = ttl
+
+    def issue(self, room, player_id):
+        secret = secrets.randbits(64) or 1
+        room.set_session(player_id, secret)
+        return f"{room.match_id}-{player_id}-{secret:016x}"
+
+    def resume(self, token, player_id):
+        try:
+            match_id, token_player, secret = token.split('-')
+            secret = int(secret, 16)
+        except (AttributeError, ValueError):
+            return None
+        if token_player != player_id or player_id not in PLAYER_IDS:
+            return None
+        room = self.registry.get_room(match_id)
+        if room is None or not room.resume_session(player_id, secret, self.ttl):
+            return None
+        return room.match_id, player_id
+
+    def touch(self, match_id, player_id):
+        room = self.registry.get_room(match_id)
+        if room is not None:
+            room.touch_session(player_id)
@@ -1,12 +1,11 @@
 import pygame
 import sys
 
+from game_config import GRID_SIZE, TREASURE_SIZE, STARTING_HP as TREASURE_HP
+
 # --- Configuration ---
-GRID_SIZE = 7
 CELL_SIZE = 35
 MARGIN = 2
-TREASURE_SIZE = 2
-TREASURE_HP = 3
 
 # Colors
 COLOR_BG = (30, 30, 30)
@@ -0,0 +1,280 @@
+import os
+import json
+import base64
+import socket
+import struct
+import hashlib
+import logging
+import threading
+from urllib.parse import urlencode
+
+# WebSocket (RFC 6455) minimal tanpa library tambahan. Klien membuka
+# GET /ws?player_id=..&match_id=.. dengan header Upgrade; setelah itu satu
+# socket full-duplex dipakai untuk aksi (klien -> server) dan push state
+# (server -> klien) setiap kali version room berubah.
+#
+# Pesan server -> klien (teks JSON):
+#   state/delta -> body yang sama persis dengan GET /state (?since=N)
+#   {"result": {...}} -> hasil pesan aksi klien
+# Pesan klien -> server:
+#   {"type": "place", "coords": [y, x]}
+#   {"type": "action", "action": "dig"|"move", "coords": [y, x], "treasure": 0}
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+MAX_MESSAGE_SIZE = 1024 * 1024
+PUSH_WAIT = 5.0       # detik pusher menunggu perubahan sebelum mengecek koneksi lagi
+IDLE_TIMEOUT = 300    # detik koneksi WebSocket boleh diam tanpa pesan/ping dari klien
+PING_INTERVAL = IDLE_TIMEOUT / 4 # detik antar ping WebSocketClient
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+class WebSocketError(Exception):
+    pass
+
+
+def accept_key(key):
+    digest = hashlib.sha1((key + WS_GUID).encode('latin-1')).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+def handshake_response(key):
+    return (
+        "HTTP/1.1 101 Switching Protocols\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Accept: {accept_key(key)}\r\n"
+        "\r\n"
+    ).encode('latin-1')
+
+
+# Frame dari server tidak di-mask; frame dari klien wajib di-mask
+def encode_frame(payload, opcode=OP_TEXT, mask=False):
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    length = len(payload)
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, mask_bit | length)
+    elif length < 1 << 16:
+        header = struct.pack('!BBH', 0x80 | opcode, mask_bit | 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, mask_bit | 127, length)
+    if not mask:
+        return header + payload
+    key = os.urandom(4)
+    return header + key + apply_mask(payload, key)
+
+
+def apply_mask(payload, key):
+    # XOR 4 byte berulang, dikerjakan sebagai satu operasi integer besar
+    n = len(payload)
+    repeated = (key * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, 'little') ^ int.from_bytes(repeated, 'little')).to_bytes(n, 'little')
+
+
+# Parser frame inkremental (pola yang sama dengan http_parser.RequestParser).
+# Pesan yang terfragmentasi digabung; next_message mengembalikan
+# (opcode, payload) untuk pesan utuh atau frame kontrol.
+class FrameParser:
+    def __init__(self):
+        self.buffer = bytearray()
+        self.fragments = None # (opcode, [payload]) pesan yang belum FIN
+
+    def feed(self, data):
+        self.buffer += data
+
+    def _next_frame(self):
+        buf = self.buffer
+        if len(buf) < 2:
+            return None
+        fin, opcode = buf[0] & 0x80, buf[0] & 0x0F
+        masked, length = buf[1] & 0x80, buf[1] & 0x7F
+        offset = 2
+        if length == 126:
+            if len(buf) < 4:
+                return None
+            length = struct.unpack_from('!H', buf, 2)[0]
+            offset = 4
+        elif length == 127:
+            if len(buf) < 10:
+                return None
+            length = struct.unpack_from('!Q', buf, 2)[0]
+            offset = 10
+        if length > MAX_MESSAGE_SIZE:
+            raise WebSocketError('Pesan terlalu besar')
+        key = None
+        if masked:
+            if len(buf) < offset + 4:
+                return None
+            key = bytes(buf[offset:offset + 4])
+            offset += 4
+        if len(buf) < offset + length:
+            return None
+        payload = bytes(buf[offset:offset + length])
+        del buf[:offset + length]
+        if key:
+            payload = apply_mask(payload, key)
+        return fin, opcode, payload
+
+    def next_message(self):
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                return None
+            fin, opcode, payload = frame
+            if opcode >= OP_CLOSE: # frame kontrol boleh muncul di tengah fragmen
+                return opcode, payload
+            if opcode == OP_CONTINUATION:
+                if self.fragments is None:
+                    raise WebSocketError('Continuation tanpa frame awal')
+                self.fragments[1].append(payload)
+            else:
+                self.fragments = (opcode, [payload])
+            if sum(len(p) for p in self.fragments[1]) > MAX_MESSAGE_SIZE:
+                raise WebSocketError('Pesan terlalu besar')
+            if fin:
+                opcode, parts = self.fragments
+                self.fragments = None
+                return opcode, b''.join(parts)
+
+
+# Sesi satu pemain di atas socket blocking (engine thread dan proses).
+# Thread koneksi membaca pesan klien; thread pusher menunggu perubahan
+# version room lalu mengirim delta. Pengiriman dari kedua thread
+# diserialisasi dengan send_lock.
+class WebSocketSession:
+    def __init__(self, connection, httpserver, room, player_id, buffered=b''):
+        self.connection = connection
+        self.httpserver = httpserver
+        self.room = room
+        self.player_id = player_id
+        self.parser = FrameParser()
+        self.parser.feed(buffered)
+        self.send_lock = threading.Lock()
+        self.open = True
+
+    def send(self, payload, opcode=OP_TEXT):
+        with self.send_lock:
+            self.connection.sendall(encode_frame(payload, opcode))
+
+    def push_changes(self, version):
+        while self.open:
+            if not self.room.wait_for_change(version, PUSH_WAIT):
+                continue
+            version, body = self.httpserver.encode_delta(self.room, self.player_id, version)
+            try:
+                self.send(body)
+            except OSError:
+                break
+
+    def run(self, request, recv_size):
+        self.connection.sendall(handshake_response(request.headers['sec-websocket-key']))
+        self.connection.settimeout(IDLE_TIMEOUT)
+        # Frame push kecil; jangan ditahan Nagle menunggu ACK
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        version, body = self.room.get_encoded_state(self.player_id)
+        self.send(body)
+        pusher = threading.Thread(target=self.push_changes, args=(version,), daemon=True)
+        pusher.start()
+        try:
+            while True:
+                message = self.parser.next_message()
+                if message is None:
+                    data = self.connection.recv(recv_size)
+                    if not data:
+                        break
+                    self.parser.feed(data)
+                    continue
+                opcode, payload = message
+                if opcode == OP_CLOSE:
+                    self.send(payload[:2], OP_CLOSE)
+                    break
+                if opcode == OP_PING:
+                    self.send(payload, OP_PONG)
+                elif opcode == OP_TEXT:
+                    result = self.httpserver.websocket_message(self.room, self.player_id, payload)
+                    self.send(json.dumps({'result': result}))
+        except WebSocketError as e:
+            logging.warning(f"WebSocket {self.player_id}@{self.room.match_id} ditutup: {e}")
+        finally:
+            self.open = False
+
+
+# Klien WebSocket sinkron untuk client_pygame (tanpa dependensi tambahan)
+class WebSocketClient:
+    def __init__(self, host, port, player_id, match_id, timeout=None, ping_interval=PING_INTERVAL):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.parser = FrameParser()
+        self.send_lock = threading.Lock()
+        key = base64.b64encode(os.urandom(16)).decode('ascii')
+        query = urlencode({'player_id': player_id, 'match_id': match_id})
+        self.sock.sendall((
+            f"GET /ws?{query} HTTP/1.1\r\n"
+            f"Host: {host}:{port}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n"
+            "\r\n"
+        ).encode('latin-1'))
+
+        head = b''
+        while b'\r\n\r\n' not in head:
+            data = self.sock.recv(4096)
+            if not data:
+                raise WebSocketError('Handshake gagal')
+            head += data
+        head, _, rest = head.partition(b'\r\n\r\n')
+        if not head.startswith(b'HTTP/1.1 101') or accept_key(key).encode('ascii') not in head:
+            raise WebSocketError('Server menolak upgrade WebSocket')
+        self.parser.feed(rest)
+        self.closed = threading.Event()
+        threading.Thread(target=self._ping_loop, args=(ping_interval,), daemon=True).start()
+
+    # Pemain yang menunggu lawan atau gilirannya hanya menerima push tanpa
+    # mengirim apa pun; ping berkala menjaga sesi dari IDLE_TIMEOUT server
+    def _ping_loop(self, interval):
+        while not self.closed.wait(interval):
+            try:
+                with self.send_lock:
+                    self.sock.sendall(encode_frame(b'', OP_PING, mask=True))
+            except OSError:
+                return
+
+    def send_json(self, data):
+        with self.send_lock:
+            self.sock.sendall(encode_frame(json.dumps(data), OP_TEXT, mask=True))
+
+    # Pesan JSON berikutnya dari server (ping dijawab otomatis)
+    def recv_json(self):
+        while True:
+            message = self.parser.next_message()
+            if message is None:
+                data = self.sock.recv(65536)
+                if not data:
+                    raise ConnectionError('Koneksi WebSocket ditutup server')
+                self.parser.feed(data)
+                continue
+            opcode, payload = message
+            if opcode == OP_TEXT:
+                return json.loads(payload)
+            if opcode == OP_PING:
+                with self.send_lock:
+                    self.sock.sendall(encode_frame(payload, OP_PONG, mask=True))
+            elif opcode == OP_CLOSE:
+                raise ConnectionError('Koneksi WebSocket ditutup server')
+
+    def close(self):
+        self.closed.set()
+        try:
+            with self.send_lock:
+                self.sock.sendall(encode_frame(b'\x03\xe8', OP_CLOSE, mask=True))
+        except OSError:
+            pass
+        self.sock.close()